@@ -0,0 +1,308 @@
+import asyncio
+import json
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from config import (
+    OPENAI_API_KEY, OPENAI_API_BASE,
+    LLM_MAX_IN_FLIGHT, LLM_REQUEST_TIMEOUT, LLM_CALLBACK_WORKERS
+)
+from llm_cache import make_cache_key
+from logging_setup import log_context
+from metrics import LLM_SECONDS, LLM_ERRORS
+from prompt_budget import USAGE
+from openai_client_wrapper import (
+    LLM_CACHE, LLM_ROUTER, LLMError, LLMTimeoutError, LLMUpstreamError, end_user_request
+)
+
+
+class _Job:
+    __slots__ = ('user_id', 'prompt', 'on_done', 'on_error', 'on_delta', 'route', 'handler', 'key', 'streamed')
+
+    def __init__(self, user_id, prompt, on_done, on_error, on_delta, route, handler):
+        self.user_id = user_id
+        self.prompt = prompt
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_delta = on_delta
+        self.route = route
+        self.handler = handler
+        self.key = make_cache_key(route.model, prompt, route.temperature)
+        self.streamed = False
+
+
+class _Shared:
+    # One API call and everyone waiting on it; `text` is the streamed answer
+    # so far, replayed to followers that join mid-stream.
+    __slots__ = ('future', 'followers', 'text')
+
+    def __init__(self, future):
+        self.future = future
+        self.followers = []
+        self.text = ""
+
+
+def _llm_error(e):
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, asyncio.TimeoutError):
+        return LLMTimeoutError(repr(e))
+    if isinstance(e, aiohttp.ClientResponseError):
+        return LLMUpstreamError(e.message, e.status)
+    return LLMUpstreamError(repr(e))
+
+
+class AsyncLLMClient:
+    """
+    Chat completions on an asyncio loop running in a background thread.
+
+    Handlers call `submit` and return at once; the completion callback runs on
+    a small thread pool once the answer arrives. A single aiohttp session
+    keeps connections to the API alive, at most `max_in_flight` requests are
+    outstanding, and queued work is taken round-robin across users so one
+    user with many requests cannot hold back everybody else. Identical
+    requests that are in flight at the same time share one API call, and
+    streamed followers see the leader's answer as it arrives.
+    Model, deadline, retries and fallback follow LLM_ROUTER.
+    """
+
+    def __init__(self, api_base, api_key, max_in_flight, timeout, callback_workers):
+        self.api_base = api_base.rstrip('/')
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._callbacks = ThreadPoolExecutor(callback_workers, thread_name_prefix="llm-callback")
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._session = None
+        self._queues = {}
+        self._ready = deque()
+        self._in_flight = 0
+        self._shared = {}
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(self._open_session())
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name="llm-loop", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+
+    async def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+
+    def submit(self, user_id, prompt, on_done, task="default", temperature=None, model=None,
+               handler=None, on_delta=None, on_error=None, max_tokens=None, deadline=None):
+        """
+        Queues a completion for `user_id`; `on_done(response)` is called from
+        a worker thread, or `on_error(error)` with an LLMError if no answer
+        could be produced. If `handler` is given, the matching pending-request
+        marker (see `begin_user_request`) is released after the callback returns.
+
+        With `on_delta`, the answer is streamed and `on_delta(text_so_far)` is
+        called on the event loop as tokens arrive, so it must not block.
+        """
+        route = LLM_ROUTER.route(task, model, temperature, max_tokens, deadline)
+        job = _Job(user_id, prompt, on_done, on_error, on_delta, route, handler)
+        if LLM_CACHE:
+            cached = LLM_CACHE.get(task, job.key)
+            if cached is not None:
+                self._callbacks.submit(self._finish, job, cached)
+                return
+        self._ensure_started()
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+
+    def pending(self):
+        """
+        Number of queued (not yet started) and in-flight requests.
+        """
+        return sum(len(q) for q in list(self._queues.values())), self._in_flight
+
+    def _enqueue(self, job):
+        queue = self._queues.get(job.user_id)
+        if queue is None:
+            queue = self._queues[job.user_id] = deque()
+            self._ready.append(job.user_id)
+        queue.append(job)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._ready and self._in_flight < self.max_in_flight:
+            user_id = self._ready.popleft()
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if queue:
+                self._ready.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._in_flight += 1
+            self._loop.create_task(self._run(job))
+
+    async def _run(self, job):
+        try:
+            content = await self._complete_shared(job)
+        except Exception as e:
+            # Anything else is a bug, but the user still needs an answer and
+            # their pending-request marker released.
+            if not isinstance(e, LLMError):
+                logging.exception(f"LLM {job.route.task} request for user {job.user_id} failed unexpectedly")
+            self._callbacks.submit(self._fail, job, _llm_error(e))
+            return
+        finally:
+            self._in_flight -= 1
+            self._dispatch()
+        self._callbacks.submit(self._finish, job, content)
+
+    async def _complete_shared(self, job):
+        shared = self._shared.get(job.key)
+        if shared is not None:
+            if job.on_delta is not None:
+                shared.followers.append(job)
+                if shared.text:
+                    self._feed(job, shared.text)
+            return await asyncio.shield(shared.future)
+        shared = self._shared[job.key] = _Shared(self._loop.create_future())
+        try:
+            content = await self._complete(job)
+            shared.future.set_result(content)
+            return content
+        except Exception as e:
+            shared.future.set_exception(e)
+            shared.future.exception()  # followers re-raise it; nobody else has to
+            raise
+        finally:
+            del self._shared[job.key]
+
+    async def _complete(self, job):
+        """
+        Tries the request as LLM_ROUTER decides, on the event loop: retries
+        sleep without blocking it.
+        A stream that has already shown text is not retried.
+        """
+        route = job.route
+        deadline = time.monotonic() + route.deadline
+        attempt = 0
+        while True:
+            model = LLM_ROUTER.choose(route, attempt)
+            start = time.perf_counter()
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"Deadline of {route.deadline}s for {route.task} exceeded")
+                content = await self._request(job, model, remaining)
+            except Exception as e:
+                error = _llm_error(e)
+                LLM_SECONDS.observe(time.perf_counter() - start, route.task, model, "error")
+                LLM_ERRORS.inc(route.task, type(error).__name__)
+                logging.error(f"Error calling OpenAI ({model}): {error!r}")
+                LLM_ROUTER.record(model, error)
+                delay = LLM_ROUTER.retry_delay(route, attempt, error, deadline, partial=job.streamed)
+                if delay is None:
+                    raise error from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            LLM_SECONDS.observe(time.perf_counter() - start, route.task, model, "ok")
+            LLM_ROUTER.record(model)
+            # Fallback answers are not cached in place of the task's model's.
+            if LLM_CACHE and model == route.model:
+                LLM_CACHE.put(route.task, job.key, content)
+            return content
+
+    async def _request(self, job, model, timeout):
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": job.prompt}],
+            "temperature": job.route.temperature,
+            "max_tokens": job.route.max_tokens
+        }
+        if job.on_delta is not None:
+            payload["stream"] = True
+        async with self._session.post(f"{self.api_base}/chat/completions", json=payload,
+                                      timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            usage = None
+            if job.on_delta is not None:
+                content = await self._read_stream(response, job)
+            else:
+                data = await response.json()
+                content = data["choices"][0]["message"]["content"]
+                usage = data.get("usage")
+        USAGE.record_response(job.route.task, model, job.prompt, content, usage)
+        return content.strip()
+
+    async def _read_stream(self, response, job):
+        text = ""
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                text += delta
+                job.streamed = True
+                self._feed(job, text)
+                shared = self._shared.get(job.key)
+                if shared is not None:
+                    shared.text = text
+                    for follower in shared.followers:
+                        self._feed(follower, text)
+        return text
+
+    @staticmethod
+    def _feed(job, text):
+        try:
+            job.on_delta(text)
+        except Exception:
+            logging.exception("LLM stream callback failed")
+
+    def _finish(self, job, content):
+        try:
+            with log_context(job.user_id, job.handler or job.route.task):
+                job.on_done(content)
+        except Exception:
+            logging.exception(f"LLM callback for {job.route.task} (user {job.user_id}) failed")
+        finally:
+            if job.handler:
+                end_user_request(job.user_id, job.handler)
+
+    def _fail(self, job, error):
+        try:
+            if job.on_error is None:
+                logging.error(f"LLM {job.route.task} request for user {job.user_id} failed: {error!r}")
+            else:
+                with log_context(job.user_id, job.handler or job.route.task):
+                    job.on_error(error)
+        except Exception:
+            logging.exception(f"LLM error callback for {job.route.task} (user {job.user_id}) failed")
+        finally:
+            if job.handler:
+                end_user_request(job.user_id, job.handler)
+
+
+LLM_CLIENT = AsyncLLMClient(OPENAI_API_BASE, OPENAI_API_KEY, LLM_MAX_IN_FLIGHT,
+                            LLM_REQUEST_TIMEOUT, LLM_CALLBACK_WORKERS)
@@ -0,0 +1,72 @@
+"""
+Drives the async LLM client against the local fake OpenAI server.
+
+Checks that submit() returns immediately, that no more than
+LLM_MAX_IN_FLIGHT requests reach the server at once, and that a user who
+queues many requests does not delay the others.
+
+    python benchmarks/bench_async_llm.py --users 50 --requests-per-user 4 --latency 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests-per-user", type=int, default=4)
+    parser.add_argument("--heavy-user-requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="lingoml-async-"))
+    from fake_openai import start_fake_openai
+    from async_llm_client import AsyncLLMClient
+
+    server = start_fake_openai(args.latency)
+    client = AsyncLLMClient(server.base_url, "test-key", args.max_in_flight, timeout=30, callback_workers=4)
+
+    total = args.users * args.requests_per_user + args.heavy_user_requests
+    done = threading.Event()
+    finished = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def on_done(user_id, response):
+        with lock:
+            finished.setdefault(user_id, []).append(time.perf_counter() - started)
+            if sum(len(v) for v in finished.values()) == total:
+                done.set()
+
+    submit_started = time.perf_counter()
+    # User 0 floods the queue first; everybody else arrives right after.
+    for i in range(args.heavy_user_requests):
+        client.submit(0, f"heavy prompt {i}", lambda r: on_done(0, r), task="bench")
+    for user_id in range(1, args.users + 1):
+        for i in range(args.requests_per_user):
+            client.submit(user_id, f"prompt {user_id}-{i}", lambda r, u=user_id: on_done(u, r), task="bench")
+    submit_time = time.perf_counter() - submit_started
+    done.wait(timeout=600)
+    elapsed = time.perf_counter() - started
+
+    light_done = [max(v) for u, v in finished.items() if u != 0]
+    print(f"requests: {total}, submit() total: {submit_time * 1000:.1f} ms")
+    print(f"elapsed: {elapsed:.2f}s, throughput: {total / elapsed:.1f} req/s")
+    print(f"server max concurrent: {server.max_in_flight} (limit {args.max_in_flight})")
+    print(f"light users finished by: {max(light_done):.2f}s, heavy user finished at: {max(finished[0]):.2f}s")
+    ok = server.max_in_flight <= args.max_in_flight and max(light_done) < max(finished[0])
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
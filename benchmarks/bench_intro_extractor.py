@@ -0,0 +1,86 @@
+"""
+How many introductions the local extractor resolves without the LLM, and
+how often it is wrong when it does, on a labeled corpus in the five
+interface languages.
+
+    python benchmarks/bench_intro_extractor.py [--threshold 0.8] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import INTRO_LOCAL_CONFIDENCE
+from intro_extractor import extract_introduction
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intro_corpus.jsonl")
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def is_correct(sample, result):
+    if sample["age"] is None:
+        # Nothing usable in the text: resolving it locally at all is wrong.
+        return False
+    return result.age == sample["age"] and (result.name or "").lower() == sample["name"].lower()
+
+
+def evaluate(samples, threshold):
+    stats = defaultdict(lambda: {"samples": 0, "resolved": 0, "correct": 0})
+    wrong = []
+    for sample in samples:
+        result = extract_introduction(sample["text"])
+        for key in (sample["language"], "all"):
+            stats[key]["samples"] += 1
+        if result.confidence < threshold:
+            continue
+        correct = is_correct(sample, result)
+        for key in (sample["language"], "all"):
+            stats[key]["resolved"] += 1
+            stats[key]["correct"] += correct
+        if not correct:
+            wrong.append({"text": sample["text"], "expected": [sample["name"], sample["age"]],
+                          "got": [result.name, result.age], "confidence": result.confidence})
+    report = {}
+    for key, counts in stats.items():
+        report[key] = dict(counts,
+                           resolved_locally=round(counts["resolved"] / counts["samples"], 3),
+                           precision=round(counts["correct"] / counts["resolved"], 3) if counts["resolved"] else None)
+    return report, wrong
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=INTRO_LOCAL_CONFIDENCE)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    samples = load_corpus()
+    report, wrong = evaluate(samples, args.threshold)
+    texts = [sample["text"] for sample in samples]
+    per_call = timeit.timeit(lambda: [extract_introduction(text) for text in texts], number=50) / (50 * len(texts))
+
+    if args.json:
+        print(json.dumps({"threshold": args.threshold, "languages": report, "wrong": wrong,
+                          "us_per_call": round(per_call * 1e6, 1)}, ensure_ascii=False, indent=2))
+        return
+    print(f"threshold {args.threshold}, {len(samples)} samples, {per_call * 1e6:.1f} us per call")
+    for key in sorted(report, key=lambda k: (k == "all", k)):
+        row = report[key]
+        precision = "-" if row["precision"] is None else f"{row['precision']:.0%}"
+        print(f"{key:>4}: resolved locally {row['resolved']:>3}/{row['samples']:<3} "
+              f"({row['resolved_locally']:.0%}), precision {precision}")
+    for entry in wrong:
+        print(f"  wrong: {entry['text']!r} -> {entry['got']} (expected {entry['expected']}, "
+              f"confidence {entry['confidence']})")
+
+
+if __name__ == "__main__":
+    main()
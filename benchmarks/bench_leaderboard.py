@@ -0,0 +1,62 @@
+"""
+Score updates and leaderboard queries: the ScoreLedger (append-only ledger
+plus RankedSkipList) versus sorting every user's score per query.
+
+    python benchmarks/bench_leaderboard.py --users 100000 --updates 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="lingoml-leaderboard-"))
+
+from score_ledger import ScoreLedger
+from storage import create_storage
+from user_store import UserStore
+
+
+def per_call_us(fn, calls):
+    started = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    store = UserStore(create_storage("csv"), flush_interval=0)
+    for user_id in range(1, args.users + 1):
+        store.update(user_id, name=f"User{user_id}", score=rng.randrange(1000))
+    store.flush()
+    ledger = ScoreLedger(store, 'score_ledger.csv', compact_every=10 ** 9)
+
+    started = time.perf_counter()
+    ledger.top(1)
+    load = time.perf_counter() - started
+    user_ids = [rng.randrange(1, args.users + 1) for _ in range(max(args.updates, args.queries))]
+
+    def sorted_rank(i):
+        users = store.all()
+        ranked = sorted(users, key=lambda user_id: -users[user_id]['score'])
+        return ranked.index(user_ids[i])
+
+    print(f"users: {args.users}, ledger load: {load * 1000:.1f} ms")
+    print(f"add points:       {per_call_us(lambda i: ledger.add(user_ids[i], 5), args.updates):10.1f} µs/call "
+          f"(includes the fsync'd ledger append)")
+    print(f"rank of user:     {per_call_us(lambda i: ledger.rank(user_ids[i]), args.queries):10.1f} µs/call")
+    print(f"top 10:           {per_call_us(lambda i: ledger.top(10), args.queries):10.1f} µs/call")
+    print(f"sort-based rank:  {per_call_us(sorted_rank, min(args.queries, 20)):10.1f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
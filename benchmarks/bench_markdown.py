@@ -0,0 +1,60 @@
+"""
+MarkdownV2 escaping: the previous regex-per-call escape_markdown_v2 versus
+the translate-table renderer, plus the cost of splitting long answers into
+messages.
+
+    python benchmarks/bench_markdown.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_v2 import Markup, bold, chunks, escape, render
+
+
+def old_escape_markdown_v2(text):
+    """
+    The previous implementation, kept for comparison.
+    """
+    import re
+    if not text:
+        return ""
+    escape_chars = r'_*[\]()~`>#+-=|{}.!'
+    return re.sub(r'([{}])'.format(re.escape(escape_chars)), r'\\\1', text)
+
+
+SAMPLE = (
+    "📊 Your text is mostly clear! ✅ A few points to improve:\n\n"
+    "1. \"I have visited\" -> \"I visited\" (past simple for a finished time).\n"
+    "2. \"We was\" -> \"We were\" — subject-verb agreement!\n"
+    "3. Try linking words: however, moreover, as a result.\n\n"
+    "Overall: good vocabulary (B1+), some grammar slips. Keep practising #english :-)\n\n"
+)
+
+
+def main():
+    number = 2000
+    for size in (100, 1000, 4000):
+        text = (SAMPLE * (size // len(SAMPLE) + 1))[:size]
+        assert old_escape_markdown_v2(text) == escape(text)
+        t_old = timeit.timeit(lambda: old_escape_markdown_v2(text), number=number) / number
+        t_new = timeit.timeit(lambda: escape(text), number=number) / number
+        print(f"escape {size:>5} chars: old {t_old * 1e6:8.1f} us  new {t_new * 1e6:8.1f} us  "
+              f"({t_old / t_new:.1f}x)")
+
+    text = SAMPLE * 200
+    parts = (Markup("✅ *Topics:*\n\n"), text, Markup("\n\n"), bold("B1"))
+    messages = list(chunks(*parts))
+    assert all(len(message) <= 4096 for message in messages)
+    t_render = timeit.timeit(lambda: render(*parts), number=200) / 200
+    t_chunks = timeit.timeit(lambda: list(chunks(*parts)), number=200) / 200
+    t_first = timeit.timeit(lambda: next(chunks(*parts)), number=200) / 200
+    print(f"{len(text)} chars: render {t_render * 1e3:.2f} ms, all {len(messages)} messages "
+          f"{t_chunks * 1e3:.2f} ms, first message only {t_first * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Bot API round trips and handler wall-clock time for a typical burst of
+replies (chat action, two texts, a text with a keyboard), sent directly
+versus through the Outbox, against a fake bot with fixed API latency.
+
+    python benchmarks/bench_outbox.py --users 200 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="lingoml-outbox-"))
+
+from broadcast import TokenBucket
+from outbox import Outbox
+
+
+class FakeBot:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            return SimpleNamespace(message_id=self.calls)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._call()
+
+    def edit_message_text(self, text, **kwargs):
+        return self._call()
+
+    def send_chat_action(self, chat_id, action):
+        return self._call()
+
+
+def replies(api, chat_id):
+    api.chat_action(chat_id)
+    api.send(chat_id, "✅ Your introduction has been recorded\\.")
+    api.send(chat_id, "👤 Name: Aigerim")
+    api.send(chat_id, "Please proceed when you are ready:", reply_markup=object())
+
+
+class Direct:
+    def __init__(self, bot):
+        self.bot = bot
+
+    def chat_action(self, chat_id, action="typing"):
+        self.bot.send_chat_action(chat_id, action)
+
+    def send(self, chat_id, text, reply_markup=None):
+        self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+
+
+def run(name, api, bot, users, handler_threads, wait):
+    started = time.perf_counter()
+    handler_time = []
+
+    def handle(chat_id):
+        t = time.perf_counter()
+        replies(api, chat_id)
+        handler_time.append(time.perf_counter() - t)
+
+    with ThreadPoolExecutor(handler_threads) as pool:
+        list(pool.map(handle, range(users)))
+    wait()
+    elapsed = time.perf_counter() - started
+    handler_time.sort()
+    print(f"{name:>7}: {bot.calls:5d} API calls, all delivered in {elapsed:6.2f}s, "
+          f"handler p50 {handler_time[len(handler_time) // 2] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    bot = FakeBot(args.latency)
+    run("direct", Direct(bot), bot, args.users, args.threads, lambda: None)
+
+    bot = FakeBot(args.latency)
+    outbox = Outbox(bot, workers=args.threads, limiter=TokenBucket(10000))
+    run("outbox", outbox, bot, args.users, args.threads, outbox.flush)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Per-update dispatch cost of the table router versus a chain of
+telebot-style predicates, as states, languages and buttons are added.
+
+    python benchmarks/bench_router.py
+"""
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import Router
+
+
+def build(states, languages, buttons):
+    router = Router()
+    chain = []
+    user_states = {}
+
+    def handler(message):
+        return None
+
+    for s in range(states):
+        state = f"STATE_{s}"
+        router.state(state)(handler)
+        chain.append((lambda m, state=state: user_states.get(m.from_user.id) == state, handler))
+    for b in range(buttons):
+        labels = [f"button {b} in language {lang}" for lang in range(languages)]
+        router.button(*labels)(handler)
+        chain.append((lambda m, labels=labels: m.text in labels, handler))
+
+    def dispatch_chain(message):
+        for predicate, fn in chain:
+            if predicate(message):
+                return fn(message)
+        return None
+
+    return router, dispatch_chain, user_states
+
+
+def main():
+    number = 20000
+    print(f"{'states':>6} {'langs':>5} {'buttons':>7} {'router ns':>10} {'chain ns':>10}")
+    for states, languages, buttons in [(5, 5, 5), (20, 5, 20), (50, 10, 50), (200, 10, 200)]:
+        router, dispatch_chain, user_states = build(states, languages, buttons)
+        user_states[1] = f"STATE_{states - 1}"
+        # Worst case for the chain: a free-text message in the last state.
+        message = SimpleNamespace(text="hello", from_user=SimpleNamespace(id=1))
+        state = user_states[1]
+        t_router = timeit.timeit(lambda: router.dispatch_message(message, state), number=number)
+        t_chain = timeit.timeit(lambda: dispatch_chain(message), number=number)
+        print(f"{states:>6} {languages:>5} {buttons:>7} {t_router / number * 1e9:>10.0f} {t_chain / number * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Memory held by per-user conversation state: six module-level dicts (the
+old layout) versus the slotted SessionStore, and how the store stays
+bounded under churn.
+
+    python benchmarks/bench_sessions.py --users 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="lingoml-sessions-"))
+
+from session_store import SessionStore
+
+PARAGRAPH = "I have been learning English for three years and I like reading books about travel."
+
+
+def measure(build):
+    # Timed without tracemalloc, which slows every allocation down.
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    kept = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, size, elapsed
+
+
+def build_dicts(users):
+    states, paragraphs = {}, {}
+    lessons, history, responses, essays = {}, {}, {}, {}
+    for user_id in range(users):
+        states[user_id] = "ASSESSMENT"
+        paragraphs[user_id] = PARAGRAPH[:40 + user_id % 40]
+    return states, paragraphs, lessons, history, responses, essays
+
+
+def build_store(users, max_entries):
+    store = SessionStore(max_entries, idle_ttl=3600, snapshot_interval=0)
+    for user_id in range(users):
+        session = store.session(user_id)
+        session.state = "ASSESSMENT"
+        session.paragraph = PARAGRAPH[:40 + user_id % 40]
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    args = parser.parse_args()
+
+    _, dict_bytes, dict_time = measure(lambda: build_dicts(args.users))
+    store, store_bytes, store_time = measure(lambda: build_store(args.users, args.users))
+    print(f"{args.users} users")
+    print(f"  six dicts:    {dict_bytes / 2**20:8.1f} MiB  {dict_time:.2f}s")
+    print(f"  SessionStore: {store_bytes / 2**20:8.1f} MiB  {store_time:.2f}s")
+    print(f"  reported:     {store.memory_footprint()}")
+
+    capped = build_store(args.users * 3, args.users // 10)
+    print(f"  {args.users * 3} users through a {args.users // 10}-session cap: {capped.memory_footprint()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Hammers the storage layer from many threads and checks that nothing is lost.
+
+Every worker adds score points through the score ledger, rewrites plans
+and creates/flips essay topics while a reader thread keeps parsing the
+files on disk. At the end the data is reloaded from scratch and compared
+with what was written.
+
+    python benchmarks/bench_storage_stress.py --threads 16 --ops 2000 --backend csv
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    args = parser.parse_args()
+
+    # config.py resolves data files relative to the working directory.
+    os.chdir(tempfile.mkdtemp(prefix="lingoml-stress-"))
+    from storage import create_storage
+    from score_ledger import ScoreLedger
+    from user_store import UserStore
+    from config import USER_DATA_FILE, PLAN_DATA_FILE
+
+    storage = create_storage(args.backend)
+    store = UserStore(storage, flush_interval=0.01)
+    scores = ScoreLedger(store, "score_ledger.csv", compact_every=100)
+    # The ledger only compacts scores into users that exist.
+    for user_id in range(args.users):
+        store.update(user_id)
+    stop = threading.Event()
+    torn_reads = []
+    essays_created = [0] * args.threads
+
+    def worker(index):
+        rng = random.Random(index)
+        for i in range(args.ops):
+            user_id = rng.randrange(args.users)
+            scores.add(user_id, 1)
+            if i % 10 == 0:
+                storage.write_plan(user_id, f"plan {index}-{i}")
+            if i % 5 == 0:
+                essay = storage.add_essay_topic(user_id, f"topic {index}-{i}", "assigned")
+                storage.update_essay_topic_status(essay['essay_id'], "completed")
+                essays_created[index] += 1
+
+    def reader():
+        # config.py creates the files empty; after the first commit they must
+        # always be complete.
+        committed = set()
+        while not stop.is_set():
+            for path in (USER_DATA_FILE, PLAN_DATA_FILE):
+                if not os.path.exists(path):
+                    continue
+                with open(path, newline='', encoding='utf-8') as file:
+                    content = file.read()
+                if content.startswith("user_id,"):
+                    committed.add(path)
+                    list(csv.DictReader(content.splitlines()))
+                elif content or path in committed:
+                    torn_reads.append(path)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader_thread.join()
+    scores.compact()
+    store.close()
+
+    fresh = create_storage(args.backend)
+    total_score = sum(int(u['score']) for u in fresh.load_users().values())
+    topics = fresh.read_essay_topics()
+    expected_score = args.threads * args.ops
+    expected_essays = sum(essays_created)
+    essay_ids = {t['essay_id'] for t in topics}
+    still_assigned = sum(1 for t in topics if t['status'] != "completed")
+
+    print(f"backend={args.backend} threads={args.threads} ops/thread={args.ops}")
+    print(f"elapsed: {elapsed:.2f}s ({expected_score / elapsed:,.0f} score updates/s)")
+    print(f"score: {total_score}/{expected_score} (lost {expected_score - total_score})")
+    print(f"essay topics: {len(topics)}/{expected_essays}, unique ids: {len(essay_ids)}, unflipped: {still_assigned}")
+    print(f"plans: {len(fresh.read_plans())}")
+    print(f"torn reads: {len(torn_reads)}")
+
+    ok = (total_score == expected_score and len(topics) == expected_essays
+          and len(essay_ids) == expected_essays and not still_assigned and not torn_reads)
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Stand-in for the OpenAI chat completions endpoint, for benchmarks and
+manual testing without an API key.
+
+    python benchmarks/fake_openai.py --port 8900 --latency 1.5
+
+then set OPENAI_API_BASE = "http://127.0.0.1:8900/v1" in config.py.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_completion(prompt):
+    if "extracts the user's name and age" in prompt:
+        return "Aigerim 21"
+    if "English proficiency assessment" in prompt:
+        return "📊 Good text with a few article errors.\n```B2```"
+    if "Return only a JSON array" in prompt:
+        return json.dumps([f"Exercise {time.time_ns()}-{i}: describe your favourite place." for i in range(5)])
+    return "1. Articles\n2. Past tenses\n3. Phrasal verbs"
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        # Requests for these models are answered with a 503.
+        self.failing_models = set()
+        self.requests_served = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        server = self.server
+        if request.get("model") in server.failing_models:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with server._lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if request.get("stream"):
+                self._stream(fake_completion(prompt))
+                return
+            time.sleep(server.latency)
+            body = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": fake_completion(prompt)}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 10}
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+                server.requests_served += 1
+
+
+    def _stream(self, content):
+        # First token after a tenth of the latency, the rest spread evenly.
+        tokens = [word + " " for word in content.split(" ")]
+        latency = self.server.latency
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(latency * 0.1)
+        for token in tokens:
+            chunk = {"object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(latency * 0.9 / len(tokens))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_openai(latency=0.5, host="127.0.0.1", port=0):
+    server = FakeOpenAIServer((host, port), latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(("127.0.0.1", args.port), args.latency)
+    print(f"Fake OpenAI listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,110 @@
+"""
+Stand-in for the Telegram Bot API, for benchmarks and manual testing
+without a bot token. Every method succeeds after a fixed latency; sent and
+edited messages are answered with a plausible Message object.
+
+    python benchmarks/fake_telegram.py --port 8901 --latency 0.05
+
+then point telebot at it before creating the bot:
+
+    telebot.apihelper.API_URL = "http://127.0.0.1:8901/bot{0}/{1}"
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "LingoML", "username": "lingoml_bot"}
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency):
+        super().__init__(address, FakeTelegramHandler)
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = {}
+        self._lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def next_message_id(self, chat_id):
+        with self._lock:
+            message_id = self._message_ids.get(chat_id, 0) + 1
+            self._message_ids[chat_id] = message_id
+            return message_id
+
+    def count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def _params(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+        if body:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body.decode('utf-8')))
+        return url.path.rsplit('/', 1)[-1], params
+
+    def _answer(self):
+        method, params = self._params()
+        server = self.server
+        time.sleep(server.latency)
+        server.count(method)
+        body = json.dumps({"ok": True, "result": self._result(method, params)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            message_id = (int(params["message_id"]) if method == "editMessageText"
+                          else self.server.next_message_id(chat_id))
+            return {"message_id": message_id, "from": BOT_USER, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        return True
+
+
+def start_fake_telegram(latency=0.05, host="127.0.0.1", port=0):
+    server = FakeTelegramServer((host, port), latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    server = FakeTelegramServer(("127.0.0.1", args.port), args.latency)
+    print(f"Fake Bot API listening on {server.api_url}")
+    server.serve_forever()
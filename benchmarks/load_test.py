@@ -0,0 +1,299 @@
+"""
+Load test of the real handlers in bot_main.py, offline.
+
+Telegram and OpenAI are replaced by local stand-ins (fake_telegram.py and
+fake_openai.py) with the given latencies, and storage is seeded with
+--users finished users in a temporary directory. --journeys new users then
+go through /start, language selection, the assessment, Continue Setup, the
+introduction and finish_setup, --concurrency at a time, with every update
+fed through the webhook queue as Telegram would post it. Afterwards every
+user's daily reminder is made due at once and sent by the reminder scheduler.
+
+    python benchmarks/load_test.py --users 1000 10000 100000 --output load.json
+
+The report is JSON: updates/sec, how long a whole journey took, handler
+latency percentiles (overall and per handler), data_manager/storage time per operation for the journey and
+broadcast phases, broadcast throughput and the calls the stand-ins served.
+Several --users sizes run one after another, each in a fresh process.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+LANGUAGES = ("English", "Russian", "Kazakh", "Uzbek", "Kyrgyz")
+PARAGRAPH = ("Last summer I have visited my grandmother in the village and we was cooking "
+             "together every day. It were the best holiday, I want to go again soon. (#{n})")
+INTRODUCTION = "I am Aigerim, {age}"
+SECRET = "load-test-secret"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "LingoML"}
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {'count': len(values), 'p50_ms': round(rank(50) * 1000, 3), 'p95_ms': round(rank(95) * 1000, 3),
+            'p99_ms': round(rank(99) * 1000, 3), 'max_ms': round(values[-1] * 1000, 3)}
+
+
+def storage_delta(before, after):
+    """
+    Storage time per operation between two STORAGE_SECONDS.totals().
+    """
+    report = {}
+    for (operation,), (count, total) in sorted(after.items()):
+        count -= before.get((operation,), (0, 0.0))[0]
+        total -= before.get((operation,), (0, 0.0))[1]
+        if count:
+            report[operation] = {'calls': count, 'total_ms': round(total * 1000, 3),
+                                 'mean_ms': round(total / count * 1000, 4)}
+    return report
+
+
+def seed_users(backend, count):
+    from storage import create_storage
+    users = {
+        user_id: {'user_id': user_id, 'language': LANGUAGES[user_id % len(LANGUAGES)], 'english_level': 'B1',
+                  'name': f"User{user_id}", 'age': str(18 + user_id % 50), 'score': user_id % 100,
+                  'timezone': '', 'notify_hour': ''}
+        for user_id in range(1, count + 1)
+    }
+    create_storage(backend).save_users(users, set(users))
+
+
+class Updates:
+    """
+    Telegram updates for the journeys, with increasing update_ids.
+    """
+
+    def __init__(self):
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _id(self):
+        with self._lock:
+            self._next += 1
+            return self._next
+
+    def message(self, user_id, text):
+        update_id = self._id()
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'}}}
+
+    def callback(self, user_id, data):
+        update_id = self._id()
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'chat_instance': str(user_id), 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+            'message': {'message_id': 1, 'date': int(time.time()), 'text': '…', 'from': BOT_USER,
+                        'chat': {'id': user_id, 'type': 'private'}}}}
+
+
+def run(args):
+    # config.py resolves data files relative to the working directory.
+    os.chdir(tempfile.mkdtemp(prefix="lingoml-load-"))
+    import config
+    config.STORAGE_BACKEND = args.backend
+    seed_users(args.backend, args.users)
+
+    from requests.adapters import HTTPAdapter
+    from telebot import apihelper
+    from fake_openai import start_fake_openai
+    from fake_telegram import start_fake_telegram
+
+    telegram = start_fake_telegram(args.telegram_latency)
+    openai = start_fake_openai(args.openai_latency)
+
+    import bot_main
+    from broadcast import TELEGRAM_LIMITER
+    from async_llm_client import LLM_CLIENT
+    from metrics import STORAGE_SECONDS
+    from scheduler import NotificationScheduler
+    from session_store import SESSIONS
+    from user_store import USER_STORE
+    from webhook import WebhookServer, SECRET_TOKEN_HEADER
+
+    apihelper.API_URL = telegram.api_url
+    apihelper.session.mount("http://", HTTPAdapter(pool_maxsize=max(args.broadcast_workers, 16)))
+    LLM_CLIENT.api_base = openai.base_url
+    LLM_CLIENT.max_in_flight = args.llm_in_flight
+    TELEGRAM_LIMITER.set_rate(args.telegram_rate)
+
+    # Exact per-call handler times, next to the histogram bot_main keeps.
+    handler_times = defaultdict(list)
+    handled = Counter()
+    observe = bot_main.ROUTER.observe
+
+    def timed_observe(handler, update):
+        start = time.perf_counter()
+        try:
+            return observe(handler, update)
+        finally:
+            handler_times[handler.__name__].append(time.perf_counter() - start)
+            handled[update.from_user.id] += 1
+
+    bot_main.ROUTER.observe = timed_observe
+
+    server = WebhookServer(bot_main.bot, port=0, path="/load", secret_token=SECRET, workers=args.workers,
+                           max_pending=args.max_pending)
+    server.start()
+    updates = Updates()
+    posted = [0]
+    journey_times = []
+    posted_lock = threading.Lock()
+
+    def post(update):
+        body = json.dumps(update).encode('utf-8')
+        headers = {SECRET_TOKEN_HEADER: SECRET, 'Content-Length': str(len(body))}
+        while server.accept("/load", headers, io.BytesIO(body)) == 503:
+            time.sleep(0.01)
+        with posted_lock:
+            posted[0] += 1
+
+    def wait_for(check):
+        deadline = time.monotonic() + args.step_timeout
+        while not check():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def user(user_id):
+        return USER_STORE.get(user_id) or {}
+
+    def journey(n):
+        user_id = 10_000_000 + n
+        language = LANGUAGES[n % len(LANGUAGES)]
+        steps = [
+            (updates.message(user_id, "/start"),
+             lambda: SESSIONS.state(user_id) == bot_main.LANGUAGE_SELECTION),
+            (updates.message(user_id, language),
+             lambda: SESSIONS.state(user_id) == bot_main.ASSESSMENT),
+            (updates.message(user_id, PARAGRAPH.format(n=n)),
+             lambda: user(user_id).get('english_level')),
+            (updates.message(user_id, bot_main.CATALOG.text("continue_setup_button", language)),
+             lambda: SESSIONS.state(user_id) == bot_main.INTRODUCTION),
+            (updates.message(user_id, INTRODUCTION.format(age=18 + n % 40)),
+             lambda: SESSIONS.state(user_id) == bot_main.LEARNING_MODE),
+            (updates.callback(user_id, "finish_setup"), None),
+        ]
+        start = time.perf_counter()
+        for step, (update, reached) in enumerate(steps, 1):
+            post(update)
+            if not wait_for(lambda: handled[user_id] >= step and (reached is None or reached())):
+                return step
+        journey_times.append(time.perf_counter() - start)
+        return None
+
+    storage_start = STORAGE_SECONDS.totals()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        stuck = Counter(step for step in pool.map(journey, range(args.journeys)) if step is not None)
+    elapsed = time.perf_counter() - started
+    bot_main.OUTBOX.flush(args.step_timeout)
+    storage_journeys = STORAGE_SECONDS.totals()
+
+    scheduler = NotificationScheduler(bot_main.bot, rate=args.broadcast_rate, workers=args.broadcast_workers)
+    scheduler.start()
+    recipients = USER_STORE.all()
+    broadcast_started = time.perf_counter()
+    for user_id, user_info in recipients.items():
+        scheduler.register(user_id, user_info, due=time.time())
+    deadline = time.monotonic() + args.step_timeout + len(recipients) / args.broadcast_rate
+    while time.monotonic() < deadline:
+        reminders = scheduler.stats()
+        if reminders['sent'] + reminders['failed'] >= len(recipients):
+            break
+        time.sleep(0.01)
+    broadcast_elapsed = time.perf_counter() - broadcast_started
+    broadcast = dict(reminders, recipients=len(recipients), elapsed=round(broadcast_elapsed, 3),
+                     throughput=round(reminders['sent'] / broadcast_elapsed, 2))
+    storage_broadcast = STORAGE_SECONDS.totals()
+    server.stop()
+
+    all_times = [seconds for times in handler_times.values() for seconds in times]
+    return {
+        'users': args.users,
+        'backend': args.backend,
+        'telegram_latency': args.telegram_latency,
+        'openai_latency': args.openai_latency,
+        'journeys': args.journeys,
+        'completed': args.journeys - sum(stuck.values()),
+        'stuck_at_step': dict(stuck),
+        'updates': posted[0],
+        'elapsed': round(elapsed, 3),
+        'updates_per_sec': round(posted[0] / elapsed, 1) if elapsed else 0.0,
+        'journey_latency': percentiles(journey_times),
+        'handler_latency': dict(all=percentiles(all_times),
+                                **{name: percentiles(times) for name, times in sorted(handler_times.items())}),
+        'storage': {'journeys': storage_delta(storage_start, storage_journeys),
+                    'broadcast': storage_delta(storage_journeys, storage_broadcast)},
+        'broadcast': broadcast,
+        'telegram_calls': dict(telegram.calls),
+        'openai_requests': openai.requests_served,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs='+', default=[1000],
+                        help="existing users in storage; several sizes run one after another")
+    parser.add_argument("--journeys", type=int, default=200, help="new users going through onboarding")
+    parser.add_argument("--concurrency", type=int, default=50, help="journeys in progress at once")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, default=8, help="webhook handler threads")
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--llm-in-flight", type=int, default=64)
+    parser.add_argument("--telegram-rate", type=float, default=1000,
+                        help="messages/s over all chats, replies and reminders together")
+    parser.add_argument("--broadcast-rate", type=float, default=1000)
+    parser.add_argument("--broadcast-workers", type=int, default=32)
+    parser.add_argument("--step-timeout", type=float, default=60)
+    parser.add_argument("--output", help="write the JSON report here instead of printing it")
+    args = parser.parse_args()
+
+    if len(args.users) == 1:
+        report = run(argparse.Namespace(**dict(vars(args), users=args.users[0])))
+    else:
+        # The bot keeps its state in module singletons, so each size gets a
+        # fresh interpreter.
+        runs = []
+        for users in args.users:
+            command = [sys.executable, os.path.abspath(__file__), "--users", str(users)]
+            for name, value in vars(args).items():
+                if name not in ("users", "output") and value is not None:
+                    command += [f"--{name.replace('_', '-')}", str(value)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output))
+        report = {'runs': runs}
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
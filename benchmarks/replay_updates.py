@@ -0,0 +1,92 @@
+"""
+Posts recorded Telegram updates to a running webhook server, the way
+Telegram would, and reports how they were answered.
+
+    python benchmarks/replay_updates.py benchmarks/recorded_updates.jsonl \
+        --url http://127.0.0.1:8080/telegram/webhook --secret YOUR_WEBHOOK_SECRET_TOKEN
+
+With --users N the recording is replayed once per fake user (chat and user
+ids are shifted), with --concurrency parallel connections.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import SECRET_TOKEN_HEADER
+
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as file:
+        text = file.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def for_user(update, offset, update_offset):
+    """
+    Copy of `update` as if it came from another user.
+    """
+    text = json.dumps(update)
+    original = update_user_id(update)
+    if original is not None:
+        text = text.replace(f'"id": {original},', f'"id": {original + offset},')
+        text = text.replace(f'"id": {original}}}', f'"id": {original + offset}}}')
+    shifted = json.loads(text)
+    shifted['update_id'] = update['update_id'] + update_offset
+    return shifted
+
+
+def update_user_id(update):
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return None
+
+
+def post(url, secret, update):
+    request = urllib.request.Request(url, data=json.dumps(update).encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json', SECRET_TOKEN_HEADER: secret})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/telegram/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1)
+    args = parser.parse_args()
+
+    recording = load_updates(args.recording)
+    journeys = [[for_user(update, user * 1000003, user * len(recording)) for update in recording]
+                for user in range(args.users)]
+
+    def replay(journey):
+        # Each user's updates are posted in order, like Telegram does per chat.
+        return [post(args.url, args.secret, update) for update in journey]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        statuses = Counter(status for result in pool.map(replay, journeys) for status in result)
+    elapsed = time.perf_counter() - started
+    total = sum(statuses.values())
+    print(json.dumps({'posted': total, 'statuses': dict(statuses), 'elapsed': round(elapsed, 3),
+                      'updates_per_sec': round(total / elapsed, 1) if elapsed else 0.0}))
+
+
+if __name__ == "__main__":
+    main()
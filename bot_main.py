@@ -1,33 +1,39 @@
 import telebot
 import re
 import json
+import threading
+import time
 import logging
 
-from telebot.types import (
-    ReplyKeyboardMarkup,
-    KeyboardButton,
-    ReplyKeyboardRemove,
-    InlineKeyboardMarkup,
-    InlineKeyboardButton
+from config import (
+    BOT_TOKEN, BOT_MODE, LLM_STREAM_RESPONSES, WEBHOOK_URL, WEBHOOK_SECRET_TOKEN, INTRO_LOCAL_CONFIDENCE,
+    METRICS_PORT, ADMIN_USER_IDS, PROFILE_MAX_SECONDS, LEADERBOARD_SIZE, ASSESSMENT_POINTS, LESSON_POINTS,
+    SHARD_WORKERS,
+    TELEGRAM_GLOBAL_RATE, BROADCAST_RATE
 )
-
-from config import BOT_TOKEN
 from data_manager import (
-    read_user_data, write_user_data, update_user_score,
-    get_user_level, get_persistent_keyboard,
-    add_essay_topic, get_user_active_essays, update_essay_topic_status,
-    read_essay_topics, write_essay_topics, write_plan_data
+    get_user, write_user_data, delete_user_data, update_user_score, get_user_score, get_user_rank,
+    get_leaderboard, add_essay_topic, write_plan_data
 )
-from messages import MESSAGES, escape_markdown_v2
-from openai_client_wrapper import call_llm, extract_json
-from scheduler import schedule_notifications
-
-USER_PARAGRAPHS = {}
-USER_STATES = {}
-LESSON_SESSIONS = {}
-LLM_CHAT_HISTORY = {}
-LESSON_RESPONSES = {}
-ESSAY_ASSIGNMENT_STATE = {}
+from markdown_v2 import Markup, bold, chunks, pre
+from localization import CATALOG, LANGUAGES, keyboard
+from openai_client_wrapper import begin_user_request, end_user_request, LLM_CACHE
+from async_llm_client import LLM_CLIENT
+from prompt_budget import build_prompt, USAGE
+from metrics import REGISTRY, PROFILER, MetricsServer, observe_handler
+from logging_setup import setup_logging
+from content_pool import CONTENT_POOL
+from intro_extractor import extract_introduction
+from router import Router
+from scheduler import (
+    schedule_notifications, register_user_notifications, reminder_settings, reminder_stats, parse_timezone
+)
+from session_store import SESSIONS
+from telegram_stream import StreamingMessage
+from broadcast import TELEGRAM_LIMITER
+from outbox import Outbox
+from webhook import UpdateWorkers, WebhookServer
+from sharding import ShardDispatcher, poll_updates
 
 LANGUAGE_SELECTION = "LANGUAGE"
 ASSESSMENT = "ASSESSMENT"
@@ -35,86 +41,141 @@ INTRODUCTION = "INTRODUCTION"
 LEARNING_MODE = "LEARNING_MODE"
 ESSAY_EVALUATION = "ESSAY_EVALUATION"
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode="MarkdownV2")
+# Lesson buttons -> (content pool kind, catalog title). The reminder's essay
+# button still sends "start_vocab".
+LESSON_TASKS = {
+    "generate_new_essay": ("essay", "essay_topic"),
+    "start_vocab": ("essay", "essay_topic"),
+    "start_reading": ("reading", "reading_task"),
+    "start_listening": ("listening", "listening_task"),
+}
+
+MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
 
-@bot.message_handler(commands=['start'])
+bot = telebot.TeleBot(BOT_TOKEN, parse_mode="MarkdownV2")
+OUTBOX = Outbox(bot)
+ROUTER = Router(observe=observe_handler)
+
+REGISTRY.gauge("lingoml_llm_queued", "LLM requests waiting for a connection.", lambda: LLM_CLIENT.pending()[0])
+REGISTRY.gauge("lingoml_llm_in_flight", "LLM requests being answered.", lambda: LLM_CLIENT.pending()[1])
+REGISTRY.gauge("lingoml_outbox_pending", "Telegram calls queued or being sent.", OUTBOX.pending)
+REGISTRY.counter_from("lingoml_outbox_calls_total", "Telegram calls made by the outbox.", lambda: OUTBOX.calls)
+REGISTRY.counter_from("lingoml_outbox_coalesced_total", "Telegram calls folded into another one.",
+                      lambda: OUTBOX.coalesced)
+REGISTRY.gauge("lingoml_log_queued", "Log records waiting to be written.", lambda: setup_logging().stats()['queued'])
+REGISTRY.counter_from("lingoml_log_dropped_total", "Log records dropped, by reason.",
+                      lambda: {("queue_full",): setup_logging().stats()['dropped_full'],
+                               ("rate_limited",): setup_logging().stats()['dropped_rate_limited']}, ("reason",))
+REGISTRY.counter_from("lingoml_reminders_total", "Daily reminders by outcome.",
+                      lambda: {(outcome,): count for outcome, count in reminder_stats().items()}, ("outcome",))
+REGISTRY.gauge("lingoml_sessions", "Conversation sessions held in memory.", lambda: len(SESSIONS))
+REGISTRY.gauge("lingoml_content_pools_below_low_water", "Content pools waiting for a refill.",
+               lambda: CONTENT_POOL.stats()['below_low_water'])
+REGISTRY.counter_from("lingoml_llm_cache_lookups_total", "LLM cache lookups by result.",
+                      lambda: {(result,): LLM_CACHE.stats()[key]
+                               for result, key in (("hit", "hits"), ("miss", "misses"))}
+                      if LLM_CACHE else {}, ("result",))
+REGISTRY.counter_from("lingoml_llm_tokens_total", "LLM tokens by task, model and direction.",
+                      lambda: {(task, model, direction): usage[f"{direction}_tokens"]
+                               for (task, model), usage in USAGE.snapshot().items()
+                               for direction in ("prompt", "completion")},
+                      ("task", "model", "direction"))
+
+@bot.message_handler(func=lambda message: True)
+def dispatch_message(message):
+    ROUTER.dispatch_message(message, SESSIONS.state(message.from_user.id))
+
+@bot.callback_query_handler(func=lambda call: True)
+def dispatch_callback(call):
+    ROUTER.dispatch_callback(call)
+
+@ROUTER.command('start')
 def cmd_start(message):
     user_id = message.from_user.id
-    user_data = read_user_data()
-
-    if user_id in user_data and user_data[user_id].get('name') and user_data[user_id].get('age'):
-        user_language = user_data[user_id].get('language', 'English')
-        messages = {
-            "English": "✅ *You have already completed the setup!* No need to restart. You can continue learning.",
-            "Russian": "✅ *Вы уже завершили настройку!* Вы можете продолжить обучение.",
-            "Kazakh": "✅ *Сіз орнатуды аяқтадыңыз!* Оқуды жалғастыра аласыз.",
-            "Uzbek": "✅ *Siz allaqachon sozlamalarni tugatgansiz!* Davom etishingiz mumkin.",
-            "Kyrgyz": "✅ *Орнотуу бүткөн!* Окууну уланта берсеңиз болот."
-        }
-        bot.send_message(message.chat.id, escape_markdown_v2(messages[user_language]))
-        return
+    user = get_user(user_id)
 
-    USER_STATES[user_id] = LANGUAGE_SELECTION
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    keyboard.add(
-        KeyboardButton("Russian"),
-        KeyboardButton("Kazakh"),
-        KeyboardButton("English"),
-        KeyboardButton("Uzbek"),
-        KeyboardButton("Kyrgyz")
-    )
+    if user.get('name') and user.get('age'):
+        user_language = user.get('language', 'English')
+        OUTBOX.send(message.chat.id, CATALOG.md("already_setup", user_language))
+        return
 
-    bot.send_message(
+    SESSIONS.set_state(user_id, LANGUAGE_SELECTION)
+    OUTBOX.send(
         message.chat.id,
-        escape_markdown_v2(MESSAGES["welcome"]["English"]),
-        reply_markup=keyboard
+        CATALOG.md("welcome"),
+        reply_markup=keyboard("language_selection")
     )
 
-@bot.message_handler(func=lambda message: USER_STATES.get(message.from_user.id) == LANGUAGE_SELECTION)
+@ROUTER.state(LANGUAGE_SELECTION)
 def process_language(message):
     user_id = message.from_user.id
     language_choice = message.text.strip() if message.text else ""
-    allowed_languages = ["English", "Russian", "Kazakh", "Uzbek", "Kyrgyz"]
 
-    if language_choice not in allowed_languages:
-        keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        for lang in allowed_languages:
-            keyboard.add(KeyboardButton(lang))
-
-        bot.send_message(
+    if language_choice not in LANGUAGES:
+        OUTBOX.send(
             message.chat.id,
-            escape_markdown_v2("Invalid selection. Please choose one of the provided languages."),
-            reply_markup=keyboard
+            CATALOG.md("invalid_language"),
+            reply_markup=keyboard("language_selection")
         )
         return
 
     write_user_data(user_id, language=language_choice)
-    bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["send_paragraph"][language_choice]), reply_markup=ReplyKeyboardRemove())
-    USER_STATES[user_id] = ASSESSMENT
+    OUTBOX.send(message.chat.id, CATALOG.md("send_paragraph", language_choice), reply_markup=keyboard("remove"))
+    SESSIONS.set_state(user_id, ASSESSMENT)
 
-@bot.message_handler(func=lambda message: USER_STATES.get(message.from_user.id) == ASSESSMENT)
+@ROUTER.state(ASSESSMENT)
 def process_assessment(message):
     user_id = message.from_user.id
     user_text = message.text
-    USER_PARAGRAPHS[user_id] = user_text
+    SESSIONS.session(user_id).paragraph = user_text
 
-    user_language = read_user_data().get(user_id, {}).get('language', 'English')
-    system_prompt = (
+    user_language = get_user(user_id).get('language', 'English')
+    system_prompt = build_prompt("assessment", (
         "You are an expert in English proficiency assessment. Use emojis. "
         "Analyze errors in the user's text, provide improvement suggestions, "
         "and ensure that only the final English level is enclosed inside triple backticks like this: ```B2```. "
         f"Respond in {user_language}.\n\n"
         "Assess the following text:\n"
-        + user_text
-    )
-
-    bot.send_chat_action(message.chat.id, "typing")
-    msg = bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["assessing"][user_language]))
+        "{text}"
+    ), text=user_text).text
 
+    if not begin_user_request(user_id, "assessment"):
+        return
+    try:
+        OUTBOX.chat_action(message.chat.id, "typing")
+        placeholder = OUTBOX.send(message.chat.id, CATALOG.md("assessing", user_language),
+                                  merge=False)
+        stream = StreamingMessage(OUTBOX, message.chat.id, placeholder,
+                                  prefix=CATALOG.md("assessment_results", user_language),
+                                  transform=hide_level_block)
+        LLM_CLIENT.submit(user_id, system_prompt,
+                          lambda response: finish_assessment(message, stream, user_language, response),
+                          task="assessment", handler="assessment",
+                          on_delta=stream.feed if LLM_STREAM_RESPONSES else None,
+                          on_error=report_llm_error(message.chat.id, user_language, stream))
+    except Exception:
+        end_user_request(user_id, "assessment")
+        raise
+
+def report_llm_error(chat_id, user_language, stream=None):
+    """
+    An `on_error` callback for LLM_CLIENT.submit: tells the user the request
+    failed, in place of the streamed placeholder if there is one.
+    """
+    def on_error(error):
+        logging.error(f"LLM request for chat {chat_id} failed: {error!r}")
+        if stream is not None:
+            stream.finish(CATALOG.md("error", user_language))
+        else:
+            OUTBOX.send(chat_id, CATALOG.md("error", user_language))
+    return on_error
+
+def hide_level_block(text):
+    return re.sub(r'```.*?(```|$)', '', text, flags=re.DOTALL)
+
+def finish_assessment(message, stream, user_language, response):
+    user_id = message.from_user.id
     try:
-        response = call_llm(system_prompt)
-        bot.delete_message(message.chat.id, msg.message_id)
-
         proficiency_level_match = re.search(r'```(.*?)```', response, re.DOTALL)
         proficiency_level = proficiency_level_match.group(1).strip() if proficiency_level_match else "Unknown"
 
@@ -122,236 +183,360 @@ def process_assessment(message):
 
         write_user_data(user_id, english_level=proficiency_level)
 
-        final_message = (
-            f"{escape_markdown_v2(MESSAGES['assessment_results'][user_language])}"
-            f"{escape_markdown_v2(assessment_text_without_level)}\n\n"
-            f"{escape_markdown_v2(MESSAGES['proficiency_level'][user_language])}*{escape_markdown_v2(proficiency_level)}*"
+        stream.finish(
+            CATALOG.md('assessment_results', user_language),
+            assessment_text_without_level,
+            Markup("\n\n"),
+            CATALOG.md('proficiency_level', user_language),
+            bold(proficiency_level)
         )
-        bot.send_message(message.chat.id, final_message)
-
-        keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        retake_test = {
-            "English": "🔄 Retake Test",
-            "Russian": "🔄 Пересдать тест",
-            "Kazakh": "🔄 Тестті қайта тапсыру",
-            "Uzbek": "🔄 Testni qayta topshirish",
-            "Kyrgyz": "🔄 Тестти кайрадан берүү"
-        }.get(user_language, "🔄 Retake Test")
-
-        continue_setup = {
-            "English": "➡️ Continue Setup",
-            "Russian": "➡️ Продолжить настройку",
-            "Kazakh": "➡️ Орнатуды жалғастыру",
-            "Uzbek": "➡️ Sozlamani davom ettirish",
-            "Kyrgyz": "➡️ Орнотууну улантуу"
-        }.get(user_language, "➡️ Continue Setup")
-
-        keyboard.add(KeyboardButton(retake_test), KeyboardButton(continue_setup))
-
-        bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["choose_option"][user_language]), reply_markup=keyboard)
+
+        award_points(user_id, message.chat.id, user_language, ASSESSMENT_POINTS)
+        OUTBOX.send(message.chat.id, CATALOG.md("choose_option", user_language),
+                    reply_markup=keyboard("assessment_options", user_language))
     except Exception as e:
         logging.error(str(e))
-        bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["error"][user_language]))
+        OUTBOX.send(message.chat.id, CATALOG.md("error", user_language))
 
-@bot.message_handler(commands=['cancel'])
+@ROUTER.command('cancel')
 def cmd_cancel(message):
     user_id = message.from_user.id
-    if user_id in USER_STATES:
-        USER_STATES.pop(user_id)
-    bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["cancel"]["English"]), reply_markup=ReplyKeyboardRemove())
-
-@bot.message_handler(
-    func=lambda message: message.text in [
-        "➡️ Continue Setup", "➡️ Продолжить настройку", "➡️ Орнатуды жалғастыру",
-        "➡️ Sozlamani davom ettirish", "➡️ Орнотууну улантуу"
-    ]
-)
+    SESSIONS.set_state(user_id, None)
+    OUTBOX.send(message.chat.id, CATALOG.md("cancel"), reply_markup=keyboard("remove"))
+
+@ROUTER.button(*CATALOG.variants("continue_setup_button"))
 def handle_continue_setup(message):
     user_id = message.from_user.id
-    bot.send_message(message.chat.id, escape_markdown_v2("⏳"))
-    process_continue_setup(user_id, message.chat.id)
-
-@bot.message_handler(
-    func=lambda message: message.text in [
-        "🔄 Retake Test", "🔄 Пересдать тест", "🔄 Тестті қайта тапсыру",
-        "🔄 Testni qayta topshirish", "🔄 Тестти кайрадан берүү"
-    ]
-)
+    if not begin_user_request(user_id, "continue_setup"):
+        return
+    try:
+        OUTBOX.send(message.chat.id, CATALOG.md("please_wait"))
+        process_continue_setup(user_id, message.chat.id)
+    except Exception:
+        end_user_request(user_id, "continue_setup")
+        raise
+
+@ROUTER.button(*CATALOG.variants("retake_test_button"))
 def handle_retake_test(message):
     user_id = message.from_user.id
-    user_language = read_user_data().get(user_id, {}).get('language', 'English')
-    text_msg = {
-        "English": "🔄 *You chose to retake the test.* Please send another paragraph in English.",
-        "Russian": "🔄 *Вы выбрали пересдать тест.* Отправьте другой абзац на английском языке.",
-        "Kazakh": "🔄 *Сіз тестті қайта тапсыруды таңдадыңыз.* Ағылшын тілінде басқа абзац жіберіңіз.",
-        "Uzbek": "🔄 *Siz testni qayta topshirishni tanladingiz.* Ingliz tilida yana bir parcha yuboring.",
-        "Kyrgyz": "🔄 *Сиз тестти кайрадан берүүнү тандадыңыз.* Англис тилинде башка бир абзац жиберип көрүңүз."
-    }.get(user_language, "Please send another paragraph in English.")
-
-    bot.send_message(message.chat.id, escape_markdown_v2(text_msg), reply_markup=ReplyKeyboardRemove())
-    USER_STATES[user_id] = ASSESSMENT
+    user_language = get_user(user_id).get('language', 'English')
+
+    OUTBOX.send(message.chat.id, CATALOG.md("retake_test", user_language), reply_markup=keyboard("remove"))
+    SESSIONS.set_state(user_id, ASSESSMENT)
 
 def process_continue_setup(user_id, chat_id):
-    user_data = read_user_data()
-    user_language = user_data.get(user_id, {}).get('language', 'English')
-    user_paragraph = USER_PARAGRAPHS.get(user_id, "No paragraph provided.")
-    level = user_data.get(user_id, {}).get("english_level", "Unknown")
+    user = get_user(user_id)
+    user_language = user.get('language', 'English')
+    session = SESSIONS.get(user_id)
+    user_paragraph = session.paragraph if session and session.paragraph else "No paragraph provided."
+    level = user.get("english_level", "Unknown")
 
-    topics_prompt = (
+    topics_prompt = build_prompt("topics", (
         "You are an expert in language learning. "
         "Based on the following paragraph provided by the user:\n\n"
-        f"{user_paragraph}\n\n"
+        "{text}\n\n"
         f"{level} is their current English proficiency level. "
         "If the user's English level is A1 or A2, mention that these tasks might be too advanced. "
         "Generate a personalized list of topics the user should learn to improve. "
         f"Respond in {user_language}."
-    )
+    ), text=user_paragraph).text
 
-    loading_msg = bot.send_message(chat_id, escape_markdown_v2("⏳ Generating your personalized list of topics..."))
-    response = call_llm(topics_prompt)
-    bot.edit_message_text(chat_id=chat_id, message_id=loading_msg.message_id,
-                          text=escape_markdown_v2("✅ Personalized topics generated!"))
+    placeholder = OUTBOX.send(chat_id, CATALOG.md("generating_topics"),
+                              merge=False)
+    stream = StreamingMessage(OUTBOX, chat_id, placeholder,
+                              prefix=f"{CATALOG.md('personalized_topics', user_language)}\n\n")
+    LLM_CLIENT.submit(user_id, topics_prompt,
+                      lambda response: finish_continue_setup(user_id, chat_id, stream, user_language, response),
+                      task="topics", handler="continue_setup",
+                      on_delta=stream.feed if LLM_STREAM_RESPONSES else None,
+                      on_error=report_llm_error(chat_id, user_language, stream))
 
-    bot.send_message(chat_id, f"{escape_markdown_v2(MESSAGES['personalized_topics'].get(user_language))}\n\n{escape_markdown_v2(response)}")
+def finish_continue_setup(user_id, chat_id, stream, user_language, response):
+    stream.finish(CATALOG.md('personalized_topics', user_language), Markup("\n\n"), response)
 
     write_plan_data(user_id, response)
 
-    intro_prompts = {
-        "English": "Please introduce yourself briefly (include your name and age).",
-        "Russian": "Пожалуйста, кратко представьтесь (укажите имя и возраст).",
-        "Kazakh": "Өзіңізді қысқаша таныстырыңыз (аты-жөніңізді және жасыңызды көрсетіңіз).",
-        "Uzbek": "O'zingizni qisqacha tanishtiring (ism va yoshni kiriting).",
-        "Kyrgyz": "Кыскача тааныштырып коюңуз (аты-жөнүңүздү жана жашыңызды)."
-    }
-    bot.send_message(chat_id, escape_markdown_v2(intro_prompts.get(user_language, intro_prompts["English"])))
-    USER_STATES[user_id] = INTRODUCTION
-
-@bot.message_handler(func=lambda message: USER_STATES.get(message.from_user.id) == INTRODUCTION)
+    OUTBOX.send(chat_id, CATALOG.md("introduction_prompt", user_language))
+    SESSIONS.set_state(user_id, INTRODUCTION)
+
+@ROUTER.state(INTRODUCTION)
 def process_introduction(message):
     user_id = message.from_user.id
-    user_language = read_user_data().get(user_id, {}).get('language', 'English')
+    user_language = get_user(user_id).get('language', 'English')
     user_intro = message.text
 
     if not user_intro:
-        bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["introduction_error"][user_language]))
+        OUTBOX.send(message.chat.id, CATALOG.md("introduction_error", user_language))
+        return
+
+    local = extract_introduction(user_intro)
+    if local.confidence >= INTRO_LOCAL_CONFIDENCE:
+        record_introduction(message, user_language, local.name, str(local.age))
         return
 
-    extraction_prompt = (
+    extraction_prompt = build_prompt("extraction", (
         "You are an assistant that extracts the user's name and age from this text. "
         "Return them as two strings separated by space: Name Age. "
         "If you cannot find both name and age, return exactly `INVALID_INPUT`."
-    )
+        "\n\n{text}"
+    ), text=user_intro).text
 
-    response = call_llm(extraction_prompt + "\n\n" + user_intro)
+    if not begin_user_request(user_id, "introduction"):
+        return
+    try:
+        LLM_CLIENT.submit(user_id, extraction_prompt,
+                          lambda response: finish_introduction(message, user_language, response),
+                          task="extraction", handler="introduction",
+                          on_error=report_llm_error(message.chat.id, user_language))
+    except Exception:
+        end_user_request(user_id, "introduction")
+        raise
+
+def finish_introduction(message, user_language, response):
     if "INVALID_INPUT" in response:
-        bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["introduction_error"][user_language]))
+        OUTBOX.send(message.chat.id, CATALOG.md("introduction_error", user_language))
         return
 
     parts = response.split()
     if len(parts) >= 2 and parts[1].isdigit():
-        name, age = parts[0], parts[1]
-        write_user_data(user_id, name=name, age=age)
-        confirmation = MESSAGES["introduction_recorded"][user_language].format(name=name, age=age)
-        bot.send_message(message.chat.id, escape_markdown_v2(confirmation))
+        record_introduction(message, user_language, parts[0], parts[1])
     else:
-        bot.send_message(message.chat.id, escape_markdown_v2(MESSAGES["introduction_error"][user_language]))
-        return
-
-    finish_button_text = {
-        "English": "➡️ Finish setup",
-        "Russian": "➡️ Завершить настройку",
-        "Kazakh": "➡️ Орнатуды аяқтау",
-        "Uzbek": "➡️ Sozlamani tugatish",
-        "Kyrgyz": "➡️ Орнотууну бүтүрүү"
-    }.get(user_language, "➡️ Finish setup")
+        OUTBOX.send(message.chat.id, CATALOG.md("introduction_error", user_language))
 
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton(finish_button_text, callback_data="finish_setup"))
-    bot.send_message(message.chat.id, escape_markdown_v2("Please proceed to the learning mode when you are ready:"), reply_markup=markup)
-    USER_STATES[user_id] = LEARNING_MODE
+def record_introduction(message, user_language, name, age):
+    user_id = message.from_user.id
+    write_user_data(user_id, name=name, age=age)
+    OUTBOX.send(message.chat.id, CATALOG.md("introduction_recorded", user_language, name=name, age=age))
+    OUTBOX.send(message.chat.id, CATALOG.md("proceed_to_learning"),
+                reply_markup=keyboard("finish_setup", user_language))
+    SESSIONS.set_state(user_id, LEARNING_MODE)
 
-@bot.callback_query_handler(func=lambda call: call.data == "finish_setup")
+@ROUTER.callback("finish_setup")
 def handle_finish_setup(call):
     user_id = call.from_user.id
-    user_language = read_user_data().get(user_id, {}).get('language', 'English')
-
-    messages = {
-        "English": (
-            "✅ *Setup Complete!* You are now ready to begin your learning journey.\n\n"
-            "⏰ Every day at *2 PM*, you will receive a reminder.\n\n"
-            "💬 You also have a free conversation mode.\n\n"
-            "🎯 *Start your first task:*"
-        ),
-        "Russian": (
-            "✅ *Настройка завершена!* Теперь вы готовы начать обучение.\n\n"
-            "⏰ Каждый день в *14:00* вы будете получать напоминание.\n\n"
-            "💬 У вас есть режим свободного общения.\n\n"
-            "🎯 *Начните свое первое задание:*"
-        )
-    }
-    text = messages.get(user_language, messages["English"])
-
-    task_keyboard = InlineKeyboardMarkup()
-    task_keyboard.add(
-        InlineKeyboardButton("🎧 Listening", callback_data="start_listening"),
-        InlineKeyboardButton("📖 Reading", callback_data="start_reading"),
-        InlineKeyboardButton("📝 ESSAY practice", callback_data="generate_new_essay"),
-        InlineKeyboardButton("✍️ Writing Assignment", callback_data="start_writing_assignment")
+    user = get_user(user_id)
+    user_language = user.get('language', 'English')
+
+    OUTBOX.edit(
+        call.message.chat.id,
+        call.message.message_id,
+        CATALOG.md("setup_complete", user_language, **reminder_settings(user)),
+        reply_markup=keyboard("learning_tasks", user_language)
     )
+    SESSIONS.set_state(user_id, None)
+    register_user_notifications(user_id)
 
-    cancel_reg_text = {
-        "English": "❌ Cancel Registration",
-        "Russian": "❌ Перепройти регистрацию",
-        "Kazakh": "❌ Тіркеуді қайталау",
-        "Uzbek": "❌ Ro'yxatdan o'tishni bekor qilish",
-        "Kyrgyz": "❌ Каттоону кайра өткөрүү"
-    }.get(user_language, "❌ Cancel Registration")
-
-    task_keyboard.add(InlineKeyboardButton(cancel_reg_text, callback_data="cancel_registration"))
-
-    bot.edit_message_text(
-        chat_id=call.message.chat.id,
-        message_id=call.message.message_id,
-        text=escape_markdown_v2(text),
-        reply_markup=task_keyboard
-    )
-    USER_STATES.pop(user_id, None)
+@ROUTER.callback(*LESSON_TASKS)
+def handle_lesson_task(call):
+    user_id = call.from_user.id
+    chat_id = call.message.chat.id
+    user = get_user(user_id)
+    user_language = user.get('language', 'English')
+    level = user.get('english_level')
+    kind, title = LESSON_TASKS[call.data]
+
+    content = CONTENT_POOL.take(user_id, kind, level, user_language)
+    if content is not None:
+        send_lesson_content(user_id, chat_id, user_language, kind, title, content)
+        return
+
+    # The user has seen the whole pool: generate a batch for it now.
+    if not begin_user_request(user_id, call.data):
+        return
+    try:
+        OUTBOX.chat_action(chat_id, "typing")
+        OUTBOX.send(chat_id, CATALOG.md("preparing_content", user_language))
+        CONTENT_POOL.generate(kind, level, user_language,
+                              lambda: finish_lesson_task(user_id, chat_id, user_language, level, kind, title),
+                              on_error=report_llm_error(chat_id, user_language),
+                              user_id=user_id, handler=call.data)
+    except Exception:
+        end_user_request(user_id, call.data)
+        raise
+
+def finish_lesson_task(user_id, chat_id, user_language, level, kind, title):
+    content = CONTENT_POOL.take(user_id, kind, level, user_language)
+    if content is None:
+        OUTBOX.send(chat_id, CATALOG.md("error", user_language))
+        return
+    send_lesson_content(user_id, chat_id, user_language, kind, title, content)
+
+def send_lesson_content(user_id, chat_id, user_language, kind, title, content):
+    if kind == "essay":
+        add_essay_topic(user_id, content)
+    for part in chunks(CATALOG.md(title, user_language), Markup("\n\n"), content):
+        OUTBOX.send(chat_id, part)
+    award_points(user_id, chat_id, user_language, LESSON_POINTS.get(kind, 0))
 
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_registration")
+def award_points(user_id, chat_id, user_language, points):
+    if points:
+        score = update_user_score(user_id, points)
+        OUTBOX.send(chat_id, CATALOG.md("points_awarded", user_language, points=points, score=score))
+
+@ROUTER.callback("cancel_registration")
 def handle_cancel_registration(call):
     user_id = call.from_user.id
-    user_data = read_user_data()
-    user_language = user_data.get(user_id, {}).get("language", "English")
+    user_language = get_user(user_id).get("language", "English")
+    delete_user_data(user_id)
 
-    if user_id in user_data:
-        del user_data[user_id]
+    SESSIONS.discard(user_id)
+    SESSIONS.set_state(user_id, LANGUAGE_SELECTION)
 
-        with open("users.csv", mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=['user_id', 'language', 'english_level', 'name', 'age', 'score'])
-            writer.writeheader()
-            for row in user_data.values():
-                writer.writerow(row)
+    OUTBOX.send(call.message.chat.id, CATALOG.md("registration_canceled", user_language))
 
-    USER_STATES[user_id] = LANGUAGE_SELECTION
+    cmd_start(call.message)
 
-    localized_cancel_msg = {
-        "English": "✅ *Your registration has been canceled and all data has been deleted.*",
-        "Russian": "✅ *Ваша регистрация отменена и все данные удалены.*"
-    }
-    bot.send_message(call.message.chat.id, escape_markdown_v2(localized_cancel_msg.get(user_language, localized_cancel_msg["English"])))
+@ROUTER.command('leaderboard')
+def cmd_leaderboard(message):
+    user_id = message.from_user.id
+    user_language = get_user(user_id).get('language', 'English')
+    if SHARD_WORKERS > 1:
+        # Each worker only ranks its own shard's users.
+        OUTBOX.send(message.chat.id, CATALOG.md("leaderboard_unavailable", user_language,
+                                                score=get_user_score(user_id)))
+        return
+    lines = [CATALOG.md("leaderboard_title", user_language)]
+    leaders = get_leaderboard(LEADERBOARD_SIZE)
+    if not leaders:
+        lines.append(CATALOG.md("leaderboard_empty", user_language))
+    place = 0
+    for position, (leader_id, name, score) in enumerate(leaders, 1):
+        # Tied users share a place.
+        if position == 1 or score != leaders[position - 2][2]:
+            place = position
+        lines.append(CATALOG.md("leaderboard_row", place=MEDALS.get(place, f"{place}."),
+                                name=name or "—", score=score))
+    rank = get_user_rank(user_id)
+    if rank is None:
+        footer = CATALOG.md("leaderboard_no_rank", user_language)
+    else:
+        footer = CATALOG.md("leaderboard_your_rank", user_language, rank=rank[0], players=rank[1],
+                            score=get_user_score(user_id))
+    OUTBOX.send(message.chat.id, Markup("\n".join(lines) + "\n\n" + footer))
 
-    cmd_start(call.message)
+@ROUTER.command('reminder')
+def cmd_reminder(message):
+    user_id = message.from_user.id
+    user = get_user(user_id)
+    user_language = user.get('language', 'English')
+    parts = message.text.split()
+    if len(parts) == 1 or not user:
+        OUTBOX.send(message.chat.id, CATALOG.md("reminder_settings", user_language, **reminder_settings(user)))
+        return
+    try:
+        hour = int(parts[1])
+        if not 0 <= hour <= 23:
+            raise ValueError(f"Hour out of range: {hour}")
+        timezone = parse_timezone(parts[2]) if len(parts) > 2 else None
+    except ValueError:
+        OUTBOX.send(message.chat.id, CATALOG.md("reminder_usage", user_language))
+        return
+    write_user_data(user_id, timezone=timezone, notify_hour=hour)
+    register_user_notifications(user_id)
+    OUTBOX.send(message.chat.id, CATALOG.md("reminder_set", user_language, **reminder_settings(get_user(user_id))))
+
+@ROUTER.command('profile')
+def cmd_profile(message):
+    if message.from_user.id not in ADMIN_USER_IDS:
+        return
+    parts = message.text.split()
+    seconds = min(int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 30, PROFILE_MAX_SECONDS)
+    chat_id = message.chat.id
+    if not PROFILER.start(seconds, lambda report: send_profile_report(chat_id, report)):
+        OUTBOX.send(chat_id, CATALOG.md("profiling_busy"))
+        return
+    OUTBOX.send(chat_id, CATALOG.md("profiling_started", seconds=seconds))
+
+@ROUTER.command('loglevel')
+def cmd_loglevel(message):
+    if message.from_user.id not in ADMIN_USER_IDS:
+        return
+    parts = message.text.split()
+    logs = setup_logging()
+    try:
+        level = logs.set_level(parts[1]) if len(parts) > 1 else logs.level
+    except ValueError:
+        OUTBOX.send(message.chat.id, CATALOG.md("log_level_usage"))
+        return
+    OUTBOX.send(message.chat.id, CATALOG.md("log_level", level=level))
+
+def send_profile_report(chat_id, report):
+    # One preformatted block cannot be split across messages.
+    OUTBOX.send(chat_id, pre(report[:3900]))
 
-@bot.message_handler(commands=['run_scheduler'])
+@ROUTER.command('run_scheduler')
 def run_scheduler_cmd(message):
 
     schedule_notifications(bot)
-    bot.send_message(message.chat.id, "Daily notifications have been scheduled at 14:00!")
+    OUTBOX.send(message.chat.id, CATALOG.md("notifications_scheduled"))
 
 def start_bot():
+    setup_logging()
     print("🚀 Bot is running...")
+    if SHARD_WORKERS > 1:
+        run_sharded()
+        return
     schedule_notifications(bot)  
-    bot.infinity_polling()
+    CONTENT_POOL.start()
+    if METRICS_PORT:
+        MetricsServer().start()
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling()
+
+def run_webhook():
+    server = WebhookServer(bot)
+    REGISTRY.gauge("lingoml_webhook_queued", "Webhook updates waiting for a worker.", lambda: len(server.queue))
+    server.start()
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET_TOKEN)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+def run_sharded():
+    # This process only receives updates; the shard workers handle them.
+    dispatcher = ShardDispatcher()
+    dispatcher.start()
+    try:
+        if BOT_MODE == "webhook":
+            server = WebhookServer(bot, sink=dispatcher)
+            server.start()
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET_TOKEN)
+            threading.Event().wait()
+        else:
+            bot.remove_webhook()
+            poll_updates(bot.token, dispatcher)
+    except KeyboardInterrupt:
+        dispatcher.stop()
+
+def run_shard_worker(shard, updates):
+    """
+    Entry point of a shard worker process (see sharding.py), run in the
+    shard's directory: handles the JSON updates read line by line from
+    `updates` and sends reminders to the shard's own users.
+    """
+    setup_logging()
+    logging.info(f"Shard {shard} worker started")
+    # Telegram's limits are per bot, and every worker sends as the same bot.
+    TELEGRAM_LIMITER.set_rate(TELEGRAM_GLOBAL_RATE / SHARD_WORKERS)
+    schedule_notifications(bot, rate=BROADCAST_RATE / SHARD_WORKERS)
+    CONTENT_POOL.start()
+    if METRICS_PORT:
+        MetricsServer(port=METRICS_PORT + shard).start()
+    workers = UpdateWorkers(bot)
+    REGISTRY.gauge("lingoml_webhook_queued", "Webhook updates waiting for a worker.", lambda: len(workers))
+    workers.start()
+    for line in updates:
+        if not line.strip():
+            continue
+        update = json.loads(line)
+        while not workers.put(update):
+            time.sleep(0.05)
+    workers.stop()
+    logging.info(f"Shard {shard} worker stopped")
 
 if __name__ == "__main__":
     start_bot()
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+import logging
+
+from telebot.apihelper import ApiTelegramException
+
+from config import TELEGRAM_GLOBAL_RATE, BROADCAST_RATE, BROADCAST_MAX_RETRIES
+from file_io import atomic_write_json
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `acquire` blocks until a token is available.
+    `pause` stops handing out tokens for a while, e.g. after a 429. The
+    bucket holds at least one token, so rates below 1/s still work.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity or rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def set_rate(self, rate, capacity=None):
+        with self._lock:
+            self.rate = float(rate)
+            self.capacity = max(1.0, float(capacity or rate))
+            self._tokens = min(self._tokens, self.capacity)
+
+
+# Telegram's per-bot limit over all chats, shared by the outbox and the
+# reminder sender in this process.
+TELEGRAM_LIMITER = TokenBucket(TELEGRAM_GLOBAL_RATE)
+
+
+def retry_after_seconds(error):
+    """
+    Returns Telegram's retry_after for a 429 error, or None for other errors.
+    """
+    if not isinstance(error, ApiTelegramException) or error.error_code != 429:
+        return None
+    return (error.result_json.get('parameters') or {}).get('retry_after', 1)
+
+
+class DeliveryLog:
+    """
+    When each recipient last got a message, persisted so a restarted sender
+    can tell who it missed while it was down. `since` is when the log was
+    started: recipients without an entry have been missed only if their
+    message fell due after it. Changes are saved at most every
+    `save_interval` seconds, so a crash can resend that window.
+    """
+
+    def __init__(self, path, save_interval):
+        self.path = path
+        self.save_interval = save_interval
+        self.since = time.time()
+        self._sent = {}
+        self._changed = False
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    saved = json.load(file)
+                self.since = saved.get('since', self.since)
+                self._sent = {user_id: sent_at for user_id, sent_at in saved.get('sent', [])}
+            except (OSError, ValueError, TypeError) as e:
+                logging.warning(f"Ignoring unreadable delivery log {path}: {e}")
+        else:
+            self._changed = True
+
+    def last_sent(self, user_id):
+        return self._sent.get(user_id, 0)
+
+    def mark_sent(self, user_id, sent_at=None):
+        with self._lock:
+            self._sent[user_id] = sent_at or time.time()
+            self._changed = True
+            due = time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def forget(self, user_id):
+        with self._lock:
+            if self._sent.pop(user_id, None) is not None:
+                self._changed = True
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return False
+            data = {'since': self.since, 'sent': list(self._sent.items())}
+            self._changed = False
+            self._saved_at = time.monotonic()
+        try:
+            atomic_write_json(self.path, data)
+        except Exception:
+            self._changed = True
+            raise
+        return True
+
+
+class BroadcastEngine:
+    """
+    Sends reminder messages, from any number of threads, at most `rate` per
+    second and within the bot-wide `global_limiter` it shares with the
+    outbox. A 429 pauses the bot-wide limiter for `retry_after` and the
+    message is retried; other errors count as failures.
+    """
+
+    def __init__(self, bot_instance, rate=BROADCAST_RATE, max_retries=BROADCAST_MAX_RETRIES,
+                 global_limiter=TELEGRAM_LIMITER):
+        self.bot = bot_instance
+        self.limiter = TokenBucket(rate)
+        self.global_limiter = global_limiter
+        self.max_retries = max_retries
+
+    def send(self, chat_id, text, reply_markup=None, stats=None):
+        """
+        Sends one message under the rate limit, retrying on 429.
+        Returns True if it was delivered.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self.global_limiter.acquire()
+            try:
+                self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+                return True
+            except Exception as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempt == self.max_retries:
+                    logging.error(f"Failed to send broadcast message to {chat_id}: {e}")
+                    return False
+                if stats is not None:
+                    with stats['lock']:
+                        stats['retried'] += 1
+                logging.warning(f"Rate limited sending to {chat_id}, retrying in {retry_after}s")
+                self.global_limiter.pause(retry_after)
+        return False
@@ -1,19 +1,199 @@
 import os
-import logging
 
 OPENAI_API_KEY = "YOUR_OPENAI_API_KEY"
 BOT_TOKEN = "YOUR_TELEGRAM_BOT_TOKEN"
 
-logging.basicConfig(
-    filename="bot_debug.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    encoding="utf-8"
-)
+# How updates arrive: "polling" (getUpdates) or "webhook". In webhook mode
+# a local HTTP server listens on WEBHOOK_LISTEN_HOST:WEBHOOK_LISTEN_PORT;
+# expose it as WEBHOOK_URL through an HTTPS reverse proxy. Telegram sends
+# WEBHOOK_SECRET_TOKEN with every request. Up to WEBHOOK_MAX_PENDING updates
+# wait for the WEBHOOK_WORKERS handler threads.
+BOT_MODE = "polling"
+WEBHOOK_URL = "https://example.com/telegram/webhook"
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_LISTEN_HOST = "127.0.0.1"
+WEBHOOK_LISTEN_PORT = 8080
+WEBHOOK_SECRET_TOKEN = "YOUR_WEBHOOK_SECRET_TOKEN"
+WEBHOOK_WORKERS = 8
+WEBHOOK_MAX_PENDING = 1000
+
+# With SHARD_WORKERS > 1 this process only receives updates (webhook or
+# polling) and passes each one to one of SHARD_WORKERS bot processes, picked
+# by a hash of the user id. Each worker runs in SHARD_DIR/<n> with its own
+# data files, sessions, caches, reminders and metrics port (METRICS_PORT + n);
+# TELEGRAM_GLOBAL_RATE and BROADCAST_RATE are split evenly between workers.
+# /leaderboard is unavailable, as no worker sees every user's score.
+# Run `python sharding.py --split` once to split the existing data. Up to
+# SHARD_QUEUE_SIZE updates wait per worker.
+SHARD_WORKERS = 1
+SHARD_DIR = 'shards'
+SHARD_QUEUE_SIZE = 1000
+
+LLM_MODEL = "gpt-4-0613"
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+# Handlers submit completions to the async client and return immediately.
+# At most LLM_MAX_IN_FLIGHT requests are outstanding; completion callbacks
+# run on LLM_CALLBACK_WORKERS threads.
+LLM_MAX_IN_FLIGHT = 16
+LLM_REQUEST_TIMEOUT = 60
+LLM_CALLBACK_WORKERS = 8
+
+# Model, temperature, answer length (max_tokens), prompt length
+# (max_input_tokens, see prompt_budget.py) and deadline (seconds, retries
+# included) per LLM task; unlisted tasks and missing keys use "default". Failed
+# requests are retried LLM_MAX_RETRIES times with jittered backoff, the last
+# try on LLM_FALLBACK_MODEL. After LLM_BREAKER_FAILURES upstream failures in
+# a row a model is skipped for LLM_BREAKER_RESET seconds.
+LLM_TASKS = {
+    "default": {"model": LLM_MODEL, "temperature": 0.7, "max_tokens": 1024, "max_input_tokens": 3000,
+                "deadline": LLM_REQUEST_TIMEOUT},
+    "assessment": {"temperature": 0.3, "max_tokens": 1200, "max_input_tokens": 1500},
+    "topics": {"temperature": 0.7, "max_tokens": 1200, "max_input_tokens": 1500},
+    "extraction": {"model": "gpt-3.5-turbo", "temperature": 0, "max_tokens": 20, "max_input_tokens": 300,
+                   "deadline": 15},
+    "essay_topics": {"temperature": 1.0, "max_tokens": 600},
+    "reading": {"temperature": 0.9, "max_tokens": 3000, "deadline": 180},
+    "listening": {"temperature": 0.9, "max_tokens": 3000, "deadline": 180},
+}
+LLM_FALLBACK_MODEL = "gpt-3.5-turbo"
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_BREAKER_FAILURES = 5
+LLM_BREAKER_RESET = 30
+
+# Stream assessment and topic answers into the placeholder message, editing
+# it at most once per STREAM_EDIT_INTERVAL seconds per chat.
+LLM_STREAM_RESPONSES = True
+STREAM_EDIT_INTERVAL = 1.0
+
+# Responses are cached per task for the given number of seconds; tasks that
+# are not listed here always go to the API. Set LLM_CACHE_DB to None to keep
+# the cache in memory only. Every LLM_CACHE_PURGE_INTERVAL seconds expired
+# rows are deleted from it, and the soonest to expire beyond
+# LLM_CACHE_DB_MAX_ENTRIES.
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 2048
+LLM_CACHE_TTLS = {
+    "extraction": 7 * 24 * 3600,
+    "topics": 24 * 3600,
+}
+LLM_CACHE_DB = 'llm_cache.db'
+LLM_CACHE_DB_MAX_ENTRIES = 100000
+LLM_CACHE_PURGE_INTERVAL = 3600
+
+# Introductions ("I'm Aigerim, 21") are parsed locally; only when the local
+# parse is less certain than this (0..1) is the LLM asked instead.
+INTRO_LOCAL_CONFIDENCE = 0.8
+
+# Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics
+# (None disables the endpoint). Users in ADMIN_USER_IDS may send
+# `/profile <seconds>` to profile PROFILE_SAMPLE_RATE of the handler calls
+# in that time with cProfile (at most PROFILE_MAX_SECONDS).
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+ADMIN_USER_IDS = set()
+PROFILE_SAMPLE_RATE = 0.1
+PROFILE_MAX_SECONDS = 300
+
+# Logs are written as JSON lines to LOG_FILE by a background thread; callers
+# only put them on a queue of LOG_QUEUE_SIZE records (dropped when full).
+# The file is rotated at LOG_MAX_BYTES or after LOG_ROTATE_INTERVAL seconds,
+# keeping LOG_BACKUP_COUNT old files. INFO and DEBUG lines from one place in
+# the code are limited to LOG_SITE_RATE per second after LOG_SITE_BURST.
+# Admins can change LOG_LEVEL at runtime with `/loglevel <level>`.
+LOG_FILE = "bot_debug.log"
+LOG_LEVEL = "DEBUG"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_ROTATE_INTERVAL = 24 * 3600
+LOG_BACKUP_COUNT = 7
+LOG_QUEUE_SIZE = 10000
+LOG_SITE_RATE = 5
+LOG_SITE_BURST = 20
+
+# Storage engine for users, plans and essay topics: "csv" or "sqlite".
+# Run `python storage.py` once to import the existing CSV files into SQLite.
+STORAGE_BACKEND = "csv"
+SQLITE_DB_FILE = 'lingoml.db'
 
 USER_DATA_FILE = 'users.csv'
 PLAN_DATA_FILE = 'plans.csv'
+# New plans are appended here and folded into PLAN_DATA_FILE once the
+# journal holds this many records.
+PLAN_DATA_JOURNAL_FILE = 'plans.journal.csv'
+PLAN_JOURNAL_COMPACT_EVERY = 1000
 ESSAY_TOPICS_FILE = 'essay_topics.csv'
+# Essay topic changes are appended here and folded into ESSAY_TOPICS_FILE
+# once the journal holds this many records.
+ESSAY_TOPICS_JOURNAL_FILE = 'essay_topics.journal.csv'
+ESSAY_JOURNAL_COMPACT_EVERY = 1000
+
+# Points are appended to SCORE_LEDGER_FILE as they are awarded and written
+# into the users' score column once the ledger holds SCORE_COMPACT_EVERY
+# records. /leaderboard shows the LEADERBOARD_SIZE best users. Users earn
+# ASSESSMENT_POINTS for a finished assessment and LESSON_POINTS per lesson.
+SCORE_LEDGER_FILE = 'score_ledger.csv'
+SCORE_COMPACT_EVERY = 1000
+ASSESSMENT_POINTS = 20
+LESSON_POINTS = {"essay": 10, "reading": 10, "listening": 10}
+LEADERBOARD_SIZE = 10
+
+# Ready-made essay topics, reading and listening tasks per CEFR level and
+# language, so lesson buttons answer without waiting on the LLM. Items are
+# appended to CONTENT_POOL_FILE; CONTENT_POOL_CURSORS_FILE remembers what each
+# user has been given. A pool gets CONTENT_POOL_BATCH new items once fewer
+# than CONTENT_POOL_LOW_WATER are left for its most active user, one batch at
+# a time, checked every CONTENT_POOL_REFILL_INTERVAL seconds and only while
+# the LLM client has no queue.
+CONTENT_POOL_FILE = 'content_pool.csv'
+CONTENT_POOL_CURSORS_FILE = 'content_pool_cursors.json'
+CONTENT_POOL_LOW_WATER = 5
+CONTENT_POOL_BATCH = 5
+CONTENT_POOL_REFILL_INTERVAL = 5
+
+# Users are kept in memory and written back at most once per interval (seconds).
+USER_FLUSH_INTERVAL = 5
+
+# Per-user conversation state (onboarding step, assessment paragraph, ...).
+# Sessions idle for SESSION_IDLE_TTL seconds are dropped, as are the least
+# recently active ones beyond SESSION_MAX_ENTRIES. Sessions are snapshotted
+# every SESSION_SNAPSHOT_INTERVAL seconds so a restart resumes users
+# mid-flow; set SESSION_SNAPSHOT_FILE to None to keep them in memory only.
+SESSION_MAX_ENTRIES = 50000
+SESSION_IDLE_TTL = 24 * 3600
+SESSION_SNAPSHOT_FILE = 'sessions.json'
+SESSION_SNAPSHOT_INTERVAL = 30
+
+# Daily reminders go out at each user's notify_hour in their own timezone
+# (these defaults when unset), spread over NOTIFY_SPREAD_MINUTES. When each
+# user was last reminded is saved to REMINDER_LOG_FILE every
+# REMINDER_LOG_SAVE_INTERVAL seconds; on startup, reminders that fell due in
+# the last NOTIFY_CATCH_UP_HOURS while the bot was down are sent right away.
+DEFAULT_TIMEZONE = "Asia/Almaty"
+NOTIFY_HOUR = 14
+NOTIFY_SPREAD_MINUTES = 60
+REMINDER_LOG_FILE = 'reminders_sent.json'
+REMINDER_LOG_SAVE_INTERVAL = 5
+NOTIFY_CATCH_UP_HOURS = 6
+
+# Telegram allows a bot about 30 messages/s over all chats. Handler replies
+# and daily reminders share one limiter of TELEGRAM_GLOBAL_RATE messages/s.
+TELEGRAM_GLOBAL_RATE = 30
+
+# Handlers queue their messages in an outbox that OUTBOX_WORKERS threads
+# send over shared keep-alive connections, each chat in order. A chat gets
+# OUTBOX_CHAT_RATE messages/s after a burst of OUTBOX_CHAT_BURST.
+OUTBOX_WORKERS = 8
+OUTBOX_CHAT_RATE = 1
+OUTBOX_CHAT_BURST = 3
+OUTBOX_MAX_RETRIES = 3
+
+# Daily reminders take at most BROADCAST_RATE of the TELEGRAM_GLOBAL_RATE
+# messages/s, leaving the rest for replies. BROADCAST_WORKERS threads send
+# the reminders that are due.
+BROADCAST_RATE = 25
+BROADCAST_WORKERS = 8
+BROADCAST_MAX_RETRIES = 3
 
 if not os.path.exists(USER_DATA_FILE):
     with open(USER_DATA_FILE, mode='w', newline='', encoding='utf-8') as file:
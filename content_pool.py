@@ -0,0 +1,338 @@
+import atexit
+import csv
+import json
+import os
+import re
+import threading
+import logging
+
+from config import (
+    CONTENT_POOL_FILE, CONTENT_POOL_CURSORS_FILE, CONTENT_POOL_LOW_WATER, CONTENT_POOL_BATCH,
+    CONTENT_POOL_REFILL_INTERVAL
+)
+from async_llm_client import LLM_CLIENT
+from data_manager import read_user_data
+from file_io import atomic_write_json, file_lock, read_csv_rows
+from openai_client_wrapper import extract_json
+
+POOL_FIELDS = ['item_id', 'kind', 'level', 'language', 'content']
+KINDS = ('essay', 'reading', 'listening')
+LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+DEFAULT_LEVEL = 'B1'
+
+# LLM task per kind (see LLM_TASKS), and the LLM_CLIENT queue refills share.
+TASKS = {'essay': 'essay_topics', 'reading': 'reading', 'listening': 'listening'}
+POOL_USER_ID = 'content-pool'
+
+PROMPTS = {
+    'essay': (
+        "You are an English teacher. Write {count} different essay topics for a learner at CEFR level "
+        "{level}. Each topic is one or two sentences and says what the essay should cover. "
+        "Write the topics in English. Return only a JSON array of {count} strings."
+    ),
+    'reading': (
+        "You are an English teacher. Write {count} different reading exercises for a learner at CEFR level "
+        "{level}. Each exercise is a short text in English suited to that level, followed by three "
+        "comprehension questions. Write the task instructions in {language}. "
+        "Return only a JSON array of {count} strings, one exercise per string."
+    ),
+    'listening': (
+        "You are an English teacher. Write {count} different listening exercises for a learner at CEFR "
+        "level {level}. Each exercise is a short dialogue in English meant to be read aloud, followed by "
+        "three comprehension questions. Write the task instructions in {language}. "
+        "Return only a JSON array of {count} strings, one exercise per string."
+    ),
+}
+
+
+def cefr_level(level):
+    """
+    "B2", "b2+" or "Upper B2" -> "B2"; anything without a CEFR level (e.g.
+    "Unknown") -> DEFAULT_LEVEL.
+    """
+    match = re.search(r'([ABC][12])', (level or '').upper())
+    return match.group(1) if match else DEFAULT_LEVEL
+
+
+def parse_items(response):
+    """
+    The strings of a JSON array answer, or [] if the answer is not one.
+    """
+    try:
+        items = json.loads(extract_json(response))
+    except ValueError:
+        return []
+    if not isinstance(items, list):
+        return []
+    return [item.strip() for item in items if isinstance(item, str) and item.strip()]
+
+
+class ContentPool:
+    """
+    Ready-made lesson content per (kind, CEFR level, language).
+
+    Each pool is an append-only list of items, so a user's position in it is
+    a single cursor: handing out the next unseen item is a dict lookup and
+    an index, and nobody gets the same item twice. A background producer
+    keeps at least `low_water` items ahead of the pool's most advanced user
+    by generating `batch` items per LLM call. It submits one call at a time,
+    and only while the LLM client has nothing queued and half its
+    connections free, so refills use capacity that users are not waiting
+    on. A user who has seen everything gets a fresh batch on demand.
+
+    Items are appended to `path`, and cursors are written to `cursors_path`
+    by the producer and on exit.
+    """
+
+    def __init__(self, client, path, cursors_path, low_water, batch, refill_interval):
+        self.client = client
+        self.path = path
+        self.cursors_path = cursors_path
+        self.low_water = low_water
+        self.batch = batch
+        self.refill_interval = refill_interval
+        self._items = None
+        self._known = {}
+        self._cursors = {}
+        self._served = {}
+        self._wanted = set()
+        self._next_id = 1
+        self._refilling = None
+        self._cursors_changed = False
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._producer = None
+        self.generated = 0
+        self.handed_out = 0
+        self.misses = 0
+
+    def _ensure_loaded(self):
+        if self._items is not None:
+            return
+        with self._lock:
+            if self._items is not None:
+                return
+            items = {}
+            with file_lock(self.path).read():
+                rows = read_csv_rows(self.path)
+            for row in rows:
+                try:
+                    item_id = int(row['item_id'])
+                except (TypeError, ValueError):
+                    # A crash during an append can leave a torn last line.
+                    logging.warning(f"Skipping malformed content pool row in {self.path}")
+                    continue
+                key = (row['kind'], row['level'], row['language'])
+                items.setdefault(key, []).append(row['content'])
+                self._known.setdefault(key, set()).add(row['content'])
+                self._next_id = max(self._next_id, item_id + 1)
+            self._load_cursors()
+            self._items = items
+            logging.info(f"Loaded {sum(len(pool) for pool in items.values())} content pool items "
+                         f"in {len(items)} pools")
+
+    def _load_cursors(self):
+        if not os.path.exists(self.cursors_path):
+            return
+        try:
+            with open(self.cursors_path, encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable content pool cursors {self.cursors_path}: {e}")
+            return
+        for user_id, kind, level, language, cursor in saved:
+            key = (kind, level, language)
+            self._cursors[(user_id, key)] = cursor
+            self._served[key] = max(self._served.get(key, 0), cursor)
+
+    def want(self, kind, level, language):
+        """
+        Asks the producer to keep this pool filled.
+        """
+        with self._lock:
+            self._wanted.add((kind, cefr_level(level), language))
+
+    def take(self, user_id, kind, level, language):
+        """
+        The next item of the pool this user has not been given yet, or None
+        if they have seen all of it.
+        """
+        self._ensure_loaded()
+        key = (kind, cefr_level(level), language)
+        with self._lock:
+            self._wanted.add(key)
+            items = self._items.get(key, ())
+            cursor = self._cursors.get((user_id, key), 0)
+            if cursor >= len(items):
+                self.misses += 1
+                self._wakeup.set()
+                return None
+            self._cursors[(user_id, key)] = cursor + 1
+            self._cursors_changed = True
+            if cursor + 1 > self._served.get(key, 0):
+                self._served[key] = cursor + 1
+                if len(items) - cursor - 1 < self.low_water:
+                    self._wakeup.set()
+            self.handed_out += 1
+            return items[cursor]
+
+    def add(self, kind, level, language, contents):
+        """
+        Appends the items not already in the pool; returns how many were new.
+        """
+        self._ensure_loaded()
+        key = (kind, cefr_level(level), language)
+        with self._lock:
+            known = self._known.setdefault(key, set())
+            rows = []
+            for content in contents:
+                if content in known:
+                    continue
+                known.add(content)
+                rows.append({'item_id': self._next_id, 'kind': key[0], 'level': key[1],
+                             'language': key[2], 'content': content})
+                self._next_id += 1
+            if not rows:
+                return 0
+            self._append(rows)
+            self._items.setdefault(key, []).extend(row['content'] for row in rows)
+            self.generated += len(rows)
+            return len(rows)
+
+    def _append(self, rows):
+        with file_lock(self.path).write():
+            write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=POOL_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(rows)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def generate(self, kind, level, language, on_done, on_error=None, user_id=POOL_USER_ID, handler=None):
+        """
+        Generates a batch for the pool; `on_done()` is called once it has
+        been added, or `on_error(error)` if it could not be (`on_done()`
+        without an `on_error`). Used by the producer, and by handlers when a
+        user has seen every item.
+        """
+        level = cefr_level(level)
+        prompt = PROMPTS[kind].format(count=self.batch, level=level, language=language)
+
+        def done(response):
+            try:
+                added = self.add(kind, level, language, parse_items(response))
+            except Exception as e:
+                logging.exception(f"Could not add {kind} items to the {level}/{language} pool")
+                if on_error is not None:
+                    on_error(e)
+                    return
+            else:
+                logging.info(f"Added {added} {kind} items to the {level}/{language} pool")
+            on_done()
+
+        self.client.submit(user_id, prompt, done, task=TASKS[kind], handler=handler, on_error=on_error)
+
+    def ahead(self, kind, level, language):
+        """
+        Items left for the pool's most advanced user.
+        """
+        self._ensure_loaded()
+        key = (kind, cefr_level(level), language)
+        with self._lock:
+            return len(self._items.get(key, ())) - self._served.get(key, 0)
+
+    def _next_refill(self):
+        # The wanted pool furthest below the low-water mark, if any.
+        with self._lock:
+            lowest = None
+            for key in self._wanted:
+                ahead = len(self._items.get(key, ())) - self._served.get(key, 0)
+                if ahead < self.low_water and (lowest is None or ahead < lowest[0]):
+                    lowest = (ahead, key)
+            return lowest[1] if lowest else None
+
+    def _client_idle(self):
+        queued, in_flight = self.client.pending()
+        return queued == 0 and in_flight <= self.client.max_in_flight // 2
+
+    def start(self):
+        """
+        Starts the producer, first asking it to fill the pools the existing
+        users will draw from.
+        """
+        self._ensure_loaded()
+        for user in read_user_data().values():
+            if user.get('language'):
+                for kind in KINDS:
+                    self.want(kind, user.get('english_level'), user['language'])
+        if self._producer is None:
+            self._producer = threading.Thread(target=self._produce, name="content-pool", daemon=True)
+            self._producer.start()
+
+    def _produce(self):
+        while not self._stopped:
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
+            try:
+                self.save_cursors()
+                if self._refilling is None and self._client_idle():
+                    self._refill(self._next_refill())
+            except Exception as e:
+                logging.error(f"Content pool refill failed: {e}")
+
+    def _refill(self, key):
+        if key is None:
+            return
+        self._refilling = key
+
+        def finished(error=None):
+            if error is not None:
+                logging.warning(f"Could not refill the {key} pool: {error!r}")
+            self._refilling = None
+            self._wakeup.set()
+
+        try:
+            self.generate(*key, on_done=finished, on_error=finished)
+        except Exception:
+            self._refilling = None
+            raise
+
+    def save_cursors(self):
+        with self._lock:
+            if not self._cursors_changed:
+                return False
+            data = [[user_id, *key, cursor] for (user_id, key), cursor in self._cursors.items()]
+            self._cursors_changed = False
+        try:
+            atomic_write_json(self.cursors_path, data)
+        except Exception:
+            self._cursors_changed = True
+            raise
+        return True
+
+    def stats(self):
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                'pools': len(self._items),
+                'items': sum(len(pool) for pool in self._items.values()),
+                'below_low_water': sum(1 for key in self._wanted
+                                       if len(self._items.get(key, ())) - self._served.get(key, 0) < self.low_water),
+                'generated': self.generated,
+                'handed_out': self.handed_out,
+                'misses': self.misses
+            }
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        if self._items is not None:
+            self.save_cursors()
+
+
+CONTENT_POOL = ContentPool(LLM_CLIENT, CONTENT_POOL_FILE, CONTENT_POOL_CURSORS_FILE, CONTENT_POOL_LOW_WATER,
+                           CONTENT_POOL_BATCH, CONTENT_POOL_REFILL_INTERVAL)
+atexit.register(CONTENT_POOL.close)
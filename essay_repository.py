@@ -0,0 +1,136 @@
+import csv
+import os
+import threading
+import logging
+from file_io import atomic_write_csv, file_lock, read_csv_rows
+
+ESSAY_FIELDS = ['essay_id', 'user_id', 'topic', 'status']
+
+
+class EssayTopicRepository:
+    """
+    Essay topics kept in memory with a (user_id, status) index.
+
+    Changes are appended to a journal next to the base CSV instead of
+    rewriting it; every journal row is a full topic record and the last row
+    for an essay_id wins. Once the journal reaches `compact_every` records it
+    is folded back into the base file and truncated.
+    """
+
+    def __init__(self, path, journal_path, compact_every):
+        self.path = path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self._topics = None
+        self._by_user_status = {}
+        self._next_id = 1
+        self._journal_size = 0
+        self._lock = threading.Lock()
+
+    def _read_rows(self, path):
+        with file_lock(path).read():
+            rows = read_csv_rows(path)
+        topics = []
+        for row in rows:
+            try:
+                topics.append({
+                    'essay_id': int(row['essay_id']),
+                    'user_id': int(row['user_id']),
+                    'topic': row['topic'],
+                    'status': row['status']
+                })
+            except (TypeError, ValueError):
+                # A crash during an append can leave a torn last line.
+                logging.warning(f"Skipping malformed essay topic row in {path}: {row}")
+        return topics
+
+    def _ensure_loaded(self):
+        if self._topics is not None:
+            return
+        self._topics = {}
+        for row in self._read_rows(self.path):
+            self._apply(row)
+        journal = self._read_rows(self.journal_path)
+        for row in journal:
+            self._apply(row)
+        self._journal_size = len(journal)
+        logging.info(f"Loaded {len(self._topics)} essay topics ({len(journal)} journal records)")
+
+    def _apply(self, row):
+        previous = self._topics.get(row['essay_id'])
+        if previous is not None:
+            key = (previous['user_id'], previous['status'])
+            bucket = self._by_user_status.get(key, {})
+            bucket.pop(row['essay_id'], None)
+            if not bucket:
+                self._by_user_status.pop(key, None)
+        self._topics[row['essay_id']] = row
+        self._by_user_status.setdefault((row['user_id'], row['status']), {})[row['essay_id']] = row
+        self._next_id = max(self._next_id, row['essay_id'] + 1)
+
+    def _append_journal(self, row):
+        with file_lock(self.journal_path).write():
+            write_header = not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0
+            with open(self.journal_path, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=ESSAY_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerow(row)
+                file.flush()
+                os.fsync(file.fileno())
+        self._journal_size += 1
+        if self._journal_size >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        # The base file is replaced before the journal is dropped; replaying a
+        # journal over an already-compacted base is harmless.
+        with file_lock(self.path).write():
+            atomic_write_csv(self.path, ESSAY_FIELDS, self._topics.values())
+        with file_lock(self.journal_path).write():
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        logging.debug(f"Compacted {self._journal_size} journal records into {self.path}")
+        self._journal_size = 0
+
+    def all(self):
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(row) for row in self._topics.values()]
+
+    def replace_all(self, topics):
+        with self._lock:
+            self._topics = {}
+            self._by_user_status = {}
+            self._next_id = 1
+            for row in topics:
+                self._apply({field: row[field] for field in ESSAY_FIELDS})
+            self._compact()
+
+    def add(self, user_id, topic, status):
+        with self._lock:
+            self._ensure_loaded()
+            row = {'essay_id': self._next_id, 'user_id': user_id, 'topic': topic, 'status': status}
+            self._apply(row)
+            self._append_journal(row)
+            return dict(row)
+
+    def find(self, user_id, status):
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(row) for row in self._by_user_status.get((user_id, status), {}).values()]
+
+    def set_status(self, essay_id, new_status):
+        with self._lock:
+            self._ensure_loaded()
+            previous = self._topics.get(essay_id)
+            if previous is None or previous['status'] == new_status:
+                return
+            row = dict(previous, status=new_status)
+            self._apply(row)
+            self._append_journal(row)
+
+    def compact(self):
+        with self._lock:
+            if self._topics is not None and self._journal_size:
+                self._compact()
@@ -0,0 +1,120 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    Readers-writer lock: any number of readers, or a single writer.
+    Waiting writers block new readers so a stream of reads cannot starve them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+_FILE_LOCKS = {}
+_FILE_LOCKS_GUARD = threading.Lock()
+
+
+def file_lock(path):
+    """
+    Returns the process-wide RWLock guarding `path`.
+    """
+    key = os.path.abspath(path)
+    with _FILE_LOCKS_GUARD:
+        lock = _FILE_LOCKS.get(key)
+        if lock is None:
+            lock = _FILE_LOCKS[key] = RWLock()
+        return lock
+
+
+def atomic_write(path, write):
+    """
+    Calls `write(file)` on a temporary text file in the same directory, fsyncs
+    it and renames it over `path`. Readers see either the old file or the new
+    one, never a truncated or half-written file, even if the process dies
+    midway.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def atomic_write_csv(path, fieldnames, rows):
+    def write(file):
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    atomic_write(path, write)
+
+
+def atomic_write_json(path, data):
+    atomic_write(path, lambda file: json.dump(data, file, ensure_ascii=False))
+
+
+def _fsync_directory(directory):
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def read_csv_rows(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, mode='r', newline='', encoding='utf-8') as file:
+        return list(csv.DictReader(file))
+
@@ -0,0 +1,258 @@
+import re
+from collections import namedtuple
+
+# What the user told us, and how sure we are about it (0..1). `confidence`
+# is the lower of the name and age confidences; 0 when either is missing.
+Introduction = namedtuple('Introduction', ['name', 'age', 'confidence'])
+
+MIN_AGE, MAX_AGE = 5, 100
+
+# Common first names, lowercase, in the spellings users actually type.
+NAMES = frozenset("""
+aigerim айгерим айгерім aruzhan аружан aisha айша aida аида aizhan айжан dana дана dinara динара
+madina мадина kamila камила zhansaya жансая asel асель әсел асел akbota акбота ayana аяна
+tomiris томирис saltanat салтанат gulnara гульнара гүлнара aliya алия әлия zarina зарина
+nurlan нурлан нұрлан yerlan ерлан erlan daniyar данияр arman арман askar аскар асқар
+bekzat бекзат nursultan нурсултан нұрсұлтан alikhan алихан alinur алинур sanzhar санжар
+timur тимур тимур azamat азамат ruslan руслан marat марат serik серик серік
+dias диас zhanibek жанибек жәнібек adilet адилет әділет bakyt бакыт бақыт
+aibek айбек aizada айзада bermet бермет cholpon чолпон чолпон nurzhan нуржан нұржан
+kanat канат қанат ermek эрмек ермек aigul айгуль айгүл gulzat гулзат гүлзат
+akmal акмал aziz азиз bobur бобур dilnoza дилноза dilshod дилшод farrukh фаррух
+jasur жасур javohir жавохир kamola камола laylo лайло malika малика nodira нодира
+otabek отабек rustam рустам sardor сардор sherzod шерзод shahzoda шахзода sevara севара
+ulugbek улугбек ulug'bek zilola зилола muhammad мухаммад mukhammad
+alexander александр alex алекс anna анна maria мария мария ivan иван dmitry дмитрий
+sergey сергей elena елена olga ольга natalia наталья nikita никита andrey андрей
+anastasia анастасия ekaterina екатерина kate катя daria дарья pavel павел artem артем
+john james michael david sarah emma emily daniel maxim максим sophia софия
+""".split())
+
+# Words that follow "I am" / "я" / "мен", or open a text, but are not names.
+NOT_NAMES = frozenset("""
+i i'm im my me hi hello hey hallo я меня мне мой моё мое у привет здравствуйте мен менің менин
+сәлем салам mening salom assalomu
+a an the from in at student studying learning learner teacher engineer developer doctor happy fine
+good ok okay glad here new interested years year old also just very really not so called
+студент студентка из в на рад рада очень тоже уже хорошо отлично учусь работаю
+студентпін студентпин студентмін оқушымын оқушы студентмын студенттин окуучумун
+talabaman talaba o'quvchiman o'quvchi men man
+almaty алматы алмате astana астана астане bishkek бишкек tashkent ташкент ташкенте
+shymkent шымкент moscow москва москвы kazakhstan казахстан қазақстан kyrgyzstan кыргызстан
+uzbekistan узбекистан samarkand самарканд osh ош karaganda караганда
+""".split())
+
+NUMBER_WORDS = {
+    # English
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9,
+    'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16,
+    'seventeen': 17, 'eighteen': 18, 'nineteen': 19, 'twenty': 20, 'thirty': 30, 'forty': 40,
+    'fifty': 50, 'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90,
+    # Russian
+    'один': 1, 'одна': 1, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4, 'пять': 5, 'шесть': 6, 'семь': 7,
+    'восемь': 8, 'девять': 9, 'десять': 10, 'одиннадцать': 11, 'двенадцать': 12, 'тринадцать': 13,
+    'четырнадцать': 14, 'пятнадцать': 15, 'шестнадцать': 16, 'семнадцать': 17, 'восемнадцать': 18,
+    'девятнадцать': 19, 'двадцать': 20, 'тридцать': 30, 'сорок': 40, 'пятьдесят': 50,
+    'шестьдесят': 60, 'семьдесят': 70, 'восемьдесят': 80, 'девяносто': 90,
+    # Kazakh
+    'бір': 1, 'екі': 2, 'үш': 3, 'төрт': 4, 'бес': 5, 'алты': 6, 'жеті': 7, 'сегіз': 8, 'тоғыз': 9,
+    'жиырма': 20, 'отыз': 30, 'қырық': 40, 'елу': 50, 'алпыс': 60, 'жетпіс': 70,
+    'сексен': 80, 'тоқсан': 90,
+    # Kyrgyz
+    'бир': 1, 'эки': 2, 'беш': 5, 'жети': 7, 'сегиз': 8, 'тогуз': 9, 'жыйырма': 20, 'отуз': 30,
+    'кырк': 40, 'элүү': 50, 'алтымыш': 60, 'жетимиш': 70, 'токсон': 90,
+    # Uzbek (apostrophes are normalized to ' first)
+    'bir': 1, 'ikki': 2, 'uch': 3, "to'rt": 4, 'besh': 5, 'olti': 6, 'yetti': 7, 'sakkiz': 8,
+    "to'qqiz": 9, "o'n": 10, 'yigirma': 20, "o'ttiz": 30, 'qirq': 40, 'ellik': 50, 'oltmish': 60,
+    'yetmish': 70, 'sakson': 80, "to'qson": 90,
+}
+
+_APOSTROPHES = str.maketrans({"‘": "'", "’": "'", "ʻ": "'", "ʼ": "'", "`": "'"})
+
+_WORD = r"[^\W\d_][\w'-]*"
+_NUMBER_WORD = re.compile(r"[^\W\d_][\w']*(?:-[^\W\d_][\w']*)?")
+_NUMBER = re.compile(r"(?<!\d)\d{1,3}(?!\d)")
+_N = r"(\d{1,3})"
+
+# (pattern, confidence); the first group is the age. STATED_AGE and up
+# means the text says outright that the number is an age.
+STATED_AGE = 0.9
+AGE_PATTERNS = [(re.compile(pattern, re.IGNORECASE), confidence) for pattern, confidence in [
+    (_N + r"\s*-?\s*(?:years?|yrs?|y\.?\s?o\.?)(?![\w])", 0.95),
+    (r"\bage[d]?\s*(?:is|:|-|—)?\s*" + _N, 0.95),
+    (_N + r"\s*(?:год|года|лет)(?![\w])", 0.95),
+    (r"\bмне\s+(?:уже\s+|только\s+)?" + _N, 0.95),
+    (r"\bвозраст\w*\s*(?::|-|—)?\s*" + _N, 0.95),
+    (_N + r"\s*-?\s*(?:жаста\w*|жас|жашта\w*|жаш)(?![\w])", 0.95),
+    (r"\b(?:жасым|жашым)\s*(?::|-|—)?\s*" + _N, 0.95),
+    (_N + r"\s*-?\s*(?:yoshda\w*|yosh)(?![\w])", 0.95),
+    (r"\byoshim\s*(?::|-|—)?\s*" + _N, 0.95),
+    (r"\bi\s*(?:am|'m)\s+(?:already\s+|only\s+)?" + _N + r"(?![\w])", 0.9),
+]]
+
+# (pattern, confidence); the first group is the name. Strong cues name the
+# name outright; weak ones ("I am X") need X to be a known name, or the age
+# to be stated outright, to be trusted, as "I am Tired, 21" reads the same.
+STRONG, WEAK = 0.95, 0.7
+NAME_PATTERNS = [(re.compile(pattern, re.IGNORECASE), confidence) for pattern, confidence in [
+    (r"\bmy name(?:'s| is)\s+(" + _WORD + ")", STRONG),
+    (r"\bname\s*(?::|-|—)\s*(" + _WORD + ")", STRONG),
+    (r"\bcall me\s+(" + _WORD + ")", STRONG),
+    (r"\bменя зовут\s+(" + _WORD + ")", STRONG),
+    (r"\bмо[её] имя\s*(?::|-|—)?\s*(" + _WORD + ")", STRONG),
+    (r"\bимя\s*(?::|-|—)\s*(" + _WORD + ")", STRONG),
+    (r"(?<![\w])(?:атым|есімім|ысымым)\s*(?::|-|—)?\s*(" + _WORD + ")", STRONG),
+    (r"\bismim\s*(?::|-|—)?\s*(" + _WORD + ")", STRONG),
+    (r"\bmeni\s+(" + _WORD + r")\s+deb\b", STRONG),
+    (r"\bi\s*(?:am|'m)\s+(" + _WORD + ")", WEAK),
+    (r"\bthis is\s+(" + _WORD + ")", WEAK),
+    (r"(?<![\w])я\s*(?:-|—)?\s*(" + _WORD + ")", WEAK),
+    (r"(?<![\w])(?:мен|men)\s+(" + _WORD + ")", WEAK),
+]]
+
+# "-мын", "-мін", ... ("I am") and Uzbek "-man" glued to a name.
+_COPULA = re.compile(r"-?(?:мын|мин|мін|мун|мүн|пын|пін|пун|бын|бін|man)$", re.IGNORECASE)
+
+
+def normalize(text):
+    """
+    Unifies apostrophes and replaces spelled-out numbers ("twenty-one",
+    "двадцать один", "жиырма бір") with digits.
+    """
+    text = text.translate(_APOSTROPHES)
+    words = list(_NUMBER_WORD.finditer(text))
+    if not any(_number_value(match.group()) is not None for match in words):
+        return text
+    pieces, last, index = [], 0, 0
+    while index < len(words):
+        value = _number_value(words[index].group())
+        if value is None:
+            index += 1
+            continue
+        start, end = words[index].start(), words[index].end()
+        following = words[index + 1] if index + 1 < len(words) else None
+        if value >= 10 and value % 10 == 0:
+            unit = _number_value(following.group()) if following else None
+            if unit is not None and unit < 10 and not text[end:following.start()].strip(" -"):
+                value += unit
+                end = following.end()
+                index += 1
+            elif words[index].group().lower() == 'он':
+                index += 1
+                continue
+        pieces.append(text[last:start])
+        pieces.append(str(value))
+        last = end
+        index += 1
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def _number_value(word):
+    word = word.lower()
+    if word == 'он':
+        # Also Russian "he": only a number when a unit follows ("он бір").
+        return 10
+    if word in NUMBER_WORDS:
+        return NUMBER_WORDS[word]
+    if '-' in word:
+        tens, _, unit = word.partition('-')
+        if NUMBER_WORDS.get(tens, 0) >= 20 and NUMBER_WORDS.get(unit, 10) < 10:
+            return NUMBER_WORDS[tens] + NUMBER_WORDS[unit]
+    return None
+
+
+def _follows_name(text, name, number):
+    # "Aigerim, 21", "I'm Aigerim 21.", "Айгеріммін, 21", but not
+    # "Dana, 15 ta mushugim bor", where words go on after the number.
+    pattern = (r"(?<![\w])" + re.escape(name) + r"\w*[\s,.:;!—–-]*" + str(number)
+               + r"(?!\d)(?![^\S\n]*[^\W\d_])")
+    return re.search(pattern, text, re.IGNORECASE) is not None
+
+
+def _find_age(text, name=None):
+    found = {}
+    for pattern, confidence in AGE_PATTERNS:
+        for match in pattern.finditer(text):
+            age = int(match.group(1))
+            if MIN_AGE <= age <= MAX_AGE:
+                found[age] = max(found.get(age, 0), confidence)
+    if len(found) == 1:
+        return next(iter(found.items()))
+    if len(found) > 1:
+        return max(found, key=found.get), 0.4
+    numbers = [int(n) for n in _NUMBER.findall(text)]
+    if len(numbers) == 1 and MIN_AGE <= numbers[0] <= MAX_AGE:
+        # A lone number right after the name is the age; elsewhere it may as
+        # well count hours, cats or a school, so the LLM decides.
+        if name and _follows_name(text, name, numbers[0]):
+            return numbers[0], 0.8
+        return numbers[0], 0.5
+    if numbers:
+        return numbers[0], 0.3
+    return None, 0.0
+
+
+def _clean_name(word):
+    word = word.strip("'-")
+    if word.lower() not in NAMES:
+        stem = _COPULA.sub('', word)
+        if len(stem) >= 3 and stem != word:
+            word = stem
+    return word
+
+
+def _name_confidence(name, cue_confidence):
+    lower = name.lower()
+    if lower in NOT_NAMES or len(name) < 2:
+        return 0.0
+    if lower in NAMES:
+        return max(cue_confidence, 0.95)
+    if name[0].isupper():
+        return cue_confidence
+    # Lowercase and unknown: only trust an explicit "my name is".
+    return 0.7 if cue_confidence >= STRONG else 0.0
+
+
+def _find_name(text):
+    best, best_confidence = None, 0.0
+    for pattern, cue_confidence in NAME_PATTERNS:
+        for match in pattern.finditer(text):
+            name = _clean_name(match.group(1))
+            confidence = _name_confidence(name, cue_confidence)
+            if confidence > best_confidence:
+                best, best_confidence = name, confidence
+    if best is not None:
+        return best, best_confidence
+    # No cue ("Aigerim, 21"): a known name anywhere, or a capitalized word
+    # that opens the text.
+    words = re.findall(_WORD, text)
+    for word in words:
+        if word.lower() in NAMES:
+            return word, 0.85
+    if words and words[0][0].isupper() and words[0].lower() not in NOT_NAMES:
+        return _clean_name(words[0]), 0.6
+    return None, 0.0
+
+
+def _display_name(name):
+    return name[0].upper() + name[1:] if name else name
+
+
+def extract_introduction(text):
+    """
+    Finds the user's first name and age in a short self-introduction in
+    English, Russian, Kazakh, Kyrgyz or Uzbek, without calling the LLM.
+    """
+    if not text:
+        return Introduction(None, None, 0.0)
+    text = normalize(text)
+    name, name_confidence = _find_name(text)
+    age, age_confidence = _find_age(text, name)
+    if name_confidence == WEAK and age_confidence >= STATED_AGE:
+        # "Мен Тилекмин, 26 жаштамын": with the age stated, this is an
+        # introduction and "I am X" names the user.
+        name_confidence = 0.8
+    if name is None or age is None:
+        return Introduction(_display_name(name), age, 0.0)
+    return Introduction(_display_name(name), age, round(min(age_confidence, name_confidence), 2))
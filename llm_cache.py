@@ -0,0 +1,163 @@
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+
+def make_cache_key(model, prompt, temperature):
+    """
+    Hash of the request with whitespace in the prompt normalized, so the same
+    prompt built with different line breaks or padding shares one entry.
+    """
+    normalized = " ".join(prompt.split())
+    payload = json.dumps([model, normalized, round(float(temperature), 2)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    Size-bounded LRU of LLM responses with per-task TTLs.
+
+    Tasks without a TTL are never cached. When `disk_path` is set, entries are
+    also looked up in an SQLite file on a memory miss, so the cache survives
+    restarts. `put` only queues the disk write: a writer thread stores
+    entries in batches and every `purge_interval` seconds deletes expired
+    rows and the soonest to expire beyond `disk_max_entries`.
+    """
+
+    def __init__(self, max_entries, ttls, disk_path=None, disk_max_entries=None, purge_interval=3600):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.purge_interval = purge_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self._writer = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                             " key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def ttl_for(self, task):
+        return self.ttls.get(task, 0)
+
+    def get(self, task, key):
+        if not self.ttl_for(task):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+        if self.disk_path:
+            row = self._disk().execute(
+                "SELECT response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, task, key, response):
+        ttl = self.ttl_for(task)
+        if not ttl:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            if self.disk_path and self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="llm-cache-writer", daemon=True)
+                self._writer.start()
+        if self.disk_path:
+            self._writes.put((key, response, expires_at))
+
+    def _write_loop(self):
+        next_purge = time.monotonic()
+        while True:
+            try:
+                rows = [self._writes.get(timeout=max(0.0, next_purge - time.monotonic()))]
+            except queue.Empty:
+                rows = []
+            while not self._writes.empty():
+                rows.append(self._writes.get_nowait())
+            stopping = None in rows
+            rows = [row for row in rows if row is not None]
+            try:
+                if rows:
+                    conn = self._disk()
+                    with conn:
+                        conn.executemany("INSERT OR REPLACE INTO llm_cache (key, response, expires_at)"
+                                         " VALUES (?, ?, ?)", rows)
+                if time.monotonic() >= next_purge:
+                    self.purge_expired()
+                    next_purge = time.monotonic() + self.purge_interval
+            except sqlite3.Error as e:
+                logging.error(f"Failed to update the LLM cache in {self.disk_path}: {e}")
+            if stopping:
+                return
+
+    def _remember(self, key, response, expires_at):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+        if self.disk_path:
+            conn = self._disk()
+            with conn:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                if self.disk_max_entries:
+                    conn.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache"
+                                 " ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.disk_max_entries,))
+
+    def close(self):
+        """
+        Writes the queued entries to disk.
+        """
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join(10)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,164 @@
+import string
+
+from telebot.types import (
+    ReplyKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardRemove,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton
+)
+
+from markdown_v2 import Markup, escape
+from messages import MESSAGES
+
+LANGUAGES = ("English", "Russian", "Kazakh", "Uzbek", "Kyrgyz")
+DEFAULT_LANGUAGE = "English"
+
+_FORMATTER = string.Formatter()
+
+
+def _escape_template(template):
+    """
+    Escapes the literal parts of a str.format template and keeps its
+    replacement fields, so `_escape_template(t).format(**escaped_values)`
+    equals `escape(t.format(**values))`.
+    """
+    parts = []
+    for literal, field, spec, conversion in _FORMATTER.parse(template):
+        parts.append(escape(literal).replace('{', '{{').replace('}', '}}'))
+        if field is not None:
+            parts.append('{' + field + ('!' + conversion if conversion else '') + (':' + spec if spec else '') + '}')
+    return ''.join(parts)
+
+
+def _fields(template):
+    return {field for _, field, _, _ in _FORMATTER.parse(template) if field}
+
+
+class Catalog:
+    """
+    Localized texts, checked and precompiled once.
+
+    Every entry must have a text for each language (or be one plain string
+    for all of them). The MarkdownV2-escaped form of every text is computed
+    up front, so sending a localized message is a dict lookup; templates
+    only escape the values formatted into them.
+    """
+
+    def __init__(self, messages, languages=LANGUAGES, default=DEFAULT_LANGUAGE):
+        self.languages = tuple(languages)
+        self.default = default
+        self._text = {}
+        self._markdown = {}
+        self._templates = set()
+        missing = []
+        for key, entry in messages.items():
+            if isinstance(entry, str):
+                entry = dict.fromkeys(self.languages, entry)
+            missing.extend(f"{key}[{language}]" for language in self.languages if not entry.get(language))
+            texts = {language: entry.get(language, "") for language in self.languages}
+            if any(_fields(text) for text in texts.values()):
+                self._templates.add(key)
+                markdown = {language: _escape_template(text) for language, text in texts.items()}
+            else:
+                markdown = {language: Markup(escape(text)) for language, text in texts.items()}
+            self._text[key] = texts
+            self._markdown[key] = markdown
+        if missing:
+            raise ValueError(f"Missing translations: {', '.join(missing)}")
+
+    def _pick(self, table, key, language):
+        texts = table[key]
+        return texts.get(language) or texts[self.default]
+
+    def text(self, key, language=DEFAULT_LANGUAGE):
+        """
+        The raw text, e.g. for button labels.
+        """
+        return self._pick(self._text, key, language)
+
+    def md(self, key, language=DEFAULT_LANGUAGE, **fields):
+        """
+        The text as MarkdownV2 Markup, with `fields` escaped and formatted in.
+        """
+        text = self._pick(self._markdown, key, language)
+        if key in self._templates:
+            return Markup(text.format(**{name: escape(str(value)) for name, value in fields.items()}))
+        return text
+
+    def variants(self, key):
+        """
+        The distinct texts of `key` across languages, e.g. to route a button.
+        """
+        return tuple(dict.fromkeys(self._text[key].values()))
+
+
+CATALOG = Catalog(MESSAGES)
+
+
+def _language_selection(language):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    keyboard.add(*(KeyboardButton(name) for name in ("Russian", "Kazakh", "English", "Uzbek", "Kyrgyz")))
+    return keyboard
+
+
+def _assessment_options(language):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    keyboard.add(KeyboardButton(CATALOG.text("retake_test_button", language)),
+                 KeyboardButton(CATALOG.text("continue_setup_button", language)))
+    return keyboard
+
+
+def _finish_setup(language):
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton(CATALOG.text("finish_setup_button", language), callback_data="finish_setup"))
+    return keyboard
+
+
+def _learning_tasks(language):
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(
+        InlineKeyboardButton(CATALOG.text("listening_button", language), callback_data="start_listening"),
+        InlineKeyboardButton(CATALOG.text("reading_button", language), callback_data="start_reading"),
+        InlineKeyboardButton(CATALOG.text("essay_button", language), callback_data="generate_new_essay"),
+        InlineKeyboardButton(CATALOG.text("writing_button", language), callback_data="start_writing_assignment")
+    )
+    keyboard.add(InlineKeyboardButton(CATALOG.text("cancel_registration_button", language),
+                                      callback_data="cancel_registration"))
+    return keyboard
+
+
+def _lesson_reminder(language):
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(
+        InlineKeyboardButton(CATALOG.text("listening_button", language), callback_data="start_listening"),
+        InlineKeyboardButton(CATALOG.text("reading_button", language), callback_data="start_reading"),
+        InlineKeyboardButton(CATALOG.text("essay_button", language), callback_data="start_vocab")
+    )
+    return keyboard
+
+
+def _persistent(language):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
+    keyboard.add(KeyboardButton(CATALOG.text("new_lesson_button", language)))
+    return keyboard
+
+
+KEYBOARD_BUILDERS = {
+    "language_selection": _language_selection,
+    "assessment_options": _assessment_options,
+    "finish_setup": _finish_setup,
+    "learning_tasks": _learning_tasks,
+    "lesson_reminder": _lesson_reminder,
+    "persistent": _persistent,
+    "remove": lambda language: ReplyKeyboardRemove(),
+}
+
+# Built once per language and shared by every send: never mutate them.
+_KEYBOARDS = {(name, language): build(language)
+              for name, build in KEYBOARD_BUILDERS.items() for language in LANGUAGES}
+
+
+def keyboard(name, language=DEFAULT_LANGUAGE):
+    markup = _KEYBOARDS.get((name, language))
+    return markup if markup is not None else _KEYBOARDS[(name, DEFAULT_LANGUAGE)]
@@ -0,0 +1,247 @@
+import atexit
+import contextvars
+import datetime
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import logging
+import logging.handlers
+from contextlib import contextmanager
+
+from config import (
+    LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE,
+    LOG_SITE_RATE, LOG_SITE_BURST
+)
+
+# The user and handler a log line is about, set around handler calls and
+# LLM callbacks so every line they log carries them.
+_USER_ID = contextvars.ContextVar('log_user_id', default=None)
+_HANDLER = contextvars.ContextVar('log_handler', default=None)
+
+
+@contextmanager
+def log_context(user_id=None, handler=None):
+    user_token = _USER_ID.set(user_id)
+    handler_token = _HANDLER.set(handler)
+    try:
+        yield
+    finally:
+        _USER_ID.reset(user_token)
+        _HANDLER.reset(handler_token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the current log_context while still on the thread
+    that logged them, before they are queued.
+    """
+
+    def filter(self, record):
+        if getattr(record, 'user_id', None) is None:
+            record.user_id = _USER_ID.get()
+        if getattr(record, 'handler', None) is None:
+            record.handler = _HANDLER.get()
+        return True
+
+
+class CallSiteRateLimit(logging.Filter):
+    """
+    Limits records at `max_level` and below to `rate` per second per call
+    site (file and line) after a burst of `burst`, so a line logged once per
+    user, like a sent reminder, cannot flood the log during a broadcast.
+    Dropped records are counted and the count is attached to the next
+    record let through from that site as `suppressed`. Warnings and errors
+    always pass.
+    """
+
+    def __init__(self, rate, burst, max_level=logging.INFO):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_level = max_level
+        self.dropped = 0
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [self.burst, now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                self.dropped += 1
+                return False
+            site[0] -= 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for field in ('user_id', 'handler', 'suppressed'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingLogFile(logging.handlers.BaseRotatingHandler):
+    """
+    A log file rotated when it reaches `max_bytes` or is `interval` seconds
+    old, whichever comes first. Old files are renamed with their rotation
+    time and only the newest `backup_count` are kept.
+    """
+
+    def __init__(self, filename, max_bytes, interval, backup_count):
+        super().__init__(filename, 'a', encoding='utf-8')
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.rollover_at = time.time() + interval if interval else None
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(self.max_bytes) and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            # The names sort in rotation order.
+            os.replace(self.baseFilename, f"{self.baseFilename}.{datetime.datetime.now():%Y%m%d-%H%M%S-%f}")
+            backups = sorted(glob.glob(glob.escape(self.baseFilename) + ".*"))
+            for old in backups[:max(0, len(backups) - self.backup_count)]:
+                os.remove(old)
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.interval
+        self.stream = self._open()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. When the queue is full the record
+    is dropped and counted rather than making the caller wait.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message and traceback here, where the arguments are
+        # still valid, but keep them apart for the JSON formatter.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Root logging through a bounded queue: the calling thread only filters
+    and enqueues, and a listener thread formats and writes to the rotating
+    file.
+    """
+
+    def __init__(self, filename, level, max_bytes, interval, backup_count, queue_size, site_rate, site_burst):
+        self.file = RotatingLogFile(filename, max_bytes, interval, backup_count)
+        self.file.setFormatter(JsonFormatter())
+        self.handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(ContextFilter())
+        self.rate_limit = CallSiteRateLimit(site_rate, site_burst)
+        self.handler.addFilter(self.rate_limit)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, self.file)
+        self.level = level
+
+    def start(self):
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        self.set_level(self.level)
+        self.listener.start()
+
+    def set_level(self, level):
+        """
+        Changes the root level at runtime, e.g. "DEBUG" or "WARNING".
+        Raises ValueError for an unknown level name.
+        """
+        if isinstance(level, str):
+            number = logging.getLevelName(level.upper())
+            if not isinstance(number, int):
+                raise ValueError(f"Unknown log level: {level}")
+            level = number
+        logging.getLogger().setLevel(level)
+        self.level = logging.getLevelName(level)
+        logging.warning(f"Log level set to {self.level}")
+        return self.level
+
+    def stats(self):
+        return {'queued': self.handler.queue.qsize(), 'dropped_full': self.handler.dropped,
+                'dropped_rate_limited': self.rate_limit.dropped}
+
+    def stop(self):
+        """
+        Writes out what is queued. Whatever is logged after this, e.g. by
+        other exit handlers, goes to the file directly.
+        """
+        root = logging.getLogger()
+        root.addHandler(self.file)
+        root.removeHandler(self.handler)
+        self.listener.stop()
+
+
+_PIPELINE = None
+_PIPELINE_LOCK = threading.Lock()
+
+
+def setup_logging():
+    """
+    Installs the queued JSON log pipeline on the root logger. Safe to call
+    more than once: later calls return the running pipeline.
+    """
+    global _PIPELINE
+    with _PIPELINE_LOCK:
+        if _PIPELINE is None:
+            _PIPELINE = LogPipeline(LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNT,
+                                    LOG_QUEUE_SIZE, LOG_SITE_RATE, LOG_SITE_BURST)
+            _PIPELINE.start()
+            atexit.register(_PIPELINE.stop)
+        return _PIPELINE
@@ -0,0 +1,137 @@
+import re
+
+MESSAGE_LIMIT = 4096
+
+# Every character MarkdownV2 gives a meaning to. The backslash comes first
+# so the escapes added for the others are not escaped again.
+SPECIAL_CHARACTERS = '\\_*[]()~`>#+-=|{}.!'
+_ESCAPES = tuple((char, '\\' + char) for char in SPECIAL_CHARACTERS)
+
+# How good a place for a message break is: after a blank line, a line
+# break, a space, or anywhere between two pieces.
+_PARAGRAPH, _LINE, _WORD, _ANYWHERE = 3, 2, 1, 0
+
+# Plain text is split as coarsely as its length allows.
+_SPLITS = (
+    (re.compile(r'(\n\s*\n\s*)'), _PARAGRAPH),
+    (re.compile(r'(\n\s*)'), _LINE),
+    (re.compile(r'(\s+)'), _WORD),
+)
+
+
+class Markup(str):
+    """
+    Text that is already valid MarkdownV2 and is passed through unescaped,
+    e.g. `Markup("*Level:* ")`. Build it only from trusted strings.
+    """
+    __slots__ = ()
+
+
+def escape(text):
+    """
+    Escapes `text` for MarkdownV2. One C-level `str.replace` per special
+    character that actually occurs is several times faster than a regex
+    substitution or `str.translate` with a multi-character table.
+    """
+    if not text:
+        return ""
+    for char, escaped in _ESCAPES:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def bold(text):
+    return Markup(f"*{escape(text)}*")
+
+
+def italic(text):
+    return Markup(f"_{escape(text)}_")
+
+
+def pre(text):
+    """
+    A preformatted block; inside it only backticks and backslashes are escaped.
+    """
+    return Markup("```\n" + text.replace('\\', '\\\\').replace('`', '\\`') + "\n```")
+
+
+def render(*parts):
+    """
+    Joins `parts` into one MarkdownV2 string: Markup parts are kept as they
+    are, everything else (user input, LLM output) is escaped.
+    """
+    return Markup(''.join(part if isinstance(part, Markup) else escape(part) for part in parts if part))
+
+
+def _split(text, limit, level=0):
+    pattern, quality = _SPLITS[level]
+    for index, piece in enumerate(pattern.split(text)):
+        if index % 2:
+            yield piece, quality
+            continue
+        escaped = escape(piece)
+        if len(escaped) <= limit:
+            if escaped:
+                yield escaped, None
+        elif level + 1 < len(_SPLITS):
+            yield from _split(piece, limit, level + 1)
+        else:
+            # A single word longer than a message: cut the raw text, so no
+            # escape sequence is torn apart.
+            step = max(1, limit // 2)
+            for start in range(0, len(piece), step):
+                yield escape(piece[start:start + step]), _ANYWHERE
+
+
+def _atoms(parts, limit):
+    """
+    Yields (markup, break_quality) pieces of the rendered message, where
+    break_quality says how good the end of the piece is as the end of a
+    message (None: not at all). Markup parts are never split, so their
+    entities stay balanced.
+    """
+    for part in parts:
+        if not part:
+            continue
+        if isinstance(part, Markup):
+            yield part, _ANYWHERE
+        else:
+            yield from _split(part, limit)
+
+
+def _cut_position(pending, limit):
+    best, best_key = None, None
+    length = 0
+    for index, (markup, quality) in enumerate(pending, 1):
+        length += len(markup)
+        if quality is None:
+            continue
+        key = (length >= limit // 2, quality if length >= limit // 2 else 0, index)
+        if best_key is None or key > best_key:
+            best, best_key = index, key
+    return best if best is not None else len(pending)
+
+
+def chunks(*parts, limit=MESSAGE_LIMIT):
+    """
+    Lazily renders `parts` (as in `render`) into messages of at most `limit`
+    characters. A message ends at the best break that keeps it at least half
+    full: a paragraph break, else a line break, else a space; a shorter
+    message is only cut when there is no such break at all.
+    """
+    pending = []
+    length = 0
+    for markup, quality in _atoms(parts, limit):
+        while pending and length + len(markup) > limit:
+            cut = _cut_position(pending, limit)
+            message = ''.join(piece for piece, _ in pending[:cut]).strip()
+            if message:
+                yield Markup(message)
+            pending = pending[cut:]
+            length = sum(len(piece) for piece, _ in pending)
+        pending.append((markup, quality))
+        length += len(markup)
+    message = ''.join(piece for piece, _ in pending).strip()
+    if message:
+        yield Markup(message)
@@ -1,13 +1,7 @@
-def escape_markdown_v2(text):
-    """
-    Escapes special characters for Telegram MarkdownV2 formatting.
-    """
-    import re
-    if not text:
-        return ""
-    escape_chars = r'_*[\]()~`>#+-=|{}.!'
-    return re.sub(r'([{}])'.format(re.escape(escape_chars)), r'\\\1', text)
+from markdown_v2 import escape as escape_markdown_v2
 
+# Each entry maps every language to its text, or is a plain string shown
+# as is in all languages. localization.CATALOG checks and precompiles these.
 MESSAGES = {
     "welcome": {
         "English": "👋 *Welcome!* Please select your language preference:",
@@ -102,5 +96,216 @@ MESSAGES = {
         "Kazakh": "⚠️ *Аты-жөніңіз бен жасыңызды анықтай алмадым.*",
         "Uzbek": "⚠️ *Ism va yoshni aniqlay olmadim.*",
         "Kyrgyz": "⚠️ *Аты-жөнүн жана жашын аныктай алган жокмун.*"
+    },
+    "already_setup": {
+        "English": "✅ *You have already completed the setup!* No need to restart. You can continue learning.",
+        "Russian": "✅ *Вы уже завершили настройку!* Вы можете продолжить обучение.",
+        "Kazakh": "✅ *Сіз орнатуды аяқтадыңыз!* Оқуды жалғастыра аласыз.",
+        "Uzbek": "✅ *Siz allaqachon sozlamalarni tugatgansiz!* Davom etishingiz mumkin.",
+        "Kyrgyz": "✅ *Орнотуу бүткөн!* Окууну уланта берсеңиз болот."
+    },
+    "invalid_language": "Invalid selection. Please choose one of the provided languages.",
+    "retake_test_button": {
+        "English": "🔄 Retake Test",
+        "Russian": "🔄 Пересдать тест",
+        "Kazakh": "🔄 Тестті қайта тапсыру",
+        "Uzbek": "🔄 Testni qayta topshirish",
+        "Kyrgyz": "🔄 Тестти кайрадан берүү"
+    },
+    "continue_setup_button": {
+        "English": "➡️ Continue Setup",
+        "Russian": "➡️ Продолжить настройку",
+        "Kazakh": "➡️ Орнатуды жалғастыру",
+        "Uzbek": "➡️ Sozlamani davom ettirish",
+        "Kyrgyz": "➡️ Орнотууну улантуу"
+    },
+    "retake_test": {
+        "English": "🔄 *You chose to retake the test.* Please send another paragraph in English.",
+        "Russian": "🔄 *Вы выбрали пересдать тест.* Отправьте другой абзац на английском языке.",
+        "Kazakh": "🔄 *Сіз тестті қайта тапсыруды таңдадыңыз.* Ағылшын тілінде басқа абзац жіберіңіз.",
+        "Uzbek": "🔄 *Siz testni qayta topshirishni tanladingiz.* Ingliz tilida yana bir parcha yuboring.",
+        "Kyrgyz": "🔄 *Сиз тестти кайрадан берүүнү тандадыңыз.* Англис тилинде башка бир абзац жиберип көрүңүз."
+    },
+    "please_wait": "⏳",
+    "generating_topics": "⏳ Generating your personalized list of topics...",
+    "introduction_prompt": {
+        "English": "Please introduce yourself briefly (include your name and age).",
+        "Russian": "Пожалуйста, кратко представьтесь (укажите имя и возраст).",
+        "Kazakh": "Өзіңізді қысқаша таныстырыңыз (аты-жөніңізді және жасыңызды көрсетіңіз).",
+        "Uzbek": "O'zingizni qisqacha tanishtiring (ism va yoshni kiriting).",
+        "Kyrgyz": "Кыскача тааныштырып коюңуз (аты-жөнүңүздү жана жашыңызды)."
+    },
+    "finish_setup_button": {
+        "English": "➡️ Finish setup",
+        "Russian": "➡️ Завершить настройку",
+        "Kazakh": "➡️ Орнатуды аяқтау",
+        "Uzbek": "➡️ Sozlamani tugatish",
+        "Kyrgyz": "➡️ Орнотууну бүтүрүү"
+    },
+    "proceed_to_learning": "Please proceed to the learning mode when you are ready:",
+    "setup_complete": {
+        "English": (
+            "✅ *Setup Complete!* You are now ready to begin your learning journey.\n\n"
+            "⏰ Every day around *{hour}:00* ({timezone}) you will receive a reminder. "
+            "Change the time with /reminder.\n\n"
+            "💬 You also have a free conversation mode.\n\n"
+            "🎯 *Start your first task:*"
+        ),
+        "Russian": (
+            "✅ *Настройка завершена!* Теперь вы готовы начать обучение.\n\n"
+            "⏰ Каждый день около *{hour}:00* ({timezone}) вы будете получать напоминание. "
+            "Изменить время: /reminder.\n\n"
+            "💬 У вас есть режим свободного общения.\n\n"
+            "🎯 *Начните свое первое задание:*"
+        ),
+        "Kazakh": (
+            "✅ *Орнату аяқталды!* Енді оқуды бастауға дайынсыз.\n\n"
+            "⏰ Күн сайын шамамен *{hour}:00*-де ({timezone}) еске салу аласыз. "
+            "Уақытты өзгерту: /reminder.\n\n"
+            "💬 Сізде еркін сөйлесу режимі де бар.\n\n"
+            "🎯 *Алғашқы тапсырмаңызды бастаңыз:*"
+        ),
+        "Uzbek": (
+            "✅ *Sozlash yakunlandi!* Endi o‘qishni boshlashga tayyorsiz.\n\n"
+            "⏰ Har kuni taxminan soat *{hour}:00* da ({timezone}) eslatma olasiz. "
+            "Vaqtni o‘zgartirish: /reminder.\n\n"
+            "💬 Sizda erkin suhbat rejimi ham bor.\n\n"
+            "🎯 *Birinchi topshiriqni boshlang:*"
+        ),
+        "Kyrgyz": (
+            "✅ *Орнотуу аяктады!* Эми окууну баштоого даярсыз.\n\n"
+            "⏰ Күн сайын болжол менен саат *{hour}:00*дө ({timezone}) эскертме аласыз. "
+            "Убакытты өзгөртүү: /reminder.\n\n"
+            "💬 Сизде эркин сүйлөшүү режими да бар.\n\n"
+            "🎯 *Биринчи тапшырмаңызды баштаңыз:*"
+        )
+    },
+    "listening_button": "🎧 Listening",
+    "reading_button": "📖 Reading",
+    "essay_button": "📝 ESSAY practice",
+    "writing_button": "✍️ Writing Assignment",
+    "cancel_registration_button": {
+        "English": "❌ Cancel Registration",
+        "Russian": "❌ Перепройти регистрацию",
+        "Kazakh": "❌ Тіркеуді қайталау",
+        "Uzbek": "❌ Ro'yxatdan o'tishni bekor qilish",
+        "Kyrgyz": "❌ Каттоону кайра өткөрүү"
+    },
+    "registration_canceled": {
+        "English": "✅ *Your registration has been canceled and all data has been deleted.*",
+        "Russian": "✅ *Ваша регистрация отменена и все данные удалены.*",
+        "Kazakh": "✅ *Тіркеуіңіз тоқтатылды және барлық деректер жойылды.*",
+        "Uzbek": "✅ *Ro‘yxatdan o‘tishingiz bekor qilindi va barcha ma’lumotlar o‘chirildi.*",
+        "Kyrgyz": "✅ *Катталууңуз жокко чыгарылды жана бардык маалыматтар өчүрүлдү.*"
+    },
+    "notifications_scheduled": "Daily notifications are scheduled at each user's local time!",
+    "reminder_settings": {
+        "English": "⏰ Your daily reminder comes around {hour}:00 ({timezone}).\n"
+                   "To change it send /reminder <hour> [timezone], e.g. /reminder 9 Europe/Moscow",
+        "Russian": "⏰ Ежедневное напоминание приходит около {hour}:00 ({timezone}).\n"
+                   "Чтобы изменить, отправьте /reminder <час> [часовой пояс], например /reminder 9 Europe/Moscow",
+        "Kazakh": "⏰ Күнделікті еске салу шамамен {hour}:00-де ({timezone}) келеді.\n"
+                  "Өзгерту үшін /reminder <сағат> [уақыт белдеуі] жіберіңіз, мысалы /reminder 9 Asia/Almaty",
+        "Uzbek": "⏰ Kundalik eslatma taxminan soat {hour}:00 da ({timezone}) keladi.\n"
+                 "O‘zgartirish uchun /reminder <soat> [vaqt mintaqasi] yuboring, masalan /reminder 9 Asia/Tashkent",
+        "Kyrgyz": "⏰ Күнүмдүк эскертме болжол менен саат {hour}:00дө ({timezone}) келет.\n"
+                  "Өзгөртүү үчүн /reminder <саат> [убакыт алкагы] жибериңиз, мисалы /reminder 9 Asia/Bishkek"
+    },
+    "reminder_set": {
+        "English": "✅ Done! Your daily reminder now comes around {hour}:00 ({timezone}).",
+        "Russian": "✅ Готово! Теперь напоминание будет приходить около {hour}:00 ({timezone}).",
+        "Kazakh": "✅ Дайын! Енді еске салу шамамен {hour}:00-де ({timezone}) келеді.",
+        "Uzbek": "✅ Tayyor! Endi eslatma taxminan soat {hour}:00 da ({timezone}) keladi.",
+        "Kyrgyz": "✅ Даяр! Эми эскертме болжол менен саат {hour}:00дө ({timezone}) келет."
+    },
+    "reminder_usage": {
+        "English": "⚠️ Send an hour from 0 to 23 and, if you like, a timezone, e.g. /reminder 9 Europe/Moscow",
+        "Russian": "⚠️ Укажите час от 0 до 23 и, при желании, часовой пояс, например /reminder 9 Europe/Moscow",
+        "Kazakh": "⚠️ 0-ден 23-ке дейінгі сағатты және қаласаңыз уақыт белдеуін жіберіңіз, мысалы /reminder 9 Asia/Almaty",
+        "Uzbek": "⚠️ 0 dan 23 gacha soatni va xohlasangiz vaqt mintaqasini yuboring, masalan /reminder 9 Asia/Tashkent",
+        "Kyrgyz": "⚠️ 0дөн 23кө чейинки саатты жана кааласаңыз убакыт алкагын жибериңиз, мисалы /reminder 9 Asia/Bishkek"
+    },
+    "leaderboard_title": {
+        "English": "🏆 *Leaderboard*",
+        "Russian": "🏆 *Таблица лидеров*",
+        "Kazakh": "🏆 *Көшбасшылар тізімі*",
+        "Uzbek": "🏆 *Yetakchilar jadvali*",
+        "Kyrgyz": "🏆 *Лидерлер тизмеси*"
+    },
+    "leaderboard_row": "{place} {name} — {score}",
+    "leaderboard_empty": {
+        "English": "Nobody has earned points yet.",
+        "Russian": "Пока никто не набрал очков.",
+        "Kazakh": "Әзірге ешкім ұпай жинаған жоқ.",
+        "Uzbek": "Hozircha hech kim ball to‘plamagan.",
+        "Kyrgyz": "Азырынча эч ким упай топтой элек."
+    },
+    "leaderboard_your_rank": {
+        "English": "📍 Your place: {rank} of {players} ({score} points)",
+        "Russian": "📍 Ваше место: {rank} из {players} ({score} очк.)",
+        "Kazakh": "📍 Сіздің орныңыз: {players} ішінен {rank} ({score} ұпай)",
+        "Uzbek": "📍 Sizning o‘rningiz: {players} tadan {rank} ({score} ball)",
+        "Kyrgyz": "📍 Сиздин ордуңуз: {players} ичинен {rank} ({score} упай)"
+    },
+    "leaderboard_no_rank": {
+        "English": "📍 You have no points yet. Complete a lesson to join the leaderboard!",
+        "Russian": "📍 У вас пока нет очков. Выполните урок, чтобы попасть в таблицу лидеров!",
+        "Kazakh": "📍 Сізде әлі ұпай жоқ. Көшбасшылар тізіміне кіру үшін сабақты орындаңыз!",
+        "Uzbek": "📍 Sizda hali ball yo‘q. Yetakchilar jadvaliga kirish uchun darsni bajaring!",
+        "Kyrgyz": "📍 Сизде азырынча упай жок. Лидерлер тизмесине кирүү үчүн сабакты аткарыңыз!"
+    },
+    "points_awarded": {
+        "English": "⭐ +{points} points! Your score: {score}",
+        "Russian": "⭐ +{points} очк.! Ваш счёт: {score}",
+        "Kazakh": "⭐ +{points} ұпай! Сіздің ұпайыңыз: {score}",
+        "Uzbek": "⭐ +{points} ball! Sizning balingiz: {score}",
+        "Kyrgyz": "⭐ +{points} упай! Сиздин упайыңыз: {score}"
+    },
+    "leaderboard_unavailable": {
+        "English": "🏆 The leaderboard is not available right now. You have {score} points.",
+        "Russian": "🏆 Таблица лидеров сейчас недоступна. У вас {score} очк.",
+        "Kazakh": "🏆 Көшбасшылар тізімі қазір қолжетімсіз. Сізде {score} ұпай бар.",
+        "Uzbek": "🏆 Yetakchilar jadvali hozir mavjud emas. Sizda {score} ball bor.",
+        "Kyrgyz": "🏆 Лидерлер тизмеси азыр жеткиликсиз. Сизде {score} упай бар."
+    },
+    "profiling_started": "⏱ Profiling handler calls for {seconds} s...",
+    "profiling_busy": "⏱ A profile is already being captured.",
+    "log_level": "📝 Log level: {level}",
+    "log_level_usage": "📝 Usage: /loglevel DEBUG, INFO, WARNING or ERROR",
+    "daily_reminder": {
+        "English": "🌟 Time to improve your English! Let's learn together! 🚀",
+        "Russian": "🌟 Время улучшать ваш английский! Давайте учиться вместе! 🚀",
+        "Kazakh": "🌟 Ағылшын тіліңізді жетілдіретін уақыт келді! Бірге оқиық! 🚀",
+        "Uzbek": "🌟 Ingliz tilingizni yaxshilash vaqti keldi! Keling, birga o‘rganamiz! 🚀",
+        "Kyrgyz": "🌟 Англис тилин жакшыртуу убактысы келди! Келгиле, бирге окуйлу! 🚀"
+    },
+    "new_lesson_button": {
+        "English": "📚 Start a New Lesson",
+        "Russian": "📚 Начать новый урок",
+        "Kazakh": "📚 Жаңа сабақты бастау",
+        "Uzbek": "📚 Yangi darsni boshlash",
+        "Kyrgyz": "📚 Жаңы сабакты баштоо"
+    },
+    "preparing_content": "⏳",
+    "essay_topic": {
+        "English": "📝 *Your essay topic:*",
+        "Russian": "📝 *Тема вашего эссе:*",
+        "Kazakh": "📝 *Эссе тақырыбыңыз:*",
+        "Uzbek": "📝 *Insho mavzuingiz:*",
+        "Kyrgyz": "📝 *Эссе темаңыз:*"
+    },
+    "reading_task": {
+        "English": "📖 *Reading practice:*",
+        "Russian": "📖 *Практика чтения:*",
+        "Kazakh": "📖 *Оқу жаттығуы:*",
+        "Uzbek": "📖 *O‘qish mashqi:*",
+        "Kyrgyz": "📖 *Окуу көнүгүүсү:*"
+    },
+    "listening_task": {
+        "English": "🎧 *Listening practice:* read the dialogue aloud or have someone read it to you, then answer the questions.",
+        "Russian": "🎧 *Практика аудирования:* прочитайте диалог вслух или попросите кого-нибудь прочитать его вам, затем ответьте на вопросы.",
+        "Kazakh": "🎧 *Тыңдау жаттығуы:* диалогты дауыстап оқыңыз немесе біреуден оқып беруін сұраңыз, содан кейін сұрақтарға жауап беріңіз.",
+        "Uzbek": "🎧 *Tinglash mashqi:* dialogni ovoz chiqarib o‘qing yoki kimdandir o‘qib berishini so‘rang, so‘ng savollarga javob bering.",
+        "Kyrgyz": "🎧 *Угуу көнүгүүсү:* диалогду үн чыгарып окуңуз же бирөөдөн окуп берүүнү сураныңыз, андан кийин суроолорго жооп бериңиз."
     }
 }
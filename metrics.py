@@ -0,0 +1,345 @@
+import bisect
+import cProfile
+import functools
+import io
+import pstats
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT, PROFILE_SAMPLE_RATE
+from logging_setup import log_context
+
+# Seconds; wide enough for both a dict lookup and a slow completion.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape_label(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per combination of label values.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per combination of label values,
+    exposed cumulatively as Prometheus expects. `observe` is a bisect and a
+    few additions under a lock, cheap enough for every handler call.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def totals(self):
+        """
+        {label values: (count, sum)}, e.g. to compare two points in time.
+        """
+        with self._lock:
+            return {label_values: (count, total) for label_values, (_, total, count) in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            series = [(label_values, list(counts), total, count)
+                      for label_values, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                yield (f"{self.name}_bucket", _labels(self.labels, label_values, [("le", _number(bound))]),
+                       cumulative)
+            yield f"{self.name}_sum", _labels(self.labels, label_values), total
+            yield f"{self.name}_count", _labels(self.labels, label_values), count
+
+
+class CallbackMetric:
+    """
+    A gauge or counter read from elsewhere when metrics are scraped, e.g. a
+    queue length. `read()` returns a number, or a dict of label value tuples
+    to numbers.
+    """
+
+    def __init__(self, name, help, kind, read, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+        self.labels = labels
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            logging.warning(f"Could not read metric {self.name}: {e}")
+            return
+        if isinstance(value, dict):
+            for label_values, number in value.items():
+                yield self.name, _labels(self.labels, label_values), number
+        elif value is not None:
+            yield self.name, "", value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read, labels=()):
+        return self.register(CallbackMetric(name, help, "gauge", read, labels))
+
+    def counter_from(self, name, help, read, labels=()):
+        return self.register(CallbackMetric(name, help, "counter", read, labels))
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("lingoml_handler_seconds", "Time spent in a bot handler.", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter("lingoml_handler_errors_total", "Handler calls that raised.", ("handler",))
+LLM_SECONDS = REGISTRY.histogram("lingoml_llm_request_seconds", "Duration of one LLM API request.",
+                                 ("task", "model", "outcome"))
+LLM_ERRORS = REGISTRY.counter("lingoml_llm_errors_total", "Failed LLM API requests.", ("task", "error"))
+STORAGE_SECONDS = REGISTRY.histogram("lingoml_storage_seconds", "Duration of a storage operation.", ("operation",))
+STORAGE_ERRORS = REGISTRY.counter("lingoml_storage_errors_total", "Storage operations that raised.",
+                                  ("operation",))
+
+
+def timed(histogram, errors, *label_values):
+    """
+    Decorator recording each call's duration in `histogram`, and counting
+    calls that raise in `errors`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                errors.inc(*label_values)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, *label_values)
+        return wrapper
+    return decorator
+
+
+class SampledProfiler:
+    """
+    Profiles a random `rate` share of handler calls with cProfile while a
+    capture is running, then reports the functions with the most cumulative
+    time. Each sampled call gets its own Profile on its own thread and the
+    results are merged, so calls that do not hit the sample run at full
+    speed. A call that cannot be profiled (another profiler is active) runs
+    unprofiled.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._stats = None
+        self._samples = 0
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return time.monotonic() < self._until
+
+    def start(self, seconds, on_done, top=25):
+        """
+        Captures for `seconds`, then calls `on_done(report)` from a timer
+        thread. Returns False if a capture is already running.
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self._stats = None
+            self._samples = 0
+            self._until = time.monotonic() + seconds
+        timer = threading.Timer(seconds, lambda: on_done(self._report(top)))
+        timer.daemon = True
+        timer.start()
+        logging.info(f"Profiling {self.rate:.0%} of handler calls for {seconds}s")
+        return True
+
+    def call(self, fn, *args):
+        if not self.active or random.random() >= self.rate:
+            return fn(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._samples += 1
+
+    def _report(self, top):
+        with self._lock:
+            self._until = 0.0
+            stats, samples = self._stats, self._samples
+            self._stats = None
+        if stats is None:
+            return "No handler calls were sampled."
+        out = io.StringIO()
+        stats.stream = out
+        stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+        report = f"{samples} sampled handler calls\n" + out.getvalue().strip()
+        logging.info(f"Profile report:\n{report}")
+        return report
+
+
+PROFILER = SampledProfiler(PROFILE_SAMPLE_RATE)
+
+
+def observe_handler(handler, update):
+    """
+    Router hook: times the handler, counts its errors, lets the profiler
+    sample it and tags its log lines with the user and handler.
+    """
+    name = handler.__name__
+    start = time.perf_counter()
+    try:
+        with log_context(update.from_user.id, name):
+            return PROFILER.call(handler, update)
+    except Exception:
+        HANDLER_ERRORS.inc(name)
+        raise
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class MetricsServer:
+    """
+    Serves REGISTRY on GET /metrics for Prometheus to scrape. Bind it to
+    localhost (the default) or a private interface only.
+    """
+
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Metrics served on http://{self.address[0]}:{self.address[1]}/metrics")
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
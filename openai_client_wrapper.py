@@ -1,10 +1,213 @@
+import atexit
+import queue
 import re
-import openai
+import random
+import threading
+import time
 import logging
-from config import OPENAI_API_KEY
+from collections import namedtuple
+from concurrent.futures import Future
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTLS, LLM_CACHE_DB, LLM_CACHE_DB_MAX_ENTRIES,
+    LLM_CACHE_PURGE_INTERVAL,
+    LLM_TASKS, LLM_FALLBACK_MODEL, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_RESET
+)
+from llm_cache import LLMCache
 
-# Initialize once
-openai.api_key = OPENAI_API_KEY
+LLM_CACHE = LLMCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTLS, LLM_CACHE_DB, LLM_CACHE_DB_MAX_ENTRIES,
+                     LLM_CACHE_PURGE_INTERVAL) if LLM_CACHE_ENABLED else None
+if LLM_CACHE:
+    atexit.register(LLM_CACHE.close)
+
+
+class LLMError(Exception):
+    """
+    No answer could be produced. Raised (or passed to `on_error`) instead of
+    returning an error string that could be shown or saved as an answer.
+    """
+    retryable = False
+
+
+class LLMTimeoutError(LLMError):
+    """
+    The request, or the task's whole deadline, ran out.
+    """
+    retryable = True
+
+
+class LLMUpstreamError(LLMError):
+    """
+    The API failed or answered with an error; `status` is the HTTP status,
+    None if there was no usable response at all.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class LLMUnavailableError(LLMError):
+    """
+    Every model that could serve the task is behind an open circuit breaker.
+    """
+
+
+# What one task is sent with; see LLM_TASKS.
+Route = namedtuple('Route', ['task', 'model', 'temperature', 'max_tokens', 'deadline'])
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a model after `failures` upstream failures in a row.
+    Once `reset_after` seconds have passed a single trial request is let
+    through: its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, name, failures, reset_after):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self._failed = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"Circuit breaker for {self.name} closed")
+            self._failed = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failed += 1
+            if self._trial or (self._opened_at is None and self._failed >= self.failures):
+                logging.warning(f"Circuit breaker for {self.name} opened after {self._failed} failures")
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class ModelRouter:
+    """
+    Decides how each LLM task is sent: model, temperature, max_tokens and a
+    deadline that covers all retries (see LLM_TASKS).
+
+    Callers retry retryable failures after `retry_delay` (full-jitter
+    exponential backoff) while the deadline allows, moving the last try to
+    the fallback model (`choose`).
+    Each model has a circuit breaker; a model whose breaker is open is
+    skipped in favour of the other one, and when both are open the request
+    fails at once with LLMUnavailableError instead of waiting on the API.
+    """
+
+    def __init__(self, tasks, fallback_model, max_retries, retry_base_delay, breaker_failures, breaker_reset):
+        self.tasks = tasks
+        self.fallback_model = fallback_model
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def route(self, task, model=None, temperature=None, max_tokens=None, deadline=None):
+        """
+        The task's settings from LLM_TASKS, with any argument that is not
+        None taking precedence.
+        """
+        settings = dict(self.tasks["default"], **self.tasks.get(task, {}))
+        return Route(
+            task,
+            model or settings["model"],
+            settings["temperature"] if temperature is None else temperature,
+            settings["max_tokens"] if max_tokens is None else max_tokens,
+            settings["deadline"] if deadline is None else deadline
+        )
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model, self.breaker_failures, self.breaker_reset)
+            return breaker
+
+    def choose(self, route, attempt):
+        """
+        The model for try number `attempt` (0-based).
+        """
+        candidates = [route.model, self.fallback_model]
+        if 0 < attempt == self.max_retries:
+            candidates.reverse()
+        for model in candidates:
+            if model and self.breaker(model).allow():
+                return model
+        raise LLMUnavailableError(f"No model available for {route.task}: circuit breakers are open")
+
+    def record(self, model, error=None):
+        # Any answer, even a 400, shows the model is up.
+        if error is not None and error.retryable:
+            self.breaker(model).record_failure()
+        else:
+            self.breaker(model).record_success()
+
+    def retry_delay(self, route, attempt, error, deadline, partial=False):
+        """
+        Seconds to wait before try number `attempt + 1`, or None if `error`
+        should be raised instead.
+        """
+        if not error.retryable or partial or attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        logging.warning(f"LLM {route.task} request failed ({error!r}), retrying in {delay:.2f}s")
+        return delay
+
+
+LLM_ROUTER = ModelRouter(LLM_TASKS, LLM_FALLBACK_MODEL, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY,
+                         LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+
+
+_PENDING_USER_REQUESTS = set()
+_PENDING_LOCK = threading.Lock()
+
+
+def begin_user_request(user_id, handler):
+    """
+    Marks a request from this user for `handler` as pending. Returns False if
+    one already is, so repeated taps while the first one is being answered
+    can be dropped instead of triggering another completion.
+    """
+    with _PENDING_LOCK:
+        if (user_id, handler) in _PENDING_USER_REQUESTS:
+            return False
+        _PENDING_USER_REQUESTS.add((user_id, handler))
+        return True
+
+
+def end_user_request(user_id, handler):
+    with _PENDING_LOCK:
+        _PENDING_USER_REQUESTS.discard((user_id, handler))
 
 
 def extract_json(response: str) -> str:
@@ -22,18 +225,44 @@ def extract_json(response: str) -> str:
     return response
 
 
-def call_llm(prompt: str) -> str:
+def call_llm(prompt: str, task: str = "default", temperature: float = None, model: str = None,
+             max_tokens: int = None, user_id=None) -> str:
     """
-    Simple wrapper to call the LLM with a single user prompt. 
-    Returns the first response or an error string.
+    Blocking wrapper around LLM_CLIENT for code that wants the answer inline:
+    sends a single user prompt as LLM_ROUTER routes `task` unless
+    overridden, and returns the response or raises LLMError. Cached answers,
+    sharing of identical in-flight requests, retries and fallback all come
+    from the async client. Must not be called from an LLM callback.
     """
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4-0613",  # Or whichever model you prefer
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        logging.error(f"Error calling OpenAI: {e}")
-        return "Error: Could not generate response."
+    from async_llm_client import LLM_CLIENT
+    result = Future()
+    LLM_CLIENT.submit(user_id, prompt, result.set_result, task=task, temperature=temperature, model=model,
+                      max_tokens=max_tokens, on_error=result.set_exception)
+    return result.result()
+
+
+def call_llm_stream(prompt: str, task: str = "default", temperature: float = None, model: str = None,
+                    user_id=None):
+    """
+    Streaming variant of call_llm: yields pieces of the answer as they arrive
+    (the whole answer at once if it came from the cache). A stream that has
+    shown text is not retried; raises LLMError.
+    """
+    from async_llm_client import LLM_CLIENT
+    pieces = queue.Queue()
+    done = object()
+    LLM_CLIENT.submit(user_id, prompt, lambda content: pieces.put((done, content)), task=task,
+                      temperature=temperature, model=model, on_delta=pieces.put,
+                      on_error=lambda error: pieces.put((done, error)))
+    shown = ""
+    while True:
+        item = pieces.get()
+        if isinstance(item, tuple) and item[0] is done:
+            if isinstance(item[1], Exception):
+                raise item[1]
+            if not shown:
+                yield item[1]
+            return
+        if len(item) > len(shown):
+            yield item[len(shown):]
+            shown = item
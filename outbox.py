@@ -0,0 +1,259 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+from broadcast import TELEGRAM_LIMITER, retry_after_seconds
+from config import OUTBOX_WORKERS, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST, OUTBOX_MAX_RETRIES
+from markdown_v2 import MESSAGE_LIMIT
+
+MERGE_SEPARATOR = "\n\n"
+
+
+def use_keep_alive_session(pool_size):
+    """
+    Makes telebot send every request through one long-lived requests session,
+    so Bot API calls reuse open TLS connections instead of each thread
+    opening its own and renewing it every ten minutes.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    apihelper.session = session
+    apihelper.SESSION_TIME_TO_LIVE = None
+
+
+class _Op:
+    __slots__ = ('method', 'chat_id', 'text', 'target', 'kwargs', 'merge', 'futures', 'attempts')
+
+    def __init__(self, method, chat_id, text=None, target=None, kwargs=None, merge=False):
+        self.method = method
+        self.chat_id = chat_id
+        self.text = text
+        self.target = target
+        self.kwargs = kwargs or {}
+        self.merge = merge
+        self.futures = [Future()]
+        self.attempts = 0
+
+
+class _Lane:
+    __slots__ = ('ops', 'busy', 'tokens', 'updated', 'not_before')
+
+    def __init__(self, burst, now):
+        self.ops = deque()
+        self.busy = False
+        self.tokens = float(burst)
+        self.updated = now
+        self.not_before = 0.0
+
+
+def _coalesce(queued, op):
+    """
+    Folds `op` into the not yet sent `queued` op of the same chat if the
+    result is what the two calls would have shown. Returns True if it did.
+    """
+    if queued.method == 'send_chat_action' and op.method != 'send_chat_action':
+        # The action would be cleared by the message right after it anyway.
+        queued.method, queued.text, queued.target = op.method, op.text, op.target
+        queued.kwargs, queued.merge = op.kwargs, op.merge
+    elif queued.kwargs.get('reply_markup') is not None:
+        return False
+    elif op.method == 'send_message' and queued.method == 'send_message':
+        if not (queued.merge and op.merge) or _options(queued) != _options(op):
+            return False
+        text = queued.text + MERGE_SEPARATOR + op.text
+        if len(text) > MESSAGE_LIMIT:
+            return False
+        queued.text, queued.kwargs = text, op.kwargs
+    elif op.method == 'edit_message_text' and queued.method == 'edit_message_text' and queued.target == op.target:
+        # Only the last of several queued edits of one message is visible.
+        queued.text, queued.kwargs = op.text, op.kwargs
+    else:
+        return False
+    queued.futures.extend(op.futures)
+    return True
+
+
+def _options(op):
+    return {key: value for key, value in op.kwargs.items() if key != 'reply_markup'}
+
+
+def _message_id(target):
+    return target.result().message_id if isinstance(target, Future) else target
+
+
+class Outbox:
+    """
+    Queue for the messages handlers send, so a handler returns without
+    waiting on Telegram.
+
+    Calls for one chat are made one at a time in the order they were queued.
+    Before a call goes out, later calls for the same chat are folded into it
+    where that does not change what the user sees: adjacent plain texts
+    become one message, a chat action followed by a message is dropped, and
+    repeated edits of one message become the last edit. Each chat is limited
+    to `chat_rate` calls per second after a burst of `chat_burst`, all chats
+    together by `limiter`, by default the bot-wide TELEGRAM_LIMITER that the
+    reminders share, and a 429 pauses the chat and that limiter for
+    `retry_after` before the call is retried.
+
+    Every method returns a Future of the API result; merged calls share the
+    result of the message they were merged into.
+    """
+
+    def __init__(self, bot_instance, workers=OUTBOX_WORKERS, limiter=TELEGRAM_LIMITER,
+                 chat_rate=OUTBOX_CHAT_RATE, chat_burst=OUTBOX_CHAT_BURST, max_retries=OUTBOX_MAX_RETRIES):
+        self.bot = bot_instance
+        self.limiter = limiter
+        self.chat_rate = float(chat_rate)
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="outbox")
+        self._lanes = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher = None
+        self.calls = 0
+        self.coalesced = 0
+
+    def send(self, chat_id, text, reply_markup=None, merge=True, **kwargs):
+        """
+        Queues `bot.send_message`. Pass `merge=False` for a message that
+        will be edited later (a placeholder), so nothing is merged into it.
+        """
+        kwargs['reply_markup'] = reply_markup
+        return self._put(_Op('send_message', chat_id, text, kwargs=kwargs, merge=merge))
+
+    def edit(self, chat_id, message, text, reply_markup=None, **kwargs):
+        """
+        Queues `bot.edit_message_text`. `message` is a message id or the
+        Future returned by `send` for that message.
+        """
+        kwargs['reply_markup'] = reply_markup
+        return self._put(_Op('edit_message_text', chat_id, text, target=message, kwargs=kwargs))
+
+    def chat_action(self, chat_id, action="typing"):
+        return self._put(_Op('send_chat_action', chat_id, action))
+
+    def _put(self, op):
+        future = op.futures[0]
+        with self._cond:
+            self._ensure_started()
+            lane = self._lanes.get(op.chat_id)
+            if lane is None:
+                lane = self._lanes[op.chat_id] = _Lane(self.chat_burst, time.monotonic())
+            if lane.ops and _coalesce(lane.ops[-1], op):
+                self.coalesced += 1
+                return future
+            lane.ops.append(op)
+            if len(lane.ops) == 1 and not lane.busy:
+                self._schedule(op.chat_id, lane)
+        return future
+
+    def _schedule(self, chat_id, lane):
+        heapq.heappush(self._heap, (lane.not_before, next(self._seq), chat_id))
+        self._cond.notify_all()
+
+    def _ensure_started(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="outbox-dispatch", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                if not self._heap:
+                    self._prune_idle_lanes(now)
+                    self._cond.wait(60)
+                    continue
+                when, _, chat_id = self._heap[0]
+                if when > now:
+                    self._cond.wait(when - now)
+                    continue
+                heapq.heappop(self._heap)
+                lane = self._lanes[chat_id]
+                op = lane.ops.popleft()
+                lane.busy = True
+                self._charge(lane, now)
+            self.limiter.acquire()
+            self._pool.submit(self._execute, lane, op)
+
+    def _charge(self, lane, now):
+        lane.tokens = min(self.chat_burst, lane.tokens + (now - lane.updated) * self.chat_rate) - 1
+        lane.updated = now
+        lane.not_before = now + max(0.0, (1 - lane.tokens) / self.chat_rate)
+
+    def _prune_idle_lanes(self, now):
+        refill = self.chat_burst / self.chat_rate
+        for chat_id in [c for c, lane in self._lanes.items()
+                        if not lane.ops and not lane.busy and now - lane.updated > refill]:
+            del self._lanes[chat_id]
+
+    def _call(self, op):
+        if op.method == 'send_message':
+            return self.bot.send_message(op.chat_id, op.text, **op.kwargs)
+        if op.method == 'edit_message_text':
+            return self.bot.edit_message_text(op.text, chat_id=op.chat_id, message_id=_message_id(op.target),
+                                              **op.kwargs)
+        return self.bot.send_chat_action(op.chat_id, op.text)
+
+    def _execute(self, lane, op):
+        try:
+            result = self._call(op)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None and op.attempts < self.max_retries:
+                op.attempts += 1
+                logging.warning(f"Rate limited in chat {op.chat_id}, retrying {op.method} in {retry_after}s")
+                self.limiter.pause(retry_after)
+                with self._cond:
+                    lane.ops.appendleft(op)
+                    lane.not_before = max(lane.not_before, time.monotonic() + retry_after)
+                    self._release(op.chat_id, lane)
+                return
+            logging.error(f"Failed to {op.method} in chat {op.chat_id}: {e}")
+            for future in op.futures:
+                future.set_exception(e)
+        else:
+            for future in op.futures:
+                future.set_result(result)
+        with self._cond:
+            self.calls += 1
+            self._release(op.chat_id, lane)
+
+    def _release(self, chat_id, lane):
+        lane.busy = False
+        if lane.ops:
+            self._schedule(chat_id, lane)
+        else:
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return sum(len(lane.ops) + lane.busy for lane in self._lanes.values())
+
+    def flush(self, timeout=None):
+        """
+        Waits until everything queued so far has been sent. Returns False on
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while any(lane.ops or lane.busy for lane in self._lanes.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+
+use_keep_alive_session(OUTBOX_WORKERS * 2)
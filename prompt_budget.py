@@ -0,0 +1,188 @@
+import functools
+import math
+import re
+import threading
+import logging
+from collections import namedtuple
+
+from config import LLM_TASKS
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+TRUNCATION_MARK = " […]"
+HISTORY_HEADER = "Conversation so far:\n"
+SUMMARY_PREFIX = "Earlier: "
+# Below this many tokens a summary of dropped turns would say nothing useful.
+MIN_SUMMARY_TOKENS = 20
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s')
+
+# A prompt ready to send, its size in tokens, and whether anything was cut.
+Prompt = namedtuple('Prompt', ['text', 'tokens', 'truncated'])
+
+
+def task_settings(task):
+    return dict(LLM_TASKS["default"], **LLM_TASKS.get(task, {}))
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _estimate(text):
+    # Without tiktoken: about 4 characters per token for ASCII text and 2 for
+    # Cyrillic and other scripts, which err on the high side for chat models.
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+
+def count_tokens(text, model=None):
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding(model or LLM_TASKS["default"]["model"]).encode(text))
+    return _estimate(text)
+
+
+def truncate(text, budget, model=None):
+    """
+    Cuts `text` to at most `budget` tokens, at a word boundary where there
+    is one near the end, and marks the cut. Returns (text, truncated).
+    """
+    if count_tokens(text, model) <= budget:
+        return text, False
+    budget -= count_tokens(TRUNCATION_MARK, model)
+    if budget <= 0:
+        return "", True
+    if tiktoken is not None:
+        encoding = _encoding(model or LLM_TASKS["default"]["model"])
+        head = encoding.decode(encoding.encode(text)[:budget])
+    else:
+        # Longest prefix within the budget; the estimate grows with length.
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if _estimate(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        head = text[:low]
+    space = head.rfind(' ', len(head) * 9 // 10)
+    if space > 0:
+        head = head[:space]
+    return head.rstrip() + TRUNCATION_MARK, True
+
+
+def _render_turn(turn):
+    role = "Assistant" if turn.get('role') == 'assistant' else "User"
+    return f"{role}: {turn.get('content', '')}\n"
+
+
+def _first_sentence(text, limit=120):
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+
+def fit_history(turns, budget, model=None):
+    """
+    Renders as many of the most recent `turns` ({"role", "content"} dicts)
+    as fit in `budget` tokens. Older turns that do not fit are replaced by a
+    one-line summary made of their first sentences, if there is room for
+    one. Returns (text, dropped_any).
+    """
+    budget -= count_tokens(HISTORY_HEADER, model)
+    kept = []
+    for turn in reversed(turns):
+        rendered = _render_turn(turn)
+        tokens = count_tokens(rendered, model)
+        if tokens > budget:
+            break
+        kept.append(rendered)
+        budget -= tokens
+    dropped = turns[:len(turns) - len(kept)]
+    if not kept and not dropped:
+        return "", False
+    summary = ""
+    if dropped and budget >= MIN_SUMMARY_TOKENS:
+        points = "; ".join(_first_sentence(turn.get('content', '')) for turn in dropped)
+        summary, _ = truncate(SUMMARY_PREFIX + points, budget - 1, model)
+        summary += "\n"
+    if not kept and not summary:
+        return "", bool(dropped)
+    return HISTORY_HEADER + summary + "".join(reversed(kept)) + "\n", bool(dropped)
+
+
+def build_prompt(task, template, text="", history=None):
+    """
+    Fills the `{text}` slot of `template` with the user's input and puts
+    the conversation `history` in front, keeping the whole prompt within the
+    task's max_input_tokens: the input is cut first to what the template
+    leaves, and history gets whatever remains after it.
+    """
+    settings = task_settings(task)
+    model = settings["model"]
+    budget = settings["max_input_tokens"]
+    left = budget - count_tokens(template.replace("{text}", ""), model)
+    text, truncated = truncate(text or "", max(left, 0), model)
+    left -= count_tokens(text, model)
+    history_text = ""
+    if history:
+        history_text, dropped = fit_history(history, max(left, 0), model)
+        truncated = truncated or dropped
+    prompt = history_text + template.replace("{text}", text)
+    tokens = count_tokens(prompt, model)
+    if truncated:
+        logging.info(f"Compacted {task} prompt to {tokens} tokens (budget {budget})")
+    if tokens > budget:
+        logging.warning(f"{task} prompt template alone needs {tokens} tokens, over its budget of {budget}")
+    return Prompt(prompt, tokens, truncated)
+
+
+class TokenUsage:
+    """
+    Tokens sent and received per (task, model). Counts come from the API's
+    `usage` field when the answer has one and are estimated with
+    count_tokens otherwise (streamed answers).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    def record(self, task, model, prompt_tokens, completion_tokens):
+        with self._lock:
+            usage = self._usage.get((task, model))
+            if usage is None:
+                usage = self._usage[(task, model)] = {
+                    'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                    'max_prompt_tokens': 0, 'max_completion_tokens': 0
+                }
+            usage['calls'] += 1
+            usage['prompt_tokens'] += prompt_tokens
+            usage['completion_tokens'] += completion_tokens
+            usage['max_prompt_tokens'] = max(usage['max_prompt_tokens'], prompt_tokens)
+            usage['max_completion_tokens'] = max(usage['max_completion_tokens'], completion_tokens)
+        logging.debug(f"LLM {task} call on {model}: {prompt_tokens} prompt + {completion_tokens} completion tokens")
+
+    def record_response(self, task, model, prompt, content, usage=None):
+        """
+        Records one call from the API's `usage` dict, or by counting.
+        """
+        if usage:
+            self.record(task, model, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        else:
+            self.record(task, model, count_tokens(prompt, model), count_tokens(content, model))
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(usage) for key, usage in self._usage.items()}
+
+
+USAGE = TokenUsage()
@@ -0,0 +1,98 @@
+import logging
+
+
+def command_name(text):
+    """
+    Returns "start" for "/start", "/start@LingoBot" or "/start payload",
+    or None if the text is not a command.
+    """
+    if not text or not text.startswith('/'):
+        return None
+    parts = text[1:].split(maxsplit=1)
+    return parts[0].split('@', 1)[0] if parts else None
+
+
+class Router:
+    """
+    Table-driven dispatch for incoming messages and callback queries.
+
+    A message is routed by dict lookups only: a command, else a button label
+    registered for the user's current state, else a button label valid in any
+    state, else the handler of the user's current state. Callback queries are
+    routed by their exact `data`. The cost per update therefore does not grow
+    with the number of states, languages or buttons.
+
+    With `observe`, handlers are called as `observe(handler, update)` so
+    they can be timed or profiled in one place.
+    """
+
+    def __init__(self, observe=None):
+        self.observe = observe
+        self.commands = {}
+        self.states = {}
+        self.buttons = {}
+        self.callbacks = {}
+
+    def command(self, *names):
+        def decorator(fn):
+            for name in names:
+                self.commands[name] = fn
+            return fn
+        return decorator
+
+    def state(self, state):
+        def decorator(fn):
+            self.states[state] = fn
+            return fn
+        return decorator
+
+    def button(self, *labels, state=None):
+        """
+        Registers `fn` for every label in `labels`. With `state`, the labels
+        only match while the user is in that state.
+        """
+        def decorator(fn):
+            table = self.buttons.setdefault(state, {})
+            for label in labels:
+                table[label] = fn
+            return fn
+        return decorator
+
+    def callback(self, *data):
+        def decorator(fn):
+            for value in data:
+                self.callbacks[value] = fn
+            return fn
+        return decorator
+
+    def resolve_message(self, text, state):
+        name = command_name(text)
+        if name is not None:
+            handler = self.commands.get(name)
+            if handler is not None:
+                return handler
+        if text is not None:
+            scoped = self.buttons.get(state)
+            handler = scoped.get(text) if scoped else None
+            if handler is None and None in self.buttons:
+                handler = self.buttons[None].get(text)
+            if handler is not None:
+                return handler
+        return self.states.get(state)
+
+    def dispatch_message(self, message, state):
+        handler = self.resolve_message(message.text, state)
+        if handler is None:
+            logging.debug(f"No route for message from {message.from_user.id} in state {state}")
+            return None
+        return self._call(handler, message)
+
+    def dispatch_callback(self, call):
+        handler = self.callbacks.get(call.data)
+        if handler is None:
+            logging.debug(f"No route for callback {call.data!r} from {call.from_user.id}")
+            return None
+        return self._call(handler, call)
+
+    def _call(self, handler, update):
+        return handler(update) if self.observe is None else self.observe(handler, update)
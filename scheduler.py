@@ -1,50 +1,246 @@
-import schedule
+import atexit
+import datetime
+import heapq
 import time
 import threading
 import logging
-from data_manager import read_user_data
-from messages import escape_markdown_v2
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-
-def send_daily_notifications(bot_instance):
-    users = read_user_data()
-
-    for user_id, user_info in users.items():
-        user_language = user_info.get("language", "English")
-
-        reminder_messages = {
-            "English": "🌟 Time to improve your English! Let's learn together! 🚀",
-            "Russian": "🌟 Время улучшать ваш английский! Давайте учиться вместе! 🚀",
-            "Kazakh": "🌟 Ағылшын тіліңізді жетілдіретін уақыт келді! Бірге оқиық! 🚀",
-            "Uzbek": "🌟 Ingliz tilingizni yaxshilash vaqti keldi! Keling, birga o‘rganamiz! 🚀",
-            "Kyrgyz": "🌟 Англис тилин жакшыртуу убактысы келди! Келгиле, бирге окуйлу! 🚀"
-        }
-
-        message_text = reminder_messages.get(user_language, reminder_messages["English"])
-        lesson_keyboard = InlineKeyboardMarkup()
-        lesson_keyboard.add(
-            InlineKeyboardButton("🎧 Listening", callback_data="start_listening"),
-            InlineKeyboardButton("📖 Reading", callback_data="start_reading"),
-            InlineKeyboardButton("📝 ESSAY practice", callback_data="start_vocab")
-        )
-
-        try:
-            bot_instance.send_message(user_id, escape_markdown_v2(message_text), reply_markup=lesson_keyboard)
-            logging.info(f"Sent daily lesson reminder to {user_id}")
-        except Exception as e:
-            logging.error(f"Failed to send notification to {user_id}: {e}")
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from broadcast import BroadcastEngine, DeliveryLog
+from config import (
+    DEFAULT_TIMEZONE, NOTIFY_HOUR, NOTIFY_SPREAD_MINUTES, NOTIFY_CATCH_UP_HOURS, REMINDER_LOG_FILE,
+    REMINDER_LOG_SAVE_INTERVAL, BROADCAST_RATE, BROADCAST_WORKERS
+)
+from data_manager import read_user_data, get_user
+from localization import CATALOG, keyboard
+
+def user_timezone(user_info):
+    try:
+        return ZoneInfo(user_info.get("timezone") or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def parse_timezone(name):
+    """
+    The canonical name of an IANA timezone such as "Europe/Moscow".
+    Raises ValueError for an unknown one.
+    """
+    try:
+        return ZoneInfo(name).key
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Unknown timezone: {name}") from e
 
 
-def schedule_notifications(bot_instance):
+def notify_hour(user_info):
+    try:
+        return int(user_info.get("notify_hour")) % 24
+    except (TypeError, ValueError):
+        return NOTIFY_HOUR
+
+
+def reminder_settings(user_info):
+    """
+    The user's reminder hour and timezone name, defaults filled in.
     """
-    Schedule daily notifications at 14:00.
+    return {'hour': notify_hour(user_info), 'timezone': user_timezone(user_info).key}
+
+
+def _delivery_times(user_id, user_info, now=None):
+    # The user's reminder time on the local day of `now` and the days around it.
+    tz = user_timezone(user_info)
+    hour = notify_hour(user_info)
+    offset = datetime.timedelta(minutes=zlib.crc32(str(user_id).encode()) % NOTIFY_SPREAD_MINUTES)
+    local_now = (now or datetime.datetime.now(tz)).astimezone(tz)
+    due = local_now.replace(hour=hour, minute=0, second=0, microsecond=0) + offset
+    yesterday = (local_now - datetime.timedelta(days=1)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    tomorrow = (local_now + datetime.timedelta(days=1)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return local_now, yesterday + offset, due, tomorrow + offset
+
+
+def next_delivery_time(user_id, user_info, now=None):
+    """
+    Next reminder time for a user as a UTC timestamp: their preferred local
+    hour (NOTIFY_HOUR by default) plus a stable per-user offset of up to
+    NOTIFY_SPREAD_MINUTES, so users sharing an hour are not all sent at once.
+    """
+    local_now, _, due, tomorrow = _delivery_times(user_id, user_info, now)
+    return (due if due > local_now else tomorrow).timestamp()
+
+
+def last_delivery_time(user_id, user_info, now=None):
+    """
+    The user's most recent reminder time up to now, as a UTC timestamp.
+    """
+    local_now, yesterday, due, _ = _delivery_times(user_id, user_info, now)
+    return (due if due <= local_now else yesterday).timestamp()
+
+
+class NotificationScheduler:
+    """
+    Delivers each user's daily reminder at their own local time.
+
+    Due times live in a min-heap of (timestamp, user_id). The thread sleeps
+    until the earliest one is due (or a registration wakes it), sends what is
+    due through the rate-limited broadcast engine and schedules each user's
+    next day. `_due` holds the current time per user; heap entries that no
+    longer match it are stale and skipped, which keeps `register` idempotent.
+
+    Deliveries are counted per UTC day; when the day changes the previous
+    day's sent/failed/retried counts and throughput are logged.
+
+    Each delivery is recorded in `delivery_log`. On start, users whose
+    reminder fell due within the last `catch_up` seconds without being sent,
+    e.g. while the bot was down, are sent it right away.
     """
-    schedule.every().day.at("14:00").do(send_daily_notifications, bot_instance)
 
-    def run_schedule():
+    def __init__(self, bot_instance, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS, delivery_log=None,
+                 catch_up=NOTIFY_CATCH_UP_HOURS * 3600):
+        self.engine = BroadcastEngine(bot_instance, rate=rate)
+        self.log = delivery_log or DeliveryLog(REMINDER_LOG_FILE, REMINDER_LOG_SAVE_INTERVAL)
+        self.catch_up = catch_up
+        self._heap = []
+        self._due = {}
+        self._cond = threading.Condition()
+        self._senders = ThreadPoolExecutor(workers, thread_name_prefix="reminder")
+        self._thread = None
+        self._totals = {'sent': 0, 'failed': 0, 'retried': 0}
+        self._day = None
+        self._stats = None
+
+    def register(self, user_id, user_info=None, due=None):
+        """
+        Schedules the user's next reminder, or at timestamp `due` if given.
+        """
+        user_info = user_info if user_info is not None else get_user(user_id)
+        due = due if due is not None else next_delivery_time(user_id, user_info)
+        with self._cond:
+            if self._due.get(user_id) == due:
+                return
+            self._due[user_id] = due
+            heapq.heappush(self._heap, (due, user_id))
+            if self._heap[0][1] == user_id:
+                self._cond.notify()
+
+    def unregister(self, user_id):
+        with self._cond:
+            self._due.pop(user_id, None)
+        self.log.forget(user_id)
+
+    def _missed(self, user_id, user_info, now):
+        due = last_delivery_time(user_id, user_info)
+        return now - due <= self.catch_up and due > max(self.log.since, self.log.last_sent(user_id))
+
+    def start(self):
+        now = time.time()
+        missed = 0
+        for user_id, user_info in read_user_data().items():
+            if self._missed(user_id, user_info, now):
+                self.register(user_id, user_info, due=now)
+                missed += 1
+            else:
+                self.register(user_id, user_info)
+        self._thread = threading.Thread(target=self._run, name="notification-scheduler", daemon=True)
+        self._thread.start()
+        logging.info(f"Scheduled daily reminders for {len(self._due)} users, {missed} missed ones due now")
+
+    def _pop_due(self):
+        with self._cond:
+            while True:
+                while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, user_id = self._heap[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._heap)
+                del self._due[user_id]
+                return user_id
+
+    def _run(self):
         while True:
-            schedule.run_pending()
-            time.sleep(60)
+            user_id = self._pop_due()
+            self._senders.submit(self._deliver, user_id)
+
+    def _day_stats(self):
+        # The counters engine.send and _deliver update for the current day.
+        with self._cond:
+            day = datetime.datetime.now(datetime.timezone.utc).date()
+            if day != self._day:
+                previous, self._stats = self._stats, {'sent': 0, 'failed': 0, 'retried': 0,
+                                                      'first': None, 'last': None, 'lock': threading.Lock()}
+                if previous is not None:
+                    for key in self._totals:
+                        self._totals[key] += previous[key]
+                    self._log_report(self._day, previous)
+                self._day = day
+            return self._stats
+
+    def _log_report(self, day, stats):
+        with stats['lock']:
+            report = {key: stats[key] for key in ('sent', 'failed', 'retried')}
+            elapsed = (stats['last'] or 0) - (stats['first'] or 0)
+        report['throughput'] = round(report['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+        logging.info(f"Daily reminders on {day}: {report}")
+
+    def stats(self):
+        """
+        Reminders sent, failed and retried (after a 429) since startup.
+        """
+        stats = self._day_stats()
+        with stats['lock']:
+            return {key: total + stats[key] for key, total in self._totals.items()}
+
+    def _deliver(self, user_id):
+        user_info = get_user(user_id)
+        if not user_info:
+            return
+        stats = self._day_stats()
+        language = user_info.get("language", "English")
+        started = time.monotonic()
+        ok = self.engine.send(user_id, CATALOG.md("daily_reminder", language), keyboard("lesson_reminder", language),
+                              stats)
+        if ok:
+            self.log.mark_sent(user_id)
+            logging.info(f"Sent daily lesson reminder to {user_id}")
+        with stats['lock']:
+            stats['sent' if ok else 'failed'] += 1
+            stats['first'] = started if stats['first'] is None else stats['first']
+            stats['last'] = time.monotonic()
+        self.register(user_id, user_info)
+
+    def close(self):
+        self.log.save()
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def schedule_notifications(bot_instance, rate=BROADCAST_RATE):
+    """
+    Starts the per-user reminder scheduler, sending at most `rate` reminders
+    per second. Safe to call more than once: later calls return the running
+    scheduler.
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = NotificationScheduler(bot_instance, rate=rate)
+            _SCHEDULER.start()
+            atexit.register(_SCHEDULER.close)
+        return _SCHEDULER
+
+
+def reminder_stats():
+    return _SCHEDULER.stats() if _SCHEDULER is not None else {}
+
 
-    t = threading.Thread(target=run_schedule, daemon=True)
-    t.start()
+def register_user_notifications(user_id):
+    if _SCHEDULER is not None:
+        _SCHEDULER.register(user_id)
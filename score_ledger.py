@@ -0,0 +1,286 @@
+import csv
+import os
+import random
+import threading
+import time
+import logging
+
+from config import SCORE_LEDGER_FILE, SCORE_COMPACT_EVERY
+from file_io import file_lock, read_csv_rows
+from user_store import USER_STORE
+
+LEDGER_FIELDS = ['user_id', 'points', 'score', 'time']
+MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+# Sorts after every real key, so searches need no end-of-list checks.
+_END = _Node((float('inf'),), 0)
+
+
+class RankedSkipList:
+    """
+    Sorted keys with positions: a skip list whose links also store how many
+    keys they jump over, so insert, remove, `count_below` and finding the
+    key at a position are all O(log N), and `slice` is O(log N + k).
+    """
+
+    def __init__(self, keys=()):
+        self._head = _Node(None, MAX_LEVEL)
+        self._head.next = [_END] * MAX_LEVEL
+        self._size = 0
+        # Levels above the tallest node only link the head to the end.
+        self._height = 1
+        self._build(sorted(keys))
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _random_height():
+        height = 1
+        while height < MAX_LEVEL and random.random() < 0.5:
+            height += 1
+        return height
+
+    def _build(self, keys):
+        # Links sorted keys in one pass, much faster than inserting them.
+        last = [self._head] * MAX_LEVEL
+        last_positions = [0] * MAX_LEVEL
+        for position, key in enumerate(keys, 1):
+            height = self._random_height()
+            self._height = max(self._height, height)
+            node = _Node(key, height)
+            for level in range(height):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_positions[level]
+                last[level] = node
+                last_positions[level] = position
+        self._size = len(keys)
+        for level in range(MAX_LEVEL):
+            last[level].next[level] = _END
+            last[level].width[level] = self._size + 1 - last_positions[level]
+
+    def _path(self, key):
+        # The last node before `key` on every level, and its position.
+        chain = [self._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(self._height)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._path(key)
+        height = self._random_height()
+        self._height = max(self._height, height)
+        node = _Node(key, height)
+        position = positions[0] + 1
+        for level in range(height):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - (position - positions[level]) + 1
+            previous.width[level] = position - positions[level]
+        for level in range(height, MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def count_below(self, key):
+        """
+        How many keys sort before `key`.
+        """
+        return self._path(key)[1][0]
+
+    def slice(self, start, count):
+        """
+        Up to `count` keys from position `start` (0-based) on.
+        """
+        if start >= self._size:
+            return []
+        node, remaining = self._head, start + 1
+        for level in reversed(range(self._height)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not _END and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+def _key(user_id, score):
+    # Highest score first, ties by user_id so every key is unique.
+    return (-score, user_id)
+
+
+class ScoreLedger:
+    """
+    Users' scores as an append-only ledger plus a ranking index.
+
+    Awarding points appends one row (user_id, points, new total) to the
+    ledger file instead of rewriting the users file, and moves the user in a
+    RankedSkipList of users with points, so a score update, a user's rank
+    and the top k are O(log N) (plus k). Ledger rows carry the total, so
+    replaying them is idempotent. After `compact_every` rows the totals are
+    written into the user store's `score` field, flushed, and the ledger is
+    truncated; on load the ledger is replayed over those scores.
+    """
+
+    def __init__(self, store, path, compact_every):
+        self.store = store
+        self.path = path
+        self.compact_every = compact_every
+        self._scores = None
+        self._index = RankedSkipList()
+        self._changed = set()
+        self._ledger_size = 0
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._scores is not None:
+            return
+        scores = {user_id: int(user.get('score') or 0) for user_id, user in self.store.all().items()}
+        with file_lock(self.path).read():
+            rows = read_csv_rows(self.path)
+        for row in rows:
+            try:
+                user_id, score = int(row['user_id']), int(row['score'])
+            except (TypeError, ValueError):
+                # A crash during an append can leave a torn last line.
+                logging.warning(f"Skipping malformed score ledger row in {self.path}: {row}")
+                continue
+            scores[user_id] = score
+            self._changed.add(user_id)
+        self._index = RankedSkipList(_key(user_id, score) for user_id, score in scores.items() if score > 0)
+        self._ledger_size = len(rows)
+        self._scores = scores
+        logging.info(f"Loaded scores of {len(scores)} users ({len(rows)} ledger records)")
+
+    def _set(self, user_id, points, score):
+        previous = self._scores.get(user_id, 0)
+        if previous > 0:
+            self._index.remove(_key(user_id, previous))
+        if score > 0:
+            self._index.insert(_key(user_id, score))
+        self._scores[user_id] = score
+        self._changed.add(user_id)
+        self._append({'user_id': user_id, 'points': points, 'score': score, 'time': int(time.time())})
+        return score
+
+    def _append(self, row):
+        with file_lock(self.path).write():
+            write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=LEDGER_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerow(row)
+                file.flush()
+                os.fsync(file.fileno())
+        self._ledger_size += 1
+        if self._ledger_size >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        # Scores reach the users file before the ledger is dropped; replaying
+        # a ledger over already-compacted scores is harmless.
+        for user_id in self._changed:
+            if self.store.get(user_id) is not None:
+                self.store.update(user_id, score=self._scores.get(user_id, 0))
+        self.store.flush()
+        with file_lock(self.path).write():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        logging.debug(f"Compacted {self._ledger_size} score ledger records into the user store")
+        self._changed = set()
+        self._ledger_size = 0
+
+    def add(self, user_id, points):
+        """
+        Awards `points` (may be negative; scores do not go below 0).
+        Returns the new score.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            score = max(0, self._scores.get(user_id, 0) + points)
+            return self._set(user_id, points, score)
+
+    def set(self, user_id, score):
+        with self._lock:
+            self._ensure_loaded()
+            score = max(0, int(score))
+            return self._set(user_id, score - self._scores.get(user_id, 0), score)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            if self._scores.get(user_id, 0) > 0:
+                self._set(user_id, -self._scores[user_id], 0)
+            self._scores.pop(user_id, None)
+
+    def score(self, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._scores.get(user_id, 0)
+
+    def rank(self, user_id):
+        """
+        (rank, players) for a user with points, where rank is 1 plus the
+        number of users with a higher score, so tied users share a rank;
+        None for a user without points.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            score = self._scores.get(user_id, 0)
+            if score <= 0:
+                return None
+            # Every key with a higher score sorts before (-score, anything).
+            return self._index.count_below((-score, float('-inf'))) + 1, len(self._index)
+
+    def top(self, k):
+        """
+        [(user_id, score)] of the k highest scores, best first.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return [(user_id, -negative) for negative, user_id in self._index.slice(0, k)]
+
+    def compact(self):
+        """
+        Writes the ledger's scores into the user store, loading the ledger
+        first if this process has not read it yet.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._ledger_size:
+                self._compact()
+
+
+SCORES = ScoreLedger(USER_STORE, SCORE_LEDGER_FILE, SCORE_COMPACT_EVERY)
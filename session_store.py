@@ -0,0 +1,268 @@
+import atexit
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+import logging
+
+from config import SESSION_MAX_ENTRIES, SESSION_IDLE_TTL, SESSION_SNAPSHOT_FILE, SESSION_SNAPSHOT_INTERVAL
+from file_io import atomic_write
+
+
+class Session:
+    """
+    Conversation state of one user: the onboarding step and the paragraph
+    the assessment flow remembers between messages.
+    """
+    __slots__ = ('state', 'paragraph', 'last_seen')
+
+    FIELDS = ('state', 'paragraph')
+
+    def __init__(self, last_seen):
+        self.state = None
+        self.paragraph = None
+        self.last_seen = last_seen
+
+    def to_dict(self, user_id):
+        data = {'user_id': user_id, 'last_seen': self.last_seen}
+        for field in self.FIELDS:
+            data[field] = getattr(self, field)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data.get('last_seen') or time.time())
+        for field in cls.FIELDS:
+            setattr(session, field, data.get(field))
+        return session
+
+
+def _deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif isinstance(obj, Session):
+        size += sum(_deep_size(getattr(obj, slot), seen) for slot in Session.__slots__)
+    return size
+
+
+class SessionStore:
+    """
+    Bounded map of user_id -> Session.
+
+    Sessions are small slotted records in a plain dict. An access only
+    looks the session up and stamps its last activity, to the second, so
+    sessions active in the same second share one timestamp object. Sessions
+    idle for longer than `idle_ttl` seconds are dropped when looked up and
+    by a sweep every `snapshot_interval` seconds. When more than
+    `max_entries` are held, the least recently active tenth is dropped at
+    once, which spreads the cost of finding them over many new sessions.
+    With `snapshot_file`, sessions are written there periodically and on
+    exit, and loaded back on first access, so a restart resumes users in
+    the middle of a flow.
+    """
+
+    def __init__(self, max_entries, idle_ttl, snapshot_file=None, snapshot_interval=30):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self._sessions = None
+        self._clock = 0.0
+        self._lock = threading.Lock()
+        self._changed = False
+        self._stopped = False
+        self._wakeup = threading.Event()
+        self._saver = None
+        self.evicted = 0
+        self.expired = 0
+
+    def _ensure_loaded(self):
+        if self._sessions is None:
+            with self._lock:
+                if self._sessions is None:
+                    self._sessions = self._load()
+                    self._start_saver()
+
+    def _load(self):
+        sessions = {}
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return sessions
+        try:
+            with open(self.snapshot_file, encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable session snapshot {self.snapshot_file}: {e}")
+            return sessions
+        cutoff = time.time() - self.idle_ttl
+        recent = sorted((data for data in saved.get('sessions', []) if data.get('last_seen', 0) > cutoff),
+                        key=lambda data: data['last_seen'])
+        for data in recent[-self.max_entries:] if self.max_entries else []:
+            sessions[data['user_id']] = Session.from_dict(data)
+        logging.info(f"Restored {len(sessions)} sessions from {self.snapshot_file}")
+        return sessions
+
+    def _start_saver(self):
+        if self._saver is None and self.snapshot_interval > 0:
+            self._saver = threading.Thread(target=self._save_loop, name="session-snapshot", daemon=True)
+            self._saver.start()
+
+    def _save_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.snapshot_interval)
+            self._wakeup.clear()
+            try:
+                self.evict_expired()
+                self.snapshot()
+            except Exception as e:
+                logging.error(f"Failed to snapshot sessions: {e}")
+
+    def _now(self):
+        now = time.time()
+        if now - self._clock >= 1:
+            self._clock = now
+        return self._clock
+
+    def _expire(self, now):
+        # Called with the lock held.
+        stale = [user_id for user_id, session in self._sessions.items() if now - session.last_seen > self.idle_ttl]
+        for user_id in stale:
+            del self._sessions[user_id]
+        self.expired += len(stale)
+        self._changed = self._changed or bool(stale)
+
+    def _evict(self, now):
+        # Called with the lock held, once there are more than max_entries.
+        self._expire(now)
+        excess = len(self._sessions) - self.max_entries
+        if excess <= 0:
+            return
+        excess += self.max_entries // 10
+        oldest = heapq.nsmallest(excess, self._sessions.items(), key=lambda item: item[1].last_seen)
+        for user_id, _ in oldest:
+            del self._sessions[user_id]
+        self.evicted += len(oldest)
+        self._changed = True
+
+    def get(self, user_id):
+        """
+        Returns the user's session, or None if there is none (or it expired).
+        """
+        self._ensure_loaded()
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        now = self._now()
+        if now - session.last_seen > self.idle_ttl:
+            with self._lock:
+                if self._sessions.get(user_id) is session:
+                    del self._sessions[user_id]
+                    self.expired += 1
+                    self._changed = True
+            return None
+        if session.last_seen != now:
+            # Snapshots must carry it, or a restart expires and evicts by
+            # stale activity times.
+            session.last_seen = now
+            self._changed = True
+        return session
+
+    def session(self, user_id):
+        """
+        Returns the user's session, starting a new one if needed. Fields set
+        on it are picked up by the next snapshot.
+        """
+        session = self.get(user_id)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(user_id)
+                if session is None:
+                    now = self._now()
+                    session = self._sessions[user_id] = Session(now)
+                    if len(self._sessions) > self.max_entries:
+                        self._evict(now)
+        self._changed = True
+        return session
+
+    def state(self, user_id):
+        session = self.get(user_id)
+        return session.state if session else None
+
+    def set_state(self, user_id, state):
+        self.session(user_id).state = state
+
+    def discard(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            if self._sessions.pop(user_id, None) is not None:
+                self._changed = True
+
+    def evict_expired(self):
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(time.time())
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._sessions)
+
+    def snapshot(self):
+        """
+        Writes all sessions to `snapshot_file` if anything changed since the
+        last snapshot.
+        """
+        if not self.snapshot_file or self._sessions is None:
+            return False
+        with self._lock:
+            if not self._changed:
+                return False
+            # Serialized under the lock: handlers may be mutating the fields.
+            count = len(self._sessions)
+            payload = json.dumps({'saved_at': time.time(),
+                                  'sessions': [session.to_dict(user_id)
+                                               for user_id, session in self._sessions.items()]},
+                                 ensure_ascii=False)
+            self._changed = False
+        try:
+            atomic_write(self.snapshot_file, lambda file: file.write(payload))
+        except Exception:
+            self._changed = True
+            raise
+        logging.debug(f"Saved {count} sessions to {self.snapshot_file}")
+        return True
+
+    def memory_footprint(self):
+        """
+        Approximate memory held by the sessions (records, their field values
+        and the index), plus counts of sessions dropped by each limit.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            seen = set()
+            size = sys.getsizeof(self._sessions)
+            size += sum(_deep_size(s, seen) + sys.getsizeof(uid) for uid, s in self._sessions.items())
+            count = len(self._sessions)
+        return {
+            'sessions': count,
+            'bytes': size,
+            'bytes_per_session': size // count if count else 0,
+            'max_entries': self.max_entries,
+            'evicted': self.evicted,
+            'expired': self.expired
+        }
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.snapshot()
+
+
+SESSIONS = SessionStore(SESSION_MAX_ENTRIES, SESSION_IDLE_TTL, SESSION_SNAPSHOT_FILE, SESSION_SNAPSHOT_INTERVAL)
+atexit.register(SESSIONS.close)
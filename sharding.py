@@ -0,0 +1,239 @@
+"""
+Multi-process mode: one front process receives updates and hands each to
+the worker process that owns its user.
+
+    python sharding.py --split      # once: split the data in this directory
+                                    # into SHARD_WORKERS shard directories
+
+Workers are started by bot_main.start_bot when SHARD_WORKERS > 1; each runs
+`python sharding.py --shard <n>` in SHARD_DIR/<n>.
+"""
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import zlib
+import logging
+
+from telebot import apihelper
+
+from config import (
+    SHARD_WORKERS, SHARD_DIR, SHARD_QUEUE_SIZE, STORAGE_BACKEND, SQLITE_DB_FILE,
+    USER_DATA_FILE, PLAN_DATA_FILE, PLAN_DATA_JOURNAL_FILE, ESSAY_TOPICS_FILE, ESSAY_TOPICS_JOURNAL_FILE
+)
+from webhook import update_chat_id
+
+SCRIPT = os.path.abspath(__file__)
+# Seconds Telegram holds a getUpdates request open when there is nothing new.
+POLL_TIMEOUT = 20
+RESTART_DELAY = 1
+
+
+def update_user_id(update):
+    """
+    The user an update comes from, or its chat for updates without a sender.
+    """
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return update_chat_id(update)
+
+
+def shard_of(user_id, shards):
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def shard_directory(shard):
+    return os.path.join(SHARD_DIR, str(shard))
+
+
+class _Shard:
+    """
+    One worker process and the updates waiting to be written to its stdin,
+    one JSON object per line. A worker that exits is restarted; updates it
+    had read but not handled yet are lost.
+    """
+
+    def __init__(self, index, queue_size):
+        self.index = index
+        self.directory = os.path.abspath(shard_directory(index))
+        self.queue = queue.Queue(queue_size)
+        self.process = None
+        self.stopping = False
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def ensure_running(self):
+        with self._lock:
+            if self.stopping or (self.process is not None and self.process.poll() is None):
+                return
+            if self.process is not None:
+                logging.error(f"Shard {self.index} worker exited with {self.process.returncode}, restarting")
+                time.sleep(RESTART_DELAY)
+            os.makedirs(self.directory, exist_ok=True)
+            self.process = subprocess.Popen([sys.executable, SCRIPT, "--shard", str(self.index)],
+                                            cwd=self.directory, stdin=subprocess.PIPE, encoding='utf-8')
+            logging.info(f"Started shard {self.index} worker (pid {self.process.pid}) in {self.directory}")
+
+    def start(self):
+        # One writer per shard keeps its updates in order.
+        if self._writer is not None:
+            return
+        self.ensure_running()
+        self._writer = threading.Thread(target=self._write_loop, name=f"shard-{self.index}-writer", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            update = self.queue.get()
+            if update is None:
+                self.process.stdin.close()
+                return
+            line = json.dumps(update) + "\n"
+            while True:
+                try:
+                    self.process.stdin.write(line)
+                    if self.queue.empty():
+                        self.process.stdin.flush()
+                    break
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not pass an update to shard {self.index}: {e}")
+                    self.ensure_running()
+
+    def stop(self, timeout):
+        self.stopping = True
+        self.queue.put(None)
+        self._writer.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logging.warning(f"Shard {self.index} worker did not exit in {timeout}s, killing it")
+            self.process.kill()
+
+
+class ShardDispatcher:
+    """
+    Runs `shards` bot worker processes and routes every update to the one
+    owning its user, chosen by a stable hash of the user id, so each user's
+    conversation is always handled by the same process. Every worker works
+    in its own directory under SHARD_DIR, with its own data files, sessions,
+    caches and reminder scheduler, and runs its own GIL.
+
+    Works as the `sink` of a WebhookServer: `put` returns False without
+    waiting when that worker already has `queue_size` updates queued.
+    """
+
+    def __init__(self, shards=SHARD_WORKERS, queue_size=SHARD_QUEUE_SIZE):
+        self.shards = [_Shard(index, queue_size) for index in range(shards)]
+        self._monitor = None
+
+    def put(self, update, block=False):
+        shard = self.shards[shard_of(update_user_id(update), len(self.shards))]
+        try:
+            shard.queue.put(update, block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def start(self):
+        """
+        Starts the workers; later calls do nothing, so a WebhookServer may
+        start an already running dispatcher.
+        """
+        if self._monitor is not None:
+            return
+        for shard in self.shards:
+            shard.start()
+        # Restart crashed workers even while no updates arrive for them, so
+        # their reminders keep going out.
+        self._monitor = threading.Thread(target=self._watch, name="shard-monitor", daemon=True)
+        self._monitor.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(5)
+            for shard in self.shards:
+                shard.ensure_running()
+
+    def stop(self, timeout=60):
+        """
+        Lets every worker finish its queued updates and exit.
+        """
+        for shard in self.shards:
+            shard.stop(timeout)
+
+    def __len__(self):
+        return sum(shard.queue.qsize() for shard in self.shards)
+
+
+def poll_updates(token, dispatcher):
+    """
+    Front reader for polling mode: long-polls getUpdates and dispatches what
+    arrives, waiting while the target worker's queue is full.
+    """
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset=offset, timeout=POLL_TIMEOUT + 10,
+                                            long_polling_timeout=POLL_TIMEOUT)
+        except Exception as e:
+            logging.error(f"getUpdates failed: {e}")
+            time.sleep(3)
+            continue
+        for update in updates:
+            dispatcher.put(update, block=True)
+            offset = update['update_id'] + 1
+
+
+def _shard_storage(directory, backend):
+    from storage import CsvStorage, SqliteStorage
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(directory, SQLITE_DB_FILE))
+    return CsvStorage(*(os.path.join(directory, name) for name in
+                        (USER_DATA_FILE, PLAN_DATA_FILE, PLAN_DATA_JOURNAL_FILE,
+                         ESSAY_TOPICS_FILE, ESSAY_TOPICS_JOURNAL_FILE)))
+
+
+def split_storage(shards, backend=STORAGE_BACKEND):
+    """
+    One-shot migration of the users, plans and essay topics in the current
+    directory into `shards` shard directories. Returns the users per shard.
+    """
+    from score_ledger import SCORES
+    from storage import STORAGE
+    # Pending score ledger records go into the users' score column first.
+    SCORES.compact()
+    users = STORAGE.load_users()
+    plans = STORAGE.read_plans()
+    topics = STORAGE.read_essay_topics()
+    counts = []
+    for shard in range(shards):
+        directory = shard_directory(shard)
+        os.makedirs(directory, exist_ok=True)
+        target = _shard_storage(directory, backend)
+        owned = {user_id: user for user_id, user in users.items() if shard_of(user_id, shards) == shard}
+        target.save_users(owned, owned.keys())
+        target.write_plans({user_id: plan for user_id, plan in plans.items() if shard_of(user_id, shards) == shard})
+        target.write_essay_topics([topic for topic in topics if shard_of(topic['user_id'], shards) == shard])
+        counts.append(len(owned))
+    logging.info(f"Split {len(users)} users into {shards} shards: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shard", type=int, help="run as the worker of this shard, reading updates from stdin")
+    parser.add_argument("--split", action="store_true", help="split this directory's data into shards")
+    parser.add_argument("--shards", type=int, default=SHARD_WORKERS)
+    args = parser.parse_args()
+    if args.split:
+        print(f"Users per shard: {split_storage(args.shards)}")
+    elif args.shard is not None:
+        import bot_main
+        bot_main.run_shard_worker(args.shard, sys.stdin)
+    else:
+        parser.error("pass --shard or --split")
@@ -0,0 +1,325 @@
+import csv
+import os
+import sqlite3
+import threading
+import logging
+from config import (
+    STORAGE_BACKEND, SQLITE_DB_FILE,
+    USER_DATA_FILE, PLAN_DATA_FILE, PLAN_DATA_JOURNAL_FILE, PLAN_JOURNAL_COMPACT_EVERY,
+    ESSAY_TOPICS_FILE, ESSAY_TOPICS_JOURNAL_FILE, ESSAY_JOURNAL_COMPACT_EVERY
+)
+from essay_repository import EssayTopicRepository
+from file_io import atomic_write_csv, file_lock, read_csv_rows
+
+USER_FIELDS = ['user_id', 'language', 'english_level', 'name', 'age', 'score', 'timezone', 'notify_hour']
+PLAN_FIELDS = ['user_id', 'plan']
+
+
+class PlanRepository:
+    """
+    Study plans kept in memory. A new plan is appended to a journal next to
+    the base CSV instead of rewriting it, the last row for a user wins, and
+    once the journal reaches `compact_every` records it is folded back into
+    the base file and truncated, as EssayTopicRepository does.
+    """
+
+    def __init__(self, path, journal_path, compact_every):
+        self.path = path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self._plans = None
+        self._journal_size = 0
+        self._lock = threading.Lock()
+
+    def _read_rows(self, path):
+        with file_lock(path).read():
+            rows = read_csv_rows(path)
+        plans = []
+        for row in rows:
+            try:
+                plans.append((int(row['user_id']), row['plan']))
+            except (TypeError, ValueError):
+                # A crash during an append can leave a torn last line.
+                logging.warning(f"Skipping malformed plan row in {path}: {row}")
+        return plans
+
+    def _ensure_loaded(self):
+        if self._plans is not None:
+            return
+        plans = dict(self._read_rows(self.path))
+        journal = self._read_rows(self.journal_path)
+        plans.update(journal)
+        self._journal_size = len(journal)
+        self._plans = plans
+        logging.info(f"Loaded {len(plans)} plans ({len(journal)} journal records)")
+
+    def _append_journal(self, row):
+        with file_lock(self.journal_path).write():
+            write_header = not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0
+            with open(self.journal_path, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=PLAN_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerow(row)
+                file.flush()
+                os.fsync(file.fileno())
+        self._journal_size += 1
+        if self._journal_size >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        # The base file is replaced before the journal is dropped; replaying a
+        # journal over an already-compacted base is harmless.
+        with file_lock(self.path).write():
+            atomic_write_csv(self.path, PLAN_FIELDS,
+                             ({'user_id': uid, 'plan': plan} for uid, plan in self._plans.items()))
+        with file_lock(self.journal_path).write():
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        logging.debug(f"Compacted {self._journal_size} journal records into {self.path}")
+        self._journal_size = 0
+
+    def all(self):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._plans)
+
+    def replace_all(self, plans):
+        with self._lock:
+            self._plans = dict(plans)
+            self._compact()
+
+    def set(self, user_id, plan_text):
+        with self._lock:
+            self._ensure_loaded()
+            self._plans[user_id] = plan_text
+            self._append_journal({'user_id': user_id, 'plan': plan_text})
+
+    def compact(self):
+        with self._lock:
+            if self._plans is not None and self._journal_size:
+                self._compact()
+
+
+class CsvStorage:
+    """
+    Flat-file backend: users are a CSV file replaced atomically on change;
+    plans and essay topics go through journaled repositories.
+    """
+
+    def __init__(self, user_file, plan_file, plan_journal_file, essay_file, essay_journal_file):
+        self.user_file = user_file
+        self.plans = PlanRepository(plan_file, plan_journal_file, PLAN_JOURNAL_COMPACT_EVERY)
+        self.essays = EssayTopicRepository(essay_file, essay_journal_file, ESSAY_JOURNAL_COMPACT_EVERY)
+
+    def load_users(self):
+        users = {}
+        with file_lock(self.user_file).read():
+            rows = read_csv_rows(self.user_file)
+        for row in rows:
+            users[int(row['user_id'])] = {
+                'user_id': row['user_id'],
+                'language': row.get('language', ''),
+                'english_level': row.get('english_level', ''),
+                'name': row.get('name', ''),
+                'age': row.get('age', ''),
+                'score': int(row.get('score') or 0),
+                'timezone': row.get('timezone') or '',
+                'notify_hour': row.get('notify_hour') or ''
+            }
+        return users
+
+    def save_users(self, users, dirty_ids):
+        with file_lock(self.user_file).write():
+            atomic_write_csv(self.user_file, USER_FIELDS, users.values())
+
+    def read_plans(self):
+        return self.plans.all()
+
+    def write_plan(self, user_id, plan_text):
+        self.plans.set(user_id, plan_text)
+
+    def write_plans(self, plans):
+        self.plans.replace_all(plans)
+
+    def read_essay_topics(self):
+        return self.essays.all()
+
+    def write_essay_topics(self, topics):
+        self.essays.replace_all(topics)
+
+    def add_essay_topic(self, user_id, topic, status):
+        return self.essays.add(user_id, topic, status)
+
+    def get_user_essays(self, user_id, status):
+        return self.essays.find(user_id, status)
+
+    def update_essay_topic_status(self, essay_id, new_status):
+        self.essays.set_status(essay_id, new_status)
+
+
+class SqliteStorage:
+    """
+    SQLite backend in WAL mode. Each thread gets its own connection; the
+    statements below are constant strings so sqlite3 reuses their prepared
+    form from the per-connection statement cache.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        " user_id INTEGER PRIMARY KEY, language TEXT, english_level TEXT,"
+        " name TEXT, age TEXT, score INTEGER NOT NULL DEFAULT 0, timezone TEXT, notify_hour INTEGER)",
+        "CREATE TABLE IF NOT EXISTS plans (user_id INTEGER PRIMARY KEY, plan TEXT)",
+        "CREATE TABLE IF NOT EXISTS essay_topics ("
+        " essay_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,"
+        " topic TEXT, status TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_essay_topics_user_status ON essay_topics (user_id, status)",
+    )
+
+    UPSERT_USER = (
+        "INSERT INTO users (user_id, language, english_level, name, age, score, timezone, notify_hour) "
+        "VALUES (:user_id, :language, :english_level, :name, :age, :score, :timezone, :notify_hour) "
+        "ON CONFLICT(user_id) DO UPDATE SET language = excluded.language, "
+        "english_level = excluded.english_level, name = excluded.name, "
+        "age = excluded.age, score = excluded.score, "
+        "timezone = excluded.timezone, notify_hour = excluded.notify_hour"
+    )
+    DELETE_USER = "DELETE FROM users WHERE user_id = ?"
+    # Columns added after the first release, created on existing databases.
+    ADDED_USER_COLUMNS = (("timezone", "TEXT"), ("notify_hour", "INTEGER"))
+
+    UPSERT_PLAN = (
+        "INSERT INTO plans (user_id, plan) VALUES (?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET plan = excluded.plan"
+    )
+    INSERT_ESSAY = "INSERT INTO essay_topics (user_id, topic, status) VALUES (?, ?, ?)"
+    INSERT_ESSAY_WITH_ID = "INSERT OR REPLACE INTO essay_topics (essay_id, user_id, topic, status) VALUES (?, ?, ?, ?)"
+    SELECT_USER_ESSAYS = (
+        "SELECT essay_id, user_id, topic, status FROM essay_topics "
+        "WHERE user_id = ? AND status = ? ORDER BY essay_id"
+    )
+    UPDATE_ESSAY_STATUS = "UPDATE essay_topics SET status = ? WHERE essay_id = ?"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                existing = {row['name'] for row in conn.execute("PRAGMA table_info(users)")}
+                for column, column_type in self.ADDED_USER_COLUMNS:
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE users ADD COLUMN {column} {column_type}")
+            self._local.conn = conn
+        return conn
+
+    def load_users(self):
+        users = {}
+        for row in self._connect().execute("SELECT * FROM users"):
+            users[row['user_id']] = {
+                'user_id': row['user_id'],
+                'language': row['language'] or '',
+                'english_level': row['english_level'] or '',
+                'name': row['name'] or '',
+                'age': row['age'] or '',
+                'score': row['score'] or 0,
+                'timezone': row['timezone'] or '',
+                'notify_hour': '' if row['notify_hour'] is None else row['notify_hour']
+            }
+        return users
+
+    def save_users(self, users, dirty_ids):
+        conn = self._connect()
+        with conn:
+            for user_id in dirty_ids:
+                row = users.get(user_id)
+                if row is None:
+                    conn.execute(self.DELETE_USER, (user_id,))
+                else:
+                    params = {field: row.get(field, '') for field in USER_FIELDS}
+                    params['user_id'] = user_id
+                    if params['notify_hour'] == '':
+                        params['notify_hour'] = None
+                    conn.execute(self.UPSERT_USER, params)
+
+    def read_plans(self):
+        return {row['user_id']: row['plan'] for row in self._connect().execute("SELECT user_id, plan FROM plans")}
+
+    def write_plan(self, user_id, plan_text):
+        conn = self._connect()
+        with conn:
+            conn.execute(self.UPSERT_PLAN, (user_id, plan_text))
+
+    def write_plans(self, plans):
+        conn = self._connect()
+        with conn:
+            conn.executemany(self.UPSERT_PLAN, plans.items())
+
+    def read_essay_topics(self):
+        rows = self._connect().execute("SELECT essay_id, user_id, topic, status FROM essay_topics ORDER BY essay_id")
+        return [dict(row) for row in rows]
+
+    def write_essay_topics(self, topics):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM essay_topics")
+            conn.executemany(self.INSERT_ESSAY_WITH_ID,
+                             ((t['essay_id'], t['user_id'], t['topic'], t['status']) for t in topics))
+
+    def add_essay_topic(self, user_id, topic, status):
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(self.INSERT_ESSAY, (user_id, topic, status))
+        return {'essay_id': cursor.lastrowid, 'user_id': user_id, 'topic': topic, 'status': status}
+
+    def get_user_essays(self, user_id, status):
+        return [dict(row) for row in self._connect().execute(self.SELECT_USER_ESSAYS, (user_id, status))]
+
+    def update_essay_topic_status(self, essay_id, new_status):
+        conn = self._connect()
+        with conn:
+            conn.execute(self.UPDATE_ESSAY_STATUS, (new_status, essay_id))
+
+
+def import_csv_into_sqlite(source, target):
+    """
+    One-shot migration of every CSV table into an SQLite storage.
+    Existing rows with the same keys are overwritten.
+    """
+    users = source.load_users()
+    target.save_users({int(uid): dict(row, user_id=int(uid)) for uid, row in users.items()}, users.keys())
+    plans = source.read_plans()
+    target.write_plans(plans)
+    topics = source.read_essay_topics()
+    conn = target._connect()
+    with conn:
+        conn.executemany(target.INSERT_ESSAY_WITH_ID,
+                         ((t['essay_id'], t['user_id'], t['topic'], t['status']) for t in topics))
+    logging.info(f"Imported {len(users)} users, {len(plans)} plans and {len(topics)} essay topics into {target.path}")
+    return len(users), len(plans), len(topics)
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "csv":
+        return CsvStorage(USER_DATA_FILE, PLAN_DATA_FILE, PLAN_DATA_JOURNAL_FILE,
+                          ESSAY_TOPICS_FILE, ESSAY_TOPICS_JOURNAL_FILE)
+    if backend == "sqlite":
+        return SqliteStorage(SQLITE_DB_FILE)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+STORAGE = create_storage()
+
+
+if __name__ == "__main__":
+    counts = import_csv_into_sqlite(create_storage("csv"), SqliteStorage(SQLITE_DB_FILE))
+    print("Imported {} users, {} plans, {} essay topics into {}".format(*counts, SQLITE_DB_FILE))
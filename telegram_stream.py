@@ -0,0 +1,130 @@
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from config import STREAM_EDIT_INTERVAL
+from markdown_v2 import MESSAGE_LIMIT, Markup, chunks
+
+STREAM_CURSOR = " ▌"
+
+_EDITORS = ThreadPoolExecutor(4, thread_name_prefix="stream-edit")
+_LAST_EDIT_AT = {}
+_LAST_EDIT_LOCK = threading.Lock()
+
+
+def _claim_edit_slot(chat_id, min_interval):
+    """
+    Returns True and records the time if `chat_id` has not been edited in
+    the last `min_interval` seconds.
+    """
+    now = time.monotonic()
+    with _LAST_EDIT_LOCK:
+        if now - _LAST_EDIT_AT.get(chat_id, 0.0) < min_interval:
+            return False
+        _LAST_EDIT_AT[chat_id] = now
+        return True
+
+
+def _release_edit_slot(chat_id):
+    # Called when a stream finishes, so the map only holds streaming chats.
+    with _LAST_EDIT_LOCK:
+        _LAST_EDIT_AT.pop(chat_id, None)
+
+
+class StreamingMessage:
+    """
+    Shows a streamed LLM answer by editing one placeholder message.
+
+    `feed` may be called for every token from any thread and never blocks: it
+    only records the latest text, and an edit is issued in the background at
+    most once per `min_interval` per chat. The streamed text is escaped in
+    full on every render, so a partial answer is always valid MarkdownV2;
+    while it is longer than one message only the first message is shown.
+    `prefix` is trusted, already-escaped markup shown above the answer, and
+    `transform` can hide parts of the raw answer while it is being written.
+    Edits go through `outbox`, so `message` may be the Future of a
+    placeholder that has not been sent yet.
+    """
+
+    def __init__(self, outbox, chat_id, message, prefix="", transform=None,
+                 min_interval=STREAM_EDIT_INTERVAL):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.message = message
+        self.prefix = prefix
+        self.transform = transform
+        self.min_interval = min_interval
+        self._text = ""
+        self._shown = None
+        self._editing = False
+        self._finished = False
+        self._cond = threading.Condition()
+
+    def feed(self, text):
+        with self._cond:
+            self._text = text
+            if self._editing or self._finished:
+                return
+            if not _claim_edit_slot(self.chat_id, self.min_interval):
+                return
+            self._editing = True
+        _EDITORS.submit(self._edit_latest)
+
+    def _edit_latest(self):
+        try:
+            with self._cond:
+                text = self._text
+            self._edit(self.render(text) + STREAM_CURSOR)
+        finally:
+            with self._cond:
+                self._editing = False
+                self._cond.notify_all()
+
+    def render(self, text):
+        messages = chunks(*self._parts(text), limit=MESSAGE_LIMIT - len(STREAM_CURSOR) - 2)
+        first = next(messages, Markup())
+        return first + " …" if next(messages, None) is not None else first
+
+    def _parts(self, text):
+        if self.transform:
+            text = self.transform(text)
+        return Markup(self.prefix), text
+
+    def finish(self, *parts, reply_markup=None):
+        """
+        Waits for a running edit, then replaces the message with `parts`
+        (Markup and plain text, as for `markdown_v2.render`) or with the full
+        answer. Whatever does not fit continues in new messages, and
+        `reply_markup` goes on the last one.
+        """
+        with self._cond:
+            self._finished = True
+            while self._editing:
+                self._cond.wait()
+        _release_edit_slot(self.chat_id)
+        messages = chunks(*(parts or self._parts(self._text)))
+        message = next(messages, Markup())
+        first = True
+        for following in messages:
+            self._deliver(message, first)
+            message, first = following, False
+        self._deliver(message, first, reply_markup)
+
+    def _deliver(self, text, first, reply_markup=None):
+        if first:
+            self._edit(text, reply_markup)
+        else:
+            self.outbox.send(self.chat_id, text, reply_markup=reply_markup)
+
+    def _edit(self, text, reply_markup=None):
+        if text == self._shown and reply_markup is None:
+            return
+        try:
+            self.outbox.edit(self.chat_id, self.message, text, reply_markup).result()
+            self._shown = text
+        except ApiTelegramException as e:
+            if "message is not modified" not in e.description:
+                logging.error(f"Failed to update streamed message in chat {self.chat_id}: {e}")
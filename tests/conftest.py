@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config.py creates the data files in the working directory on import.
+os.chdir(tempfile.mkdtemp(prefix="lingoml-tests-"))
@@ -0,0 +1,50 @@
+import time
+
+from broadcast import DeliveryLog, TokenBucket
+
+
+def timed_acquires(bucket, count):
+    started = time.monotonic()
+    for _ in range(count):
+        bucket.acquire()
+    return time.monotonic() - started
+
+
+def test_burst_then_rate():
+    bucket = TokenBucket(rate=50, capacity=10)
+    assert timed_acquires(bucket, 10) < 0.05
+    elapsed = timed_acquires(bucket, 25)
+    assert 0.4 < elapsed < 0.8
+
+
+def test_rate_below_one_per_second_still_hands_out_tokens():
+    bucket = TokenBucket(rate=0.5)
+    assert timed_acquires(bucket, 1) < 0.05
+
+
+def test_pause_blocks_acquire():
+    bucket = TokenBucket(rate=1000)
+    bucket.pause(0.3)
+    assert timed_acquires(bucket, 1) >= 0.25
+
+
+def test_set_rate():
+    bucket = TokenBucket(rate=1000)
+    timed_acquires(bucket, 1000)
+    bucket.set_rate(20)
+    elapsed = timed_acquires(bucket, 10)
+    assert 0.3 < elapsed < 0.8
+
+
+def test_delivery_log_round_trip(tmp_path):
+    path = str(tmp_path / "sent.json")
+    log = DeliveryLog(path, save_interval=60)
+    log.mark_sent(7, 1000.0)
+    log.mark_sent(8, 2000.0)
+    log.forget(8)
+    assert log.save()
+    assert not log.save()
+    restored = DeliveryLog(path, save_interval=60)
+    assert restored.since == log.since
+    assert restored.last_sent(7) == 1000.0
+    assert restored.last_sent(8) == 0
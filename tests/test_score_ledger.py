@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from score_ledger import RankedSkipList, ScoreLedger
+
+
+class FakeStore:
+    def __init__(self, users):
+        self.users = {user_id: {'user_id': user_id, 'score': score} for user_id, score in users.items()}
+        self.flushes = 0
+
+    def all(self):
+        return {user_id: dict(user) for user_id, user in self.users.items()}
+
+    def get(self, user_id):
+        user = self.users.get(user_id)
+        return dict(user) if user else None
+
+    def update(self, user_id, **fields):
+        self.users.setdefault(user_id, {'user_id': user_id, 'score': 0}).update(fields)
+
+    def flush(self):
+        self.flushes += 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_skip_list_matches_sorted(seed):
+    rng = random.Random(seed)
+    initial = {(rng.randrange(-50, 0), user_id) for user_id in range(200)}
+    skip_list = RankedSkipList(initial)
+    expected = sorted(initial)
+    for _ in range(2000):
+        if expected and rng.random() < 0.45:
+            key = expected.pop(rng.randrange(len(expected)))
+            skip_list.remove(key)
+        else:
+            key = (rng.randrange(-50, 0), rng.randrange(10 ** 6))
+            if key in expected:
+                continue
+            skip_list.insert(key)
+            expected.append(key)
+            expected.sort()
+        assert len(skip_list) == len(expected)
+        probe = (rng.randrange(-51, 1), rng.randrange(10 ** 6))
+        assert skip_list.count_below(probe) == sum(1 for k in expected if k < probe)
+        start = rng.randrange(len(expected) + 2)
+        count = rng.randrange(12)
+        assert skip_list.slice(start, count) == expected[start:start + count]
+    assert skip_list.slice(0, len(expected)) == expected
+
+
+def test_skip_list_remove_missing_key():
+    skip_list = RankedSkipList([(-1, 1)])
+    with pytest.raises(KeyError):
+        skip_list.remove((-2, 1))
+
+
+def test_ledger_ranks_top_and_ties(tmp_path):
+    ledger = ScoreLedger(FakeStore({1: 0, 2: 0, 3: 0, 4: 0}), str(tmp_path / "ledger.csv"), compact_every=1000)
+    ledger.add(1, 10)
+    ledger.add(2, 30)
+    ledger.add(3, 10)
+    assert ledger.top(3) == [(2, 30), (1, 10), (3, 10)]
+    assert ledger.rank(2) == (1, 3)
+    assert ledger.rank(1) == (2, 3)
+    assert ledger.rank(3) == (2, 3)
+    assert ledger.rank(4) is None
+    assert ledger.add(3, -50) == 0
+    assert ledger.rank(3) is None
+    assert ledger.top(10) == [(2, 30), (1, 10)]
+
+
+def test_ledger_replays_and_compacts(tmp_path):
+    path = str(tmp_path / "ledger.csv")
+    store = FakeStore({1: 5, 2: 0})
+    ledger = ScoreLedger(store, path, compact_every=1000)
+    ledger.add(1, 10)
+    ledger.add(2, 7)
+    # A fresh process replays the ledger over the users' scores.
+    ledger = ScoreLedger(store, path, compact_every=1000)
+    assert ledger.score(1) == 15
+    assert ledger.score(2) == 7
+    ledger.compact()
+    assert store.users[1]['score'] == 15
+    assert store.users[2]['score'] == 7
+    assert ScoreLedger(store, path, compact_every=1000).top(2) == [(1, 15), (2, 7)]
+
+
+def test_ledger_compact_loads_first(tmp_path):
+    path = str(tmp_path / "ledger.csv")
+    store = FakeStore({1: 0})
+    ScoreLedger(store, path, compact_every=1000).add(1, 4)
+    ScoreLedger(store, path, compact_every=1000).compact()
+    assert store.users[1]['score'] == 4
@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+
+from webhook import ChatOrderedQueue
+
+
+def test_items_of_a_key_come_out_in_order_one_at_a_time():
+    queue = ChatOrderedQueue(max_pending=10000)
+    keys = range(20)
+    for index in range(1000):
+        assert queue.put(random.choice(keys), index)
+    seen = {}
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            entry = queue.get()
+            if entry is None:
+                return
+            key, item = entry
+            with lock:
+                if key in active:
+                    overlaps.append(key)
+                active.add(key)
+                seen.setdefault(key, []).append(item)
+            time.sleep(0.0005)
+            with lock:
+                active.discard(key)
+            queue.done(key)
+
+    workers = [threading.Thread(target=work) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    while len(queue):
+        time.sleep(0.01)
+    queue.close()
+    for worker in workers:
+        worker.join(10)
+    assert not overlaps
+    assert sum(len(items) for items in seen.values()) == 1000
+    for items in seen.values():
+        assert items == sorted(items)
+
+
+def test_keys_are_served_round_robin():
+    queue = ChatOrderedQueue(max_pending=100)
+    for item in range(3):
+        queue.put("busy", item)
+    queue.put("quiet", 0)
+    order = []
+    for _ in range(4):
+        key, item = queue.get()
+        order.append((key, item))
+        queue.done(key)
+    assert order[:2] == [("busy", 0), ("quiet", 0)]
+
+
+def test_next_item_waits_for_done():
+    queue = ChatOrderedQueue(max_pending=100)
+    queue.put("chat", 1)
+    queue.put("chat", 2)
+    assert queue.get() == ("chat", 1)
+    queue.close()
+    # Closed with "chat" still busy: nothing else can be handed out.
+    assert queue.get() is None
+    queue.done("chat")
+    assert queue.get() == ("chat", 2)
+
+
+def test_full_or_closed_queue_rejects():
+    queue = ChatOrderedQueue(max_pending=2)
+    assert queue.put(1, "a")
+    assert queue.put(2, "b")
+    assert not queue.put(3, "c")
+    assert len(queue) == 2
+    queue.close()
+    queue.get()
+    assert not queue.put(4, "d")
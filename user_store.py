@@ -0,0 +1,122 @@
+import atexit
+import threading
+import logging
+from config import USER_FLUSH_INTERVAL
+from metrics import STORAGE_SECONDS, STORAGE_ERRORS
+from storage import STORAGE
+
+
+class UserStore:
+    """
+    Resident index of users keyed by user_id.
+
+    Users are loaded from the storage backend once on first access; after that
+    the in-memory dict is authoritative. Mutations only mark the user dirty,
+    and a background thread persists at most once per flush interval, so any
+    number of updates made in between are coalesced into a single write.
+    """
+
+    def __init__(self, backend, flush_interval):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._users = None
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._flusher = None
+
+    def _load(self):
+        with STORAGE_SECONDS.time("load_users"):
+            users = self.backend.load_users()
+        logging.info(f"Loaded {len(users)} users from {self.backend.__class__.__name__}")
+        return users
+
+    def _ensure_loaded(self):
+        if self._users is None:
+            with self._lock:
+                if self._users is None:
+                    self._users = self._load()
+                    self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="user-store-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush user data: {e}")
+
+    def get(self, user_id):
+        self._ensure_loaded()
+        user = self._users.get(user_id)
+        return dict(user) if user else None
+
+    def all(self):
+        """
+        Returns a shallow copy of every user record, safe to iterate while
+        other threads keep updating the store.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return {uid: dict(row) for uid, row in self._users.items()}
+
+    def update(self, user_id, **fields):
+        self._ensure_loaded()
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                user = {'user_id': user_id, 'language': 'English', 'english_level': '',
+                        'name': '', 'age': '', 'score': 0, 'timezone': '', 'notify_hour': ''}
+                self._users[user_id] = user
+            for key, value in fields.items():
+                if value is not None:
+                    user[key] = value
+            self._dirty.add(user_id)
+            return dict(user)
+
+    def delete(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            removed = self._users.pop(user_id, None)
+            if removed is not None:
+                self._dirty.add(user_id)
+            return removed is not None
+
+    def flush(self):
+        """
+        Persists the users changed since the last flush, if any.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._users is None or not self._dirty:
+                    return False
+                users = {uid: dict(row) for uid, row in self._users.items()}
+                dirty = self._dirty
+                self._dirty = set()
+            try:
+                with STORAGE_SECONDS.time("save_users"):
+                    self.backend.save_users(users, dirty)
+            except Exception:
+                STORAGE_ERRORS.inc("save_users")
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+        logging.debug(f"Flushed {len(dirty)} changed users ({len(users)} total)")
+        return True
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+
+USER_STORE = UserStore(STORAGE, USER_FLUSH_INTERVAL)
+atexit.register(USER_STORE.close)
@@ -0,0 +1,237 @@
+import hmac
+import json
+import threading
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot.types import Update
+
+from config import (
+    WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_WORKERS, WEBHOOK_MAX_PENDING
+)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_UPDATE_BYTES = 1024 * 1024
+
+
+def update_chat_id(update):
+    """
+    The chat an update belongs to, used to keep each chat's updates in
+    order. Falls back to the sender for updates without a chat.
+    """
+    for kind in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if kind in update:
+            return update[kind]['chat']['id']
+    callback = update.get('callback_query')
+    if callback:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return None
+
+
+class ChatOrderedQueue:
+    """
+    Bounded queue of (key, item) pairs for a pool of workers.
+
+    Items with the same key come out in the order they were put and are never
+    handed to two workers at once: a worker takes the next item of a key only
+    after calling `done(key)` for the previous one. Keys are served
+    round-robin, so one busy chat does not hold back the others.
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self._lanes = {}
+        self._ready = deque()
+        self._busy = set()
+        self._pending = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, key, item):
+        """
+        Returns False without queuing the item if the queue is full.
+        """
+        with self._cond:
+            if self._closed or self._pending >= self.max_pending:
+                return False
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = deque()
+            if not lane and key not in self._busy:
+                self._ready.append(key)
+                self._cond.notify()
+            lane.append(item)
+            self._pending += 1
+            return True
+
+    def get(self):
+        """
+        Blocks until an item is available and returns (key, item), or None
+        once the queue is closed and drained.
+        """
+        with self._cond:
+            while not self._ready:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            key = self._ready.popleft()
+            item = self._lanes[key].popleft()
+            self._busy.add(key)
+            self._pending -= 1
+            return key, item
+
+    def done(self, key):
+        with self._cond:
+            self._busy.discard(key)
+            if self._lanes[key]:
+                self._ready.append(key)
+                self._cond.notify()
+            else:
+                del self._lanes[key]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return self._pending
+
+
+class UpdateWorkers:
+    """
+    Runs the bot's handlers for queued updates on `workers` threads, each
+    chat's updates one at a time and in order. At most `max_pending`
+    updates wait; `put` returns False beyond that.
+    """
+
+    def __init__(self, bot_instance, workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_MAX_PENDING):
+        self.bot = bot_instance
+        self.workers = workers
+        self.queue = ChatOrderedQueue(max_pending)
+        self._threads = []
+
+    def put(self, update):
+        return self.queue.put(update_chat_id(update), update)
+
+    def _work(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            key, update = entry
+            try:
+                self.bot.process_new_updates([Update.de_json(update)])
+            except Exception:
+                logging.exception(f"Failed to process update {update.get('update_id')} for chat {key}")
+            finally:
+                self.queue.done(key)
+
+    def start(self):
+        # Handlers must run on our workers, in order, not on telebot's pool.
+        self.bot.threaded = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"update-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Waits for the queued updates to be handled.
+        """
+        self.queue.close()
+        for thread in self._threads:
+            thread.join()
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class WebhookServer:
+    """
+    Receives updates that Telegram posts to `path` and feeds them to the bot.
+
+    A request is answered as soon as its update is queued, so Telegram never
+    waits on a handler. Requests without the secret token are rejected with
+    403; when the queue is full the answer is 503 and Telegram delivers the
+    update again later. Updates go to UpdateWorkers running the handlers in
+    this process, or to `sink` (anything with put/start/stop/len, e.g. a
+    sharding.ShardDispatcher) instead.
+    """
+
+    def __init__(self, bot_instance, host=WEBHOOK_LISTEN_HOST, port=WEBHOOK_LISTEN_PORT, path=WEBHOOK_PATH,
+                 secret_token=WEBHOOK_SECRET_TOKEN, workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_MAX_PENDING,
+                 sink=None):
+        self.path = path
+        self.secret_token = secret_token
+        self.queue = sink if sink is not None else UpdateWorkers(bot_instance, workers, max_pending)
+        self.received = 0
+        self.rejected = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = server.accept(self.path, self.headers, self.rfile)
+                self.send_response(status)
+                if status == 503:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+        return Handler
+
+    def accept(self, path, headers, body):
+        """
+        Validates and queues one posted update; returns the HTTP status.
+        """
+        if path != self.path:
+            return 404
+        token = headers.get(SECRET_TOKEN_HEADER, "")
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token):
+            logging.warning("Rejected webhook request with a wrong secret token")
+            return 403
+        length = int(headers.get("Content-Length") or 0)
+        if length > MAX_UPDATE_BYTES:
+            return 413
+        try:
+            update = json.loads(body.read(length))
+            update_chat_id(update)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"Rejected malformed webhook update: {e}")
+            return 400
+        if not self.queue.put(update):
+            self.rejected += 1
+            logging.warning(f"Webhook queue full ({len(self.queue)} pending), asking Telegram to retry")
+            return 503
+        self.received += 1
+        return 200
+
+    def start(self):
+        self.queue.start()
+        threading.Thread(target=self._httpd.serve_forever, name="webhook-http", daemon=True).start()
+        logging.info(f"Webhook server listening on {self.address[0]}:{self.address[1]}{self.path}")
+
+    def stop(self):
+        """
+        Stops accepting updates, then waits for the queued ones to be handled.
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.queue.stop()